@@ -56,12 +56,19 @@ Class names starts with a capital letter, functions with a lowercase letter:
          ├── genbank
          │         ├── genbank
          │         └── Genbank
+         ├── offtarget
+         │           └── OfftargetIndex
          ├── parsers
          │         ├── parse
          │         └── parse_primers
-         └── readers
-                   ├── read
-                   └── read_primers
+         ├── readers
+         │         ├── read
+         │         └── read_primers
+         ├── restriction
+         │             ├── restriction_map
+         │             └── search
+         └── sequencestore
+                          └── SequenceStore
 
 
 
@@ -160,6 +167,10 @@ else: # otherwise it is created with default settings
                             'data_dir': _appdirs.user_data_dir("pydna"),
                             'log_dir' : _appdirs.user_log_dir("pydna"),
                             'cached_funcs':'pydna.genbank.genbank.nucleotide',
+                            'cache_backend':'sqlite',
+                            'cache_size':'1GB',
+                            'cache_memory_entries':'128',
+                            'cache_memory_size':'64MB',
                             'ape'     : 'put/path/to/ape/here',
                             'primers' : 'put/path/to/primers/here',
                             'enzymes' : 'put/path/to/enzymes/here'}
@@ -169,6 +180,10 @@ else: # otherwise it is created with default settings
 _mainsection = _parser["main"]
 _os.environ["pydna_ape"]      = _os.getenv("pydna_ape",      _mainsection.get("ape",'put/path/to/ape/here'))
 _os.environ["pydna_cached_funcs"] = _os.getenv("pydna_cached_funcs", _mainsection.get("cached_funcs", 'none'))
+_os.environ["pydna_cache_backend"] = _os.getenv("pydna_cache_backend", _mainsection.get("cache_backend", 'sqlite'))
+_os.environ["pydna_cache_size"] = _os.getenv("pydna_cache_size", _mainsection.get("cache_size", '1GB'))
+_os.environ["pydna_cache_memory_entries"] = _os.getenv("pydna_cache_memory_entries", _mainsection.get("cache_memory_entries", '128'))
+_os.environ["pydna_cache_memory_size"] = _os.getenv("pydna_cache_memory_size", _mainsection.get("cache_memory_size", '64MB'))
 
 _os.environ["pydna_data_dir"] = _os.getenv("pydna_data_dir", _mainsection.get("data_dir",_appdirs.user_data_dir("pydna")))
 _os.environ["pydna_email"]    = _os.getenv("pydna_email",    _mainsection.get("email","someone@example.com"))
@@ -192,6 +207,10 @@ _logger.addHandler(_hdlr)
 _logger.info(_logmsg)
 _logger.info('Environmental variable pydna_ape          = %s', _os.environ["pydna_ape"] )
 _logger.info('Environmental variable pydna_cached_funcs = %s', _os.environ["pydna_cached_funcs"] )
+_logger.info('Environmental variable pydna_cache_backend= %s', _os.environ["pydna_cache_backend"] )
+_logger.info('Environmental variable pydna_cache_size   = %s', _os.environ["pydna_cache_size"] )
+_logger.info('Environmental variable pydna_cache_memory_entries = %s', _os.environ["pydna_cache_memory_entries"] )
+_logger.info('Environmental variable pydna_cache_memory_size    = %s', _os.environ["pydna_cache_memory_size"] )
 _logger.info('Environmental variable pydna_data_dir     = %s', _os.environ["pydna_data_dir"] )
 _logger.info('Environmental variable pydna_email        = %s', _os.environ["pydna_email"] )
 _logger.info('Environmental variable pydna_log_dir      = %s', _os.environ["pydna_log_dir"] )
@@ -258,6 +277,17 @@ class _PydnaDeprecationWarning(_PydnaWarning):
     pass
 
 
+from pydna.cache import cache_info, cache_clear
+
+
+def restriction_map(records, enzymes, n_jobs=None, executor=None):
+    """Returns the cut positions of all enzymes in all records, see
+    :func:`pydna.restriction.restriction_map`. Biopython's restriction
+    module is imported on the first call."""
+    from pydna.restriction import restriction_map as _restriction_map
+    return _restriction_map(records, enzymes, n_jobs=n_jobs, executor=executor)
+
+
 def open_current_folder():
     """ Calling this function opens the current working directory
     in the default file manager. The location for this folder is 
@@ -294,7 +324,11 @@ def open_config_folder():
         data_dir=/home/bjorn/.local/share/pydna
         log_dir=/home/bjorn/.cache/pydna/log
         ape=tclsh /home/bjorn/.ApE/apeextractor/ApE.vfs/lib/app-AppMain/AppMain.tcl
-        cached_funcs=Genbank_nucleotide
+        cached_funcs=pydna.genbank.Genbank.nucleotide:604800,pydna.amplify.Anneal
+        cache_backend=sqlite
+        cache_size=1GB
+        cache_memory_entries=128
+        cache_memory_size=64MB
         primers=/home/bjorn/Dropbox/wikidata/PRIMERS.txt
         enzymes=/home/bjorn/Dropbox/wikidata/RestrictionEnzymes.txt
 
@@ -305,14 +339,23 @@ def open_config_folder():
 
     Pydna can cache results from the following functions or methods:
 
-    - :func:`pydna.genbank.Genbank.nucleotide`   Genbank_nucleotide 
-    - :func:`pydna.amplify.Anneal`               amplify_Anneal
-    - :func:`pydna.assembly.Assembly`            assembly_Assembly
-    - :func:`pydna.download.download_text`       download.download_text
-    - :func:`pydna.dseqrecord.Dseqrecord.synced` Dseqrecord_synced
+    - :func:`pydna.genbank.Genbank.nucleotide`   pydna.genbank.Genbank.nucleotide
+    - :func:`pydna.amplify.Anneal`               pydna.amplify.Anneal
+    - :func:`pydna.assembly.Assembly`            pydna.assembly.Assembly
+    - :func:`pydna.download.download_text`       pydna.download.download_text
+    - :func:`pydna.dseqrecord.Dseqrecord.synced` pydna.dseqrecord.Dseqrecord.synced
+    - :func:`pydna.parsers.parse_many`           pydna.parsers.parse_many
    
     These can be added separated by a comma to the cached_funcs entry in **pydna.ini**
-    file or the pydna_cached_funcs environment variable.
+    file or the pydna_cached_funcs environment variable. A time to live in seconds 
+    can be added after a colon.
+
+    Cached results are stored in a SQLite database in the *pydna_data_dir* folder. 
+    The least recently used results are removed when the database grows larger than
+    cache_size. Set cache_backend to shelve to use one shelve file per function 
+    as in earlier versions. The most recently used results are also kept in memory,
+    limited by cache_memory_entries and cache_memory_size. See :mod:`pydna.cache`, :func:`pydna.cache_info` and 
+    :func:`pydna.cache_clear`.
 
     """
     return _open_folder( _os.environ["pydna_config_dir"] )
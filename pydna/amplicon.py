@@ -24,6 +24,7 @@ from pydna.utils                         import rc             as _rc
 from pydna.dseqrecord                    import Dseqrecord     as _Dseqrecord
 from pydna._pretty                       import pretty_str     as _pretty_str
 from pydna.tm                            import tmbresluc      as _tmbresluc
+from pydna.cache                         import digest         as _digest
 
 
 class Amplicon(_Dseqrecord):
@@ -86,6 +87,16 @@ class Amplicon(_Dseqrecord):
         answer.features = _SeqRecord.__getitem__(sr, sl).features
         return answer
 
+    def __pydna_cache_key__(self):
+        '''Returns the key used by :func:`pydna.utils.memorize` for this amplicon.'''
+        return _digest(super().__pydna_cache_key__(),
+                       self.template,
+                       self.forward_primer,
+                       self.reverse_primer,
+                       self.fprimerc,
+                       self.rprimerc,
+                       self.saltc)
+
     def __repr__(self):
         '''returns a short string representation of the object'''
         return "Amplicon({})".format(self.__len__())
@@ -13,6 +13,7 @@ if more flexibility is required.
 Primers with 5' tails as well as inverse PCR on circular templates are handled correctly.'''
 
 from collections import defaultdict
+import collections as _collections
 import itertools as _itertools
 import re        as _re
 import copy      as _copy
@@ -21,6 +22,11 @@ import os        as _os
 import logging   as _logging
 _module_logger = _logging.getLogger("pydna."+__name__)
 
+try:
+    import numpy as _np
+except ImportError:
+    _np = None
+
 from Bio.Seq                        import Seq               as _Seq
 from Bio.SeqFeature                 import CompoundLocation  as _CompoundLocation
 from Bio.SeqFeature                 import FeatureLocation   as _FeatureLocation
@@ -28,6 +34,7 @@ from pydna.seqfeature               import SeqFeature        as _SeqFeature
 from Bio.Alphabet.IUPAC             import IUPACAmbiguousDNA as _IUPACAmbiguousDNA
 
 from pydna.dseqrecord                    import Dseqrecord       as _Dseqrecord
+from pydna.dseq                          import Dseq             as _Dseq
 from pydna.seqrecord                     import SeqRecord        as _SeqRecord
 from pydna.primer                        import Primer           as _Primer
 from pydna.amplicon                      import Amplicon         as _Amplicon
@@ -100,18 +107,278 @@ def _annealing_positions(primer, template, limit=15):
 
     positions = [m.start() for m in _re.finditer('(?={})'.format(head), template, _re.I)]
 
-    if positions:
-        tail = prc[limit:]
-        length = len(tail)
-        results = []
-        for match_start in positions:
-            tm = template[match_start+limit:match_start+limit+length]
-            #footprint = _rc(template[match_start:match_start+limit]+"".join([b for a,b in _itertools.takewhile(lambda x: x[0].lower()==x[1].lower(), list(zip(tail, tm)))]))
-            footprint = len(list(_itertools.takewhile(lambda x: x[0].lower()==x[1].lower(), zip(tail, tm))))
-            results.append((match_start, footprint+limit))
+    return _footprints(prc[limit:], template, positions, limit)
+
+
+def _footprints(tail, template, positions, limit):
+    # extends each annealing position with the part of tail that anneals perfectly
+    length = len(tail)
+    results = []
+    for match_start in positions:
+        tm = template[match_start+limit:match_start+limit+length]
+        #footprint = _rc(template[match_start:match_start+limit]+"".join([b for a,b in _itertools.takewhile(lambda x: x[0].lower()==x[1].lower(), list(zip(tail, tm)))]))
+        footprint = len(list(_itertools.takewhile(lambda x: x[0].lower()==x[1].lower(), zip(tail, tm))))
+        results.append((match_start, footprint+limit))
+    return results
+
+
+_iupac = {"A":"A",
+          "C":"C",
+          "G":"G",
+          "T":"T",
+          "R":"AG",
+          "Y":"CT",
+          "S":"GC",
+          "W":"AT",
+          "K":"GT",
+          "M":"AC",
+          "B":"CGT",
+          "D":"AGT",
+          "H":"ACT",
+          "V":"ACG",
+          "N":"AGCT"}
+
+_max_variants = 1024
+
+
+def _kmer_index(template, k):
+    '''Returns two numpy arrays (codes, positions) for all k-mers of template
+    (k <= 32) that only contain A, C, G or T. Each k-mer is coded with two bits
+    per nucleotide, so that codes can be searched with numpy.searchsorted.'''
+    lut = _np.full(256, 4, dtype=_np.uint8)
+    for i, c in enumerate("ACGT"):
+        lut[ord(c)] = lut[ord(c.lower())] = i
+    seq = lut[_np.frombuffer(template.encode("ascii", "replace"), dtype=_np.uint8)]
+    m = len(seq)-k+1
+    if m <= 0:
+        return _np.zeros(0, dtype=_np.uint64), _np.zeros(0, dtype=_np.int64)
+    bad = _np.concatenate(([0], _np.cumsum(seq==4)))
+    positions = _np.flatnonzero(bad[k:k+m] == bad[:m])
+    bases = (seq & 3).astype(_np.uint64)
+    two = _np.uint64(2)
+    codes = _np.zeros(m, dtype=_np.uint64)
+    for j in range(k):
+        _np.left_shift(codes, two, out=codes)
+        _np.bitwise_or(codes, bases[j:j+m], out=codes)
+    codes = codes[positions]
+    order = _np.argsort(codes, kind="mergesort")
+    return codes[order], positions[order]
+
+
+def _head_codes(head):
+    # two bit codes for all unambiguous sequences matching head, or None
+    variants = 1
+    for c in head:
+        if c not in _iupac:
+            return None
+        variants *= len(_iupac[c])
+        if variants > _max_variants:
+            return None
+    codes = [0]
+    for c in head:
+        codes = [(code<<2)|"ACGT".index(b) for code in codes for b in _iupac[c]]
+    return codes
+
+
+def _annealing_positions_many(primers, template, limit=15, index=None):
+    '''Returns a list with the result of :func:`_annealing_positions` for
+    each primer in primers, in the same order.
+
+    If numpy is available, the primers are searched at the same time in
+    a k-mer index of the template (see :func:`_kmer_index`). Ambiguous
+    nucleotides in the primers are expanded to all unambiguous sequences.
+    Primers with many ambiguous nucleotides are searched for one by one
+    with a regular expression.
+
+    index can be given as the (codes, positions) tuple returned by
+    _kmer_index(template, limit), so that it is not made again.'''
+    if _np is None or limit > 32 or (index is None and len(primers) < 4):
+        # a regular expression is faster for a few primers
+        return [_annealing_positions(primer, template, limit) for primer in primers]
+    results = [None]*len(primers)
+    queries = []
+    owners  = []
+    for i, primer in enumerate(primers):
+        if len(primer) < limit:
+            results[i] = []
+            continue
+        codes = _head_codes(_rc(primer)[:limit].upper())
+        if codes is None:
+            results[i] = _annealing_positions(primer, template, limit)
+        else:
+            queries.extend(codes)
+            owners.extend([i]*len(codes))
+    if not queries:
         return results
-    return []
+    if index is None:
+        index = _kmer_index(template, limit)
+    kmers, kmerpositions = index
+    queries = _np.array(queries, dtype=_np.uint64)
+    left  = _np.searchsorted(kmers, queries, side="left")
+    right = _np.searchsorted(kmers, queries, side="right")
+    hits = _collections.defaultdict(list)
+    for owner, l, r in zip(owners, left.tolist(), right.tolist()):
+        if r > l:
+            hits[owner].extend(kmerpositions[l:r].tolist())
+    for i, primer in enumerate(primers):
+        if results[i] is None:
+            results[i] = _footprints(_rc(primer)[limit:], template, sorted(hits.get(i, [])), limit)
+    return results
+
+def _base_masks(template):
+    # one int for each nucleotide with bit i set where template[i] is that nucleotide
+    data = template.upper().encode("ascii", "replace")[::-1]
+    masks = {}
+    for c in "ACGT":
+        table = bytearray(b"0"*256)
+        table[ord(c)] = ord("1")
+        masks[c] = int(data.translate(bytes(table)) or b"0", 2)
+    return masks
+
+
+def _annealing_positions_mismatched(primers, template, limit=15, max_mismatches=1):
+    '''Returns a list of the annealing positions of each primer in primers
+    on the template, allowing up to max_mismatches mismatches in the limit
+    nucleotides at the 3' end of the primer.
+
+    Each position is a (start, footprint, mismatches, three_prime_mismatch)
+    tuple. start and footprint are as for :func:`_annealing_positions`;
+    mismatches is the number of mismatches and three_prime_mismatch the
+    distance from the 3' end of the primer to the closest mismatch (0 for
+    the last nucleotide) or None.
+
+    The search is bit parallel over the template. Each nucleotide of the
+    template is an int with a bit set at each position where it is found.
+    For each nucleotide of the primer, the positions where it does not
+    match are added to max_mismatches+1 saturating bit counters, so a
+    primer is compared to all positions with about limit*(max_mismatches+1)
+    operations on ints as long as the template.'''
+    n = len(template) - limit + 1
+    if n <= 0:
+        return [[] for primer in primers]
+    masks = _base_masks(template)
+    full = (1 << n) - 1
+    results = []
+    for primer in primers:
+        if len(primer) < limit:
+            results.append([])
+            continue
+        prc = _rc(primer)
+        head = prc[:limit].upper()
+        # counters[m] has a bit set at each position with more than m mismatches
+        counters = [0]*(max_mismatches+1)
+        for j, c in enumerate(head):
+            match = 0
+            for b in _iupac.get(c, ""):
+                match |= masks[b]
+            mismatch = ~(match >> j) & full
+            for m in range(max_mismatches, 0, -1):
+                counters[m] |= counters[m-1] & mismatch
+            counters[0] |= mismatch
+        hits = full & ~counters[max_mismatches]
+        positions = []
+        while hits:
+            low = hits & -hits
+            positions.append(low.bit_length()-1)
+            hits ^= low
+        sites = []
+        for (start, footprint) in _footprints(prc[limit:], template, positions, limit):
+            window = template[start:start+limit].upper()
+            wrong = [j for j, c in enumerate(head) if window[j] not in _iupac.get(c, "")]
+            sites.append((start, footprint, len(wrong), wrong[0] if wrong else None))
+        results.append(sites)
+    return results
     
+def annealing_sites(primers, template, limit=13, index=None, max_mismatches=0):
+    '''Finds where each primer in primers anneals on the template.
+
+    All primers are searched for at the same time, which is much faster
+    than one at a time for large numbers of primers, like a whole primer
+    list. This function is used by the :class:`Anneal` class.
+
+    Parameters
+    ----------
+    primers : iterable of str, Seq, SeqRecord or Primer objects
+        Primer sequences 5'-3'.
+
+    template : Dseqrecord or Dseq
+        The template sequence 5'-3'.
+
+    limit : int, optional
+        limit length of the annealing part of the primers.
+
+    index : TemplateIndex, optional
+        A :class:`pydna.templateindex.TemplateIndex` of the template made
+        with the same limit. It is made on the fly if not given. It is not
+        used if max_mismatches is given.
+
+    max_mismatches : int, optional
+        Largest number of mismatches in the limit nucleotides at the 3' end
+        of the primers.
+
+    Returns
+    -------
+    sites : list of tuples
+        One tuple (forward, reverse) for each primer. forward and reverse are
+        lists of (position, footprint) tuples for the primer annealing on the
+        crick and watson strands, respectively. The positions are the same as
+        the position attributes of the forward_primers and reverse_primers in
+        an :class:`Anneal` object. If max_mismatches is given, the tuples are
+        (position, footprint, mismatches, three_prime_mismatch), see
+        :func:`_annealing_positions_mismatched`.
+
+    Examples
+    --------
+    >>> from pydna.dseqrecord import Dseqrecord
+    >>> from pydna.amplify import annealing_sites
+    >>> template = Dseqrecord("tacactcaccgtctatcattatctactatcgactgtatcatctgatagcac")
+    >>> annealing_sites(["tacactcaccgtctatcattatc", "gtgctatcagatgatacagtcg", "aaaaaaaaaaaaaaa"], template)
+    [([(23, 23)], []), ([], [(29, 22)]), ([], [])]
+    >>> annealing_sites(["tacactcaccgtctatcatgatc"], template, max_mismatches=1)
+    [([(23, 23, 1, 3)], [])]
+    '''
+    seq = getattr(template, "seq", template)
+    twl = len(seq.watson)
+    tcl = len(seq.crick)
+
+    if seq.linear:
+        tw = seq.watson
+        tc = seq.crick
+    else:
+        tw = seq.watson+seq.watson
+        tc = seq.crick +seq.crick
+
+    primers = [str(getattr(p, "seq", p)) for p in primers]
+    if max_mismatches:
+        forward = _annealing_positions_mismatched(primers, tc, limit, max_mismatches)
+        reverse = _annealing_positions_mismatched(primers, tw, limit, max_mismatches)
+    elif index is None:
+        forward = _annealing_positions_many(primers, tc, limit)
+        reverse = _annealing_positions_many(primers, tw, limit)
+    else:
+        forward = _annealing_positions_many(primers, tc, limit, index=index.crick_index)
+        reverse = _annealing_positions_many(primers, tw, limit, index=index.watson_index)
+
+    return [([(tcl - site[0] - min(seq.ovhg, 0),) + site[1:] for site in fw if site[0]<tcl],
+             [(site[0] + max(0, seq.ovhg),) + site[1:] for site in rv if site[0]<twl]) for fw, rv in zip(forward, reverse)]
+
+
+def _mismatch_note(primer):
+    # describes the mismatches of an annealed primer for Anneal.report
+    if not getattr(primer, "mismatches", 0):
+        return ""
+    return " ({} mismatch{}, closest {} nt from the 3' end)".format(primer.mismatches,
+                                                                  "es" if primer.mismatches > 1 else "",
+                                                                  primer.three_prime_mismatch)
+
+
+def _site_primer(primer, site):
+    # a Primer for a site returned by annealing_sites
+    result = _Primer(primer, position = site[0], footprint = site[1])
+    result.mismatches, result.three_prime_mismatch = site[2:] or (0, None)
+    return result
+
+
 class _Memoize(type):
     @_memorize("pydna.amplify.Anneal")
     def __call__(cls, *args, **kwargs):
@@ -141,6 +408,7 @@ class Anneal(object, metaclass = _Memoize):
                   limit=13,
                   primerc=1000.0, # nM
                   saltc=50,       # mM
+                  max_mismatches=0,
                   **kwargs):      
         '''The Anneal class has to be initiated with at least an iterable of primers and a template.
 
@@ -151,8 +419,10 @@ class Anneal(object, metaclass = _Memoize):
         primers : iterable of :class:`Primer` or Biopython SeqRecord like objects
             Primer sequences 5'-3'.
 
-        template : Dseqrecord
-            The template sequence 5'-3'.
+        template : Dseqrecord or TemplateIndex
+            The template sequence 5'-3'. A :class:`pydna.templateindex.TemplateIndex`
+            made with the same limit can be given instead of the template
+            to avoid searching the template again.
 
         limit : int, optional
             limit length of the annealing part of the primers.
@@ -166,6 +436,16 @@ class Anneal(object, metaclass = _Memoize):
         saltc  : float, optional
             Salt concentration (monovalet cations) :mod:`tmbresluc` set to 50.0 mM by default
 
+        max_mismatches : int, optional
+            Largest number of mismatches allowed in the limit nucleotides at
+            the 3' end of the primers, 0 by default. The annealed primers get
+            a mismatches attribute with the number of mismatches and a
+            three_prime_mismatch attribute with the distance from the 3' end
+            of the primer to the closest mismatch (0 for the 3' nucleotide),
+            or None if there are no mismatches. The PCR products have the
+            sequences of the primers at both ends, including the mismatched
+            nucleotides.
+
         Attributes
         ----------
         products: list
@@ -226,12 +506,19 @@ class Anneal(object, metaclass = _Memoize):
         >>>
 
         '''
+        index = None
+        if hasattr(template, "watson_index"): # template is a TemplateIndex
+            index, template = template, template.template
+            if index.limit != limit:
+                raise ValueError("TemplateIndex made with limit {}, not {}".format(index.limit, limit))
+
         self.primers=primers
         self.primerc=primerc
         self.saltc = saltc
         self.template = _copy.deepcopy(template)
 
         self.limit = limit
+        self.max_mismatches = max_mismatches
         self.kwargs=defaultdict(str, kwargs)
 
         self._products = None
@@ -239,29 +526,11 @@ class Anneal(object, metaclass = _Memoize):
         self.forward_primers = []
         self.reverse_primers = []
 
-        twl = len(self.template.seq.watson)
-        tcl = len(self.template.seq.crick)
+        primers = list(self.primers)
 
-        if self.template.linear:
-            tw = self.template.seq.watson
-            tc = self.template.seq.crick
-        else:
-            tw = self.template.seq.watson+self.template.seq.watson
-            tc = self.template.seq.crick +self.template.seq.crick
-
-        for p in self.primers:
-            self.forward_primers.extend((_Primer(p,
-                                                 position  = tcl-pos - min(self.template.seq.ovhg, 0),
-                                                 footprint = fp)
-                                         for pos, fp in _annealing_positions( str(p.seq),
-                                                                              tc,
-                                                                              self.limit) if pos<tcl))
-            self.reverse_primers.extend((_Primer(p,
-                                                 position  = pos + max(0, self.template.seq.ovhg),
-                                                 footprint = fp)
-                                         for pos, fp in _annealing_positions(str(p.seq),
-                                                                             tw,
-                                                                             self.limit) if pos<twl))
+        for p, (fw, rv) in zip(primers, annealing_sites(primers, self.template, self.limit, index, max_mismatches)):
+            self.forward_primers.extend(_site_primer(p, site) for site in fw)
+            self.reverse_primers.extend(_site_primer(p, site) for site in rv)
 
         self.forward_primers.sort(key = _operator.attrgetter('position'))
         self.reverse_primers.sort(key = _operator.attrgetter('position'), reverse=True)
@@ -335,6 +604,14 @@ class Anneal(object, metaclass = _Memoize):
 
                 prd = ( _Dseqrecord(fp.tail) + tmpl + _Dseqrecord(rp.tail).reverse_complement() )
 
+                if getattr(fp, "mismatches", 0) or getattr(rp, "mismatches", 0):
+                    # the product has the sequences of the primers at both ends,
+                    # also where they do not match the template
+                    bases = list(str(prd.seq))
+                    bases[:len(fp)] = str(fp.seq)
+                    bases[len(bases)-len(rp):] = _rc(str(rp.seq))
+                    prd.seq = _Dseq("".join(bases))
+
                 full_tmpl_features = [f for f in tmpl.features if f.location.start==0 and f.location.end==len(tmpl)]
                 
                 new_identifier = ""
@@ -378,13 +655,13 @@ class Anneal(object, metaclass = _Memoize):
                                                                     )
         if self.forward_primers:
             for p in self.forward_primers:
-                mystring += "Primer {name} anneals forward at position {pos}\n".format(name=p.name, pos=p.position)
+                mystring += "Primer {name} anneals forward at position {pos}{mm}\n".format(name=p.name, pos=p.position, mm=_mismatch_note(p))
         else:
             mystring += "No forward primers anneal...\n"
         mystring +="\n"
         if self.reverse_primers:
             for p in self.reverse_primers:
-                mystring += "Primer {name} anneals reverse at position {pos}\n".format(name=p.name, pos=p.position)
+                mystring += "Primer {name} anneals reverse at position {pos}{mm}\n".format(name=p.name, pos=p.position, mm=_mismatch_note(p))
         else:
              mystring += "No reverse primers anneal...\n"
         return _pretty_str(mystring.strip())
@@ -408,6 +685,9 @@ def pcr(*args,  **kwargs):
     limit : int = 13, optional
         limit length of the annealing part of the primers.
 
+    max_mismatches : int = 0, optional
+        mismatches allowed in the annealing part of the primers, see :class:`Anneal`.
+
     Notes
     -----
 
@@ -417,6 +697,7 @@ def pcr(*args,  **kwargs):
     * Seq
     * SeqRecord (or subclass)
     * Dseqrecord (or sublcass)
+    * TemplateIndex (only as template)
 
     The last sequence will be assumed to be the template while
     all preceeding sequences will be assumed to be primers.
@@ -459,16 +740,16 @@ def pcr(*args,  **kwargs):
             s = _SeqRecord(s)
         elif isinstance(s, str):
             s = _SeqRecord(_Seq(s, _IUPACAmbiguousDNA()))
-        elif hasattr(s, "features"):
+        elif hasattr(s, "features") or hasattr(s, "watson_index"):
             pass
         else:
-            raise TypeError("arguments need to be a string, Bio.Seq, SeqRecord, Primer, Dseqrecord or Amplicon object")
+            raise TypeError("arguments need to be a string, Bio.Seq, SeqRecord, Primer, Dseqrecord, Amplicon or TemplateIndex object")
         new.append(s)
 
     if len(new) == 1 and hasattr(new[0], "forward_primer"): # A single Amplicon object
         new = [ new[0].forward_primer, new[0].reverse_primer, new[0] ]
     
-    if not hasattr(new[-1].seq, "watson"):
+    if not hasattr(new[-1], "watson_index") and not hasattr(new[-1].seq, "watson"):
         new[-1] = _Dseqrecord(s)
 
     anneal_primers = Anneal(  new[:-1],
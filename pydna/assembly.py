@@ -49,6 +49,10 @@ import logging as _logging
 _module_logger = _logging.getLogger("pydna."+__name__)
 
 import itertools as _itertools
+import time as _time
+import os as _os
+import concurrent.futures as _futures
+import warnings as _warnings
 from   copy     import deepcopy as _deepcopy
 import networkx as _nx
 
@@ -56,8 +60,10 @@ from pydna.dseqrecord import Dseqrecord as _Dseqrecord
 
 from pydna.common_sub_strings import common_sub_strings
 from pydna.common_sub_strings import terminal_overlap
+from pydna.common_sub_strings import common_sub_strings_many as _common_sub_strings_many
 from pydna.contig  import Contig as _Contig
 from pydna._pretty import pretty_str as _pretty_str
+from pydna import _PydnaWarning
 from pydna.utils   import memorize   as _memorize
 from pydna.utils   import lseguid as _lseguid
 from pydna.utils   import cseguid as _cseguid
@@ -109,10 +115,29 @@ class Assembly(object, metaclass = _Memoize):
     limit : int, optional
         The shortest shared homology to be considered
     algorithm : function, optional
-        The algorithm used to determine the shared sequences.
+        The algorithm used to determine the shared sequences. The default
+        common_sub_strings finds all shared sequences. terminal_overlap only
+        finds sequences shared between the ends of the fragments, which is
+        much faster for long fragments.
     max_nodes : int
         The maximum number of nodes in the graph. This can be tweaked to manage 
         sequences with a high number of shared sub sequences.
+    max_products : int, optional
+        The maximum number of linear and circular products to build.
+    timeout : float, optional
+        The maximum time in seconds spent looking for linear and circular
+        products. A warning is issued if the search is cut short.
+    n_jobs : int, optional
+        Number of processes used to find the shared sequences between
+        pairs of fragments. -1 means one per CPU. The results are the same
+        as without processes.
+    executor : concurrent.futures.Executor, optional
+        An executor used instead of starting new processes. It is not
+        shut down by the Assembly.
+
+    The products are found when first asked for, either through the
+    linear and circular properties or one at a time with the iter_linear
+    and iter_circular methods.
     
     
 
@@ -137,34 +162,66 @@ class Assembly(object, metaclass = _Memoize):
     [Contig(o59)]
     >>> x.circular_products[0].seq.watson
     'acgatgctatactgCCCCCtgtgctgtgctctaTTTTTtattctggctgtatcGGGGGt'
+    >>> list(x.iter_linear(max_products=2))
+    [Contig(-14), Contig(-73)]
 
     '''
     
-    def __init__(self, fragments, limit = 25, algorithm=common_sub_strings, max_nodes=None):
+    def __init__(self, fragments, limit = 25, algorithm=common_sub_strings, max_nodes=None, max_products=None, timeout=None, n_jobs=None, executor=None):
         
         ''' Consider only terminal overlaps?'''
         self.limit = limit
         ''' The shortest common sub strings to be considered '''
         self.max_nodes = max_nodes or len(fragments)
         ''' The max number of nodes allowed. This can be reset to some other value'''
+        self.max_products = max_products
+        ''' The max number of linear and circular products each. None means no limit'''
+        self.timeout = timeout
+        ''' Seconds allowed for finding linear and circular products each. None means no limit'''
         
         fragments = [_Fragment(f) for f in fragments]
         rcfragments = _od( (f.seguid(),f.rc()) for f in fragments )
         g=_nx.MultiDiGraph(selfloops=False)
 
-        for first, secnd in _itertools.combinations(fragments, 2):
-            
-                fseguid,rseguid = first.seguid(), secnd.seguid()
-                
-                if fseguid==rseguid: continue
+        seguids = [f.seguid() for f in fragments]
+        seqs = [str(f.seq).upper() for f in fragments] + [str(f.seq).upper() for f in rcfragments.values()]
+        rcindex = {s:i for i, s in enumerate(rcfragments, len(fragments))}
+        pairs = [(i, j) for i, j in _itertools.combinations(range(len(fragments)), 2) if seguids[i]!=seguids[j]]
+
+        pool = executor
+        if pool is None and n_jobs not in (None, 0, 1):
+            pool = _futures.ProcessPoolExecutor(n_jobs if n_jobs > 0 else None)
+
+        try:
+            if algorithm is common_sub_strings:
+                # all fragments and their reverse complements share one suffix array
+                shared = _common_sub_strings_many(seqs,
+                                                  self.limit,
+                                                  [p for i, j in pairs for p in ((i, j), (i, rcindex[seguids[j]]))],
+                                                  executor=pool)
+                allmatches = [(shared.get((i, j), []), shared.get((i, rcindex[seguids[j]]), [])) for i, j in pairs]
+            else:
+                xs = [seqs[i] for i, j in pairs]
+                ys = [seqs[j] for i, j in pairs]
+                ysrc = [seqs[rcindex[seguids[j]]] for i, j in pairs]
+                if pool is None:
+                    calls = map(algorithm, xs+xs, ys+ysrc, _itertools.repeat(self.limit))
+                else:
+                    chunksize = max(1, len(pairs) // (2*(_os.cpu_count() or 1)))
+                    calls = pool.map(algorithm, xs+xs, ys+ysrc, _itertools.repeat(self.limit), chunksize=chunksize)
+                calls = list(calls)
+                allmatches = list(zip(calls[:len(pairs)], calls[len(pairs):]))
+        finally:
+            if pool is not executor:
+                pool.shutdown()
+
+        for (i, j), (matches, rcmatches) in zip(pairs, allmatches):
 
-                firrc = rcfragments[fseguid]
-                secrc = rcfragments[rseguid]
+                first, secnd = fragments[i], fragments[j]
+
+                firrc = rcfragments[seguids[i]]
+                secrc = rcfragments[seguids[j]]
 
-                matches = algorithm( str(first.seq).upper(),
-                                     str(secnd.seq).upper(),
-                                     self.limit)
-                
                 for start_in_first, start_in_secnd, length in matches:
                     node    = first[start_in_first:start_in_first+length] 
                     node_id = node.seguid()
@@ -179,11 +236,7 @@ class Assembly(object, metaclass = _Memoize):
                     firrc.nodes.append((start_in_firrc, node_id) )
                     secrc.nodes.append((start_in_secrc, node_id) )
 
-                matches = algorithm( str(first.seq).upper(),
-                                     str(secrc.seq).upper(),
-                                     self.limit)
-                
-                for start_in_first, start_in_secrc, length in matches:
+                for start_in_first, start_in_secrc, length in rcmatches:
                     node    = first[start_in_first:start_in_first+length] 
                     node_id = node.seguid()
                     g.add_node(node_id, length = length, fragment=str(node.seq))
@@ -240,9 +293,38 @@ class Assembly(object, metaclass = _Memoize):
             feats = [f for f in list(rcfragments.values())[-1].features if start_in_last<=int(f.location.start)]
             g.add_edge(last_node_id, "end_rc", fragment=str(list(rcfragments.values())[-1]._seq)[start_in_last:len(list(rcfragments.values())[-1])], feats=feats, length =start, start=start_in_last, end=len(fragments[-1]), seq=list(rcfragments.values())[-1])
         
-        lps={}     #linear assembly
-        lps=_od(lps)  # fix
-               
+        self.fragments = fragments
+        self.G = g
+        self.algorithm = algorithm
+        self._linear = None
+        self._circular = None
+
+    def iter_linear(self, max_products=None, timeout=None):
+        '''Yields the linear assembly products one at a time.
+
+        Paths through the assembly graph are traced on demand and each
+        :class:`pydna.contig.Contig` is built, including its features, only
+        when it is consumed. Products that are identical to one already yielded
+        are skipped. The products come in the order they are found. The
+        linear_products property has them sorted by size.
+
+        Parameters
+        ----------
+        max_products : int, optional
+            Stop after this many products. Defaults to the max_products
+            given to the Assembly.
+        timeout : float, optional
+            Stop looking for more products after this many seconds. Defaults
+            to the timeout given to the Assembly.
+        '''
+        if max_products is None:
+            max_products = self.max_products
+        if timeout is None:
+            timeout = self.timeout
+        t0 = _time.time()
+        g = self.G
+        lps = set()
+
         lpths = _itertools.chain(_nx.all_simple_paths(_nx.DiGraph(g),"begin",    "end",      cutoff=self.max_nodes),
                                  _nx.all_simple_paths(_nx.DiGraph(g),"begin",    "end_rc",   cutoff=self.max_nodes),
                                  _nx.all_simple_paths(_nx.DiGraph(g),"begin_rc", "end",      cutoff=self.max_nodes),
@@ -257,12 +339,18 @@ class Assembly(object, metaclass = _Memoize):
                 e1.append(e2)
 
             for edges in _itertools.product(*e1):
-                sg=_nx.DiGraph(g.subgraph(lpath).copy())
-                sg.add_edges_from(edges)
+                if max_products is not None and len(lps) >= max_products:
+                    return
+                if self._timed_out(t0, timeout):
+                    self._warn_timeout(timeout)
+                    return
                 ct = "".join(e[2]["fragment"] for e in edges)
                 lseguid = _lseguid(ct)
                 if lseguid in lps:
                     continue
+                lps.add(lseguid)
+                sg=_nx.DiGraph(g.subgraph(lpath).copy())
+                sg.add_edges_from(edges)
                 edgefeatures=[]
                 offset=0
                 for e in edges:
@@ -271,14 +359,47 @@ class Assembly(object, metaclass = _Memoize):
                         f.location+=offset
                     edgefeatures.extend(feats)
                     offset+=e[2]["length"]
-                lps[lseguid]= _Contig( ct, features=edgefeatures, graph=sg, path=lpath)
-        #print(111)
-        cps = {} # circular assembly
-        cps = _od(cps)
-        nodes  = list(_itertools.chain.from_iterable([f.nodes for f in fragments]))
+                yield _Contig( ct, features=edgefeatures, graph=sg, path=lpath)
+
+    def iter_circular(self, max_products=None, timeout=None):
+        '''Yields the circular assembly products one at a time.
+
+        Cycles in the assembly graph are collected and ordered by the number
+        of nodes. Each :class:`pydna.contig.Contig` is built, including its
+        features, only when it is consumed. Products that are identical to one
+        already yielded are skipped. The circular_products property has them
+        sorted by size.
+
+        Parameters
+        ----------
+        max_products : int, optional
+            Stop after this many products. Defaults to the max_products
+            given to the Assembly.
+        timeout : float, optional
+            Stop looking for more products after this many seconds. Defaults
+            to the timeout given to the Assembly. If the time is out while
+            the cycles of the assembly graph are collected, the products of
+            the cycles found until then are built.
+        '''
+        if max_products is None:
+            max_products = self.max_products
+        if timeout is None:
+            timeout = self.timeout
+        t0 = _time.time()
+        g = self.G
+        cps = _od()
+        nodes  = list(_itertools.chain.from_iterable([f.nodes for f in self.fragments]))
         nodes  = list(_od.fromkeys([n[1] for n in nodes]))
 
-        cpaths = [list(x) for x in _nx.simple_cycles(g)]
+        cpaths = []
+        cut_short = False
+        for x in _nx.simple_cycles(g):
+            if self._timed_out(t0, timeout):
+                # the products of the cycles found so far are built
+                self._warn_timeout(timeout)
+                cut_short = True
+                break
+            cpaths.append(list(x))
 
         first_cpaths  = []
         second_cpaths = []
@@ -314,12 +435,18 @@ class Assembly(object, metaclass = _Memoize):
                     e2.append((u,v,d))
                 e1.append(e2)
             for edges in _itertools.product(*e1):
+                if max_products is not None and len(cps) >= max_products:
+                    return
+                if not cut_short and self._timed_out(t0, timeout):
+                    self._warn_timeout(timeout)
+                    return
                 ct = "".join(e[2]["fragment"] for e in edges)
-                if ct in [str(s.seq) for s in cps.values()]:
+                if ct in cps.values():
                     continue
                 cseguid = _cseguid(ct)                
                 if cseguid in cps:
                     continue           
+                cps[cseguid] = ct
                 sg=_nx.DiGraph(g.subgraph(cp).copy())
                 sg.add_edges_from(edges)
                 edgefeatures=[]
@@ -335,14 +462,35 @@ class Assembly(object, metaclass = _Memoize):
                         f.location+=(-len(ct))                    
                     elif f.location.end>len(ct):
                         f.location = _CompoundLocation((_FeatureLocation(f.location.start,_ExactPosition(len(ct))),_FeatureLocation(_ExactPosition(0), f.location.end-len(ct))))
-                cps[cseguid]=_Contig( ct, features = edgefeatures, graph=sg, path=cp, circular=True)
-
-        self.linear   = self.linear_products   = sorted(lps.values(), key=len, reverse=True)
-        self.circular = self.circular_products = sorted(cps.values(), key=len, reverse=True)
-        self.fragments = fragments
-        self.G = g
-        self.algorithm = algorithm
-        #globals().update(locals());import sys;sys.exit(42)
+                yield _Contig( ct, features = edgefeatures, graph=sg, path=cp, circular=True)
+
+    @staticmethod
+    def _timed_out(t0, timeout):
+        return timeout is not None and _time.time()-t0 > timeout
+
+    @staticmethod
+    def _warn_timeout(timeout):
+        _warnings.warn("Assembly stopped looking for products after {} s, "
+                       "the results may be incomplete.".format(timeout),
+                       _PydnaWarning)
+
+    @property
+    def linear_products(self):
+        '''Linear assembly products sorted by size, computed on first use.'''
+        if getattr(self, "_linear", None) is None:
+            self._linear = sorted(self.iter_linear(), key=len, reverse=True)
+        return self._linear
+
+    linear = linear_products
+
+    @property
+    def circular_products(self):
+        '''Circular assembly products sorted by size, computed on first use.'''
+        if getattr(self, "_circular", None) is None:
+            self._circular = sorted(self.iter_circular(), key=len, reverse=True)
+        return self._circular
+
+    circular = circular_products
 
     def list_circular(self):
         return _pretty_str("\n".join("{i} {r} {cs}".format(i=i,p=p,r=repr(p),cs=p.cseguid()) for i,p in enumerate(self.circular)))
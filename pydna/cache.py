@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright 2013-2018 by Björn Johansson.  All rights reserved.
+# This code is part of the Python-dna distribution and governed by its
+# license.  Please see the LICENSE.txt file that should have been included
+# as part of this package.
+
+'''This module provides the persistent cache used by :func:`pydna.utils.memorize`.
+
+Functions and classes are only cached if their cache name is listed in the
+*pydna_cached_funcs* environment variable, which is set from the cached_funcs
+entry in **pydna.ini**. A time to live in seconds can be given after a colon::
+
+    cached_funcs=pydna.genbank.Genbank.nucleotide:604800,pydna.amplify.Anneal
+
+Results are stored by a cache backend. The backend is chosen by the
+*pydna_cache_backend* environment variable (cache_backend in pydna.ini):
+
+- **sqlite**  (default) A SQLite database in WAL mode in the pydna_data_dir
+  folder. It can be shared safely by several processes. Least recently used
+  entries are removed when the total size exceeds *pydna_cache_size*
+  (cache_size in pydna.ini, for example 500MB).
+- **shelve**  One shelve file per cached function, as in earlier versions of
+  pydna. No size limit or time to live.
+- **package.module.Class**  Any subclass of :class:`CacheBackend`.
+
+Recently used results are also kept in an in-process :class:`MemoryCache`,
+so that repeated calls with the same arguments do not need to read from disk.
+
+Hits, misses and stored bytes can be inspected with :func:`cache_info` and
+cached results removed with :func:`cache_clear`. Both are also available as
+pydna.cache_info and pydna.cache_clear.
+'''
+
+import os          as _os
+import re          as _re
+import base64      as _base64
+import hashlib     as _hashlib
+import time        as _time
+import pickle      as _pickle
+import shelve      as _shelve
+import sqlite3     as _sqlite3
+import threading   as _threading
+import importlib   as _importlib
+import collections as _collections
+import logging     as _logging
+_module_logger = _logging.getLogger("pydna."+__name__)
+
+
+CacheInfo = _collections.namedtuple("CacheInfo", "hits misses entries bytes memory_hits memory_entries memory_bytes")
+
+_stats = _collections.defaultdict(lambda: [0, 0, 0])
+
+
+def _parse_size(size):
+    '''Returns a size like "500MB", "2 GB", "1000" or "0" as an integer number of bytes.'''
+    m = _re.match(r"^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*$", str(size), _re.I)
+    if not m:
+        raise ValueError("Could not interpret {!r} as a size.".format(size))
+    number, unit = m.groups()
+    return int(float(number) * 1024**" kmgt".index(unit.lower() or " "))
+
+
+def ttl(name):
+    '''Returns the time to live in seconds for the cache name, or None.
+
+    The time to live is given after a colon in the cached_funcs setting,
+    for example pydna.amplify.Anneal:3600
+    '''
+    for entry in _re.split(r"[,\s]+", _os.getenv("pydna_cached_funcs", "")):
+        funcname, _, seconds = entry.partition(":")
+        if funcname == name and seconds:
+            return float(seconds)
+    return None
+
+
+def _freeze(obj):
+    hook = getattr(type(obj), "__pydna_cache_key__", None)
+    if hook is not None:
+        return True, hook(obj)
+    if isinstance(obj, (list, tuple)):
+        items = [_freeze(o) for o in obj]
+        if any(found for found, item in items):
+            return True, type(obj)(item for found, item in items)
+    elif isinstance(obj, dict):
+        items = [(k, _freeze(v)) for k, v in obj.items()]
+        if any(found for k, (found, v) in items):
+            return True, sorted((k, v) for k, (found, v) in items)
+    return False, obj
+
+
+def digest(*parts):
+    '''Returns a url safe SHA1 digest of parts.
+
+    Parts implementing the __pydna_cache_key__ hook are represented by
+    their cache key, other parts by their repr. Items in lists are always
+    represented by their repr. The digest is case sensitive.
+
+    Examples
+    --------
+    >>> from pydna.cache import digest
+    >>> digest("aaa", 1)
+    'pgB9fGkDv00AdeUJo_jNvIbtka4='
+    >>> digest("AAA", 1)
+    'SUiFn7WV5xZUx9MA-OvCtPkhYNM='
+    '''
+    text = "\x1f".join(repr(p.__pydna_cache_key__() if hasattr(type(p), "__pydna_cache_key__") else p) for p in parts)
+    return _base64.urlsafe_b64encode(_hashlib.sha1(text.encode("utf-8")).digest()).decode("ascii")
+
+
+# keyword arguments that only change how a result is computed
+_not_in_key = ("n_jobs", "executor")
+
+
+def key(args, kwargs):
+    '''Returns the cache key for a call with args and kwargs.
+
+    Objects with a __pydna_cache_key__ method are represented by the string
+    it returns instead of the whole pickled object. The method is implemented
+    by :class:`pydna.dseq.Dseq`, :class:`pydna.seqrecord.SeqRecord` and
+    its subclasses like :class:`pydna.dseqrecord.Dseqrecord`,
+    :class:`pydna.primer.Primer` and :class:`pydna.amplicon.Amplicon`.
+    The key then only depends on the sequences, names, features and
+    parameters and not on other annotations like the date.
+
+    Calls without such objects get the same keys as in earlier versions of
+    pydna, so that they are still found in existing caches.
+
+    The n_jobs and executor keyword arguments are not part of the key.
+    '''
+    if any(k in kwargs for k in _not_in_key):
+        kwargs = {k: v for k, v in kwargs.items() if k not in _not_in_key}
+    found, frozen = _freeze((args, kwargs))
+    data = _pickle.dumps(frozen if found else (args, kwargs))
+    return _base64.urlsafe_b64encode(_hashlib.sha1(data).digest()).decode("ascii")
+
+
+class CacheBackend(object):
+    '''Base class for cache backends.
+
+    A backend stores Python objects under a function name and a key.
+    Subclasses have to implement get, set, clear and info.
+    '''
+
+    def get(self, func, key, ttl=None):
+        '''Returns the object stored for func under key. Raises KeyError if
+        there is none, or if it is older than ttl seconds.'''
+        raise NotImplementedError
+
+    def set(self, func, key, value):
+        '''Stores value for func under key.'''
+        raise NotImplementedError
+
+    def clear(self, func=None):
+        '''Removes all stored objects for func, or for all functions if func is None.'''
+        raise NotImplementedError
+
+    def info(self):
+        '''Returns a dict {func: (entries, bytes)} for the stored objects.'''
+        raise NotImplementedError
+
+
+class SQLiteCache(CacheBackend):
+    '''Cache backend storing pickled objects in a SQLite database in WAL mode.
+
+    Several processes can read and write the same database. When the total
+    size of the stored objects exceeds max_bytes, the least recently used
+    objects are removed. A max_bytes of 0 means no limit.
+    '''
+
+    def __init__(self, path, max_bytes=0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = _threading.RLock()
+        self._pid = None
+        self._con = None
+
+    def __getstate__(self):
+        return self.path, self.max_bytes
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def _connection(self):
+        if self._pid != _os.getpid():
+            # connections can not be shared with forked processes
+            con = _sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.execute("CREATE TABLE IF NOT EXISTS cache ("
+                        "func TEXT NOT NULL, "
+                        "key TEXT NOT NULL, "
+                        "value BLOB NOT NULL, "
+                        "size INTEGER NOT NULL, "
+                        "created REAL NOT NULL, "
+                        "accessed REAL NOT NULL, "
+                        "PRIMARY KEY (func, key))")
+            con.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+            self._con, self._pid = con, _os.getpid()
+        return self._con
+
+    def get(self, func, key, ttl=None):
+        with self._lock:
+            con = self._connection()
+            row = con.execute("SELECT value, created FROM cache WHERE func=? AND key=?", (func, key)).fetchone()
+            if row is None:
+                raise KeyError(key)
+            value, created = row
+            now = _time.time()
+            if ttl is not None and now - created > ttl:
+                con.execute("DELETE FROM cache WHERE func=? AND key=?", (func, key))
+                raise KeyError(key)
+            con.execute("UPDATE cache SET accessed=? WHERE func=? AND key=?", (now, func, key))
+        return _pickle.loads(value)
+
+    def set(self, func, key, value):
+        data = _pickle.dumps(value, protocol=_pickle.HIGHEST_PROTOCOL)
+        now = _time.time()
+        with self._lock:
+            con = self._connection()
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                con.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?)",
+                            (func, key, _sqlite3.Binary(data), len(data), now, now))
+                if self.max_bytes:
+                    self._evict(con)
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+            con.execute("COMMIT")
+
+    def _evict(self, con):
+        total, = con.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()
+        if total <= self.max_bytes:
+            return
+        removed = []
+        for func, key, size in con.execute("SELECT func, key, size FROM cache ORDER BY accessed"):
+            if total <= self.max_bytes:
+                break
+            removed.append((func, key))
+            total -= size
+        con.executemany("DELETE FROM cache WHERE func=? AND key=?", removed)
+        _module_logger.info("removed %s entries from the cache", len(removed))
+
+    def clear(self, func=None):
+        with self._lock:
+            con = self._connection()
+            if func is None:
+                con.execute("DELETE FROM cache")
+            else:
+                con.execute("DELETE FROM cache WHERE func=?", (func,))
+
+    def info(self):
+        with self._lock:
+            con = self._connection()
+            rows = con.execute("SELECT func, COUNT(*), SUM(size) FROM cache GROUP BY func").fetchall()
+        return {func: (entries, size) for func, entries, size in rows}
+
+
+class ShelveCache(CacheBackend):
+    '''Cache backend with one shelve file per function in the folder data_dir.
+
+    This is how pydna cached results before the SQLite backend was added.
+    There is no size limit and no locking. The ttl argument is ignored.
+    '''
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+
+    def _path(self, func):
+        from pydna.utils import identifier_from_string as _identifier_from_string
+        return _os.path.join(self.data_dir, _identifier_from_string(func))
+
+    def get(self, func, key, ttl=None):
+        cache = _shelve.open(self._path(func), writeback=False)
+        try:
+            return cache[key]
+        finally:
+            cache.close()
+
+    def set(self, func, key, value):
+        cache = _shelve.open(self._path(func), writeback=False)
+        try:
+            cache[key] = value
+        finally:
+            cache.close()
+
+    def clear(self, func=None):
+        funcs = [func] if func else list(self.info())
+        for func in funcs:
+            cache = _shelve.open(self._path(func), writeback=False)
+            try:
+                cache.clear()
+            finally:
+                cache.close()
+
+    def info(self):
+        result = {}
+        for func in _re.split(r"[,\s]+", _os.getenv("pydna_cached_funcs", "")):
+            func = func.partition(":")[0]
+            if not func:
+                continue
+            size = sum(_os.path.getsize(_os.path.join(self.data_dir, f)) for f in _os.listdir(self.data_dir)
+                       if f.split(".")[0] == _os.path.basename(self._path(func)))
+            if size:
+                cache = _shelve.open(self._path(func), writeback=False)
+                try:
+                    result[func] = (len(cache), size)
+                finally:
+                    cache.close()
+        return result
+
+
+class MemoryCache(object):
+    '''In-process least recently used cache in front of the cache backend.
+
+    Objects are kept pickled, so that every hit returns a new copy that
+    can be modified without changing the cached result. The number of
+    entries and their total size are limited by the pydna_cache_memory_entries
+    and pydna_cache_memory_size environment variables. Setting either
+    to 0 turns the memory cache off.
+    '''
+
+    def __init__(self):
+        self._data = _collections.OrderedDict()
+        self._bytes = 0
+        self._lock = _threading.RLock()
+
+    def _limits(self):
+        return (int(_os.getenv("pydna_cache_memory_entries", "128")),
+                _parse_size(_os.getenv("pydna_cache_memory_size", "64MB")))
+
+    def get(self, func, key, ttl=None):
+        with self._lock:
+            created, data = self._data[(func, key)]
+            if ttl is not None and _time.time() - created > ttl:
+                self._bytes -= len(self._data.pop((func, key))[1])
+                raise KeyError(key)
+            self._data.move_to_end((func, key))
+        return _pickle.loads(data)
+
+    def set(self, func, key, value):
+        max_entries, max_bytes = self._limits()
+        if not max_entries or not max_bytes:
+            return
+        data = _pickle.dumps(value, protocol=_pickle.HIGHEST_PROTOCOL)
+        if len(data) > max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop((func, key), None)
+            if old:
+                self._bytes -= len(old[1])
+            self._data[(func, key)] = (_time.time(), data)
+            self._bytes += len(data)
+            while len(self._data) > max_entries or self._bytes > max_bytes:
+                self._bytes -= len(self._data.popitem(last=False)[1][1])
+
+    def clear(self, func=None):
+        with self._lock:
+            for k in [k for k in self._data if func is None or k[0] == func]:
+                self._bytes -= len(self._data.pop(k)[1])
+
+    def info(self):
+        result = _collections.defaultdict(lambda: [0, 0])
+        with self._lock:
+            for (func, key), (created, data) in self._data.items():
+                result[func][0] += 1
+                result[func][1] += len(data)
+        return {func: tuple(v) for func, v in result.items()}
+
+
+memory = MemoryCache()
+
+_backends = {}
+
+
+def backend():
+    '''Returns the cache backend set by the pydna_cache_backend, pydna_data_dir
+    and pydna_cache_size environment variables.'''
+    name = _os.getenv("pydna_cache_backend", "sqlite")
+    data_dir = _os.environ["pydna_data_dir"]
+    size = _os.getenv("pydna_cache_size", "0")
+    try:
+        return _backends[(name, data_dir, size)]
+    except KeyError:
+        pass
+    if name == "sqlite":
+        b = SQLiteCache(_os.path.join(data_dir, "pydna_cache.sqlite"), _parse_size(size))
+    elif name == "shelve":
+        b = ShelveCache(data_dir)
+    else:
+        modulename, _, classname = name.rpartition(".")
+        b = getattr(_importlib.import_module(modulename), classname)()
+    _backends[(name, data_dir, size)] = b
+    return b
+
+
+def _cache_name(func):
+    if func is None or isinstance(func, str):
+        return func
+    for obj in (func, type(func).__call__):
+        name = getattr(obj, "cache_name", None)
+        if name:
+            return name
+    raise ValueError("{!r} is not a cached function.".format(func))
+
+
+def cache_info():
+    '''Returns a dict with a :class:`CacheInfo` named tuple for each cached function.
+
+    hits, misses and memory_hits are counted in the current process. hits
+    include memory_hits. entries and bytes describe what is stored by the
+    cache backend, memory_entries and memory_bytes what is held by the
+    in-process :class:`MemoryCache`.
+
+    Examples
+    --------
+    >>> import pydna
+    >>> info = pydna.cache_info()
+    >>> isinstance(info, dict)
+    True
+    '''
+    stored = backend().info()
+    inmemory = memory.info()
+    names = sorted(set(stored) | set(inmemory) | set(_stats))
+    return {name: CacheInfo(_stats[name][0],
+                            _stats[name][1],
+                            *stored.get(name, (0, 0)),
+                            _stats[name][2],
+                            *inmemory.get(name, (0, 0))) for name in names}
+
+
+def cache_clear(func=None):
+    '''Removes cached results for func, or all cached results if func is None.
+
+    func can be a cache name like "pydna.amplify.Anneal" or the cached
+    function or class itself, like pydna.amplify.Anneal.
+
+    Examples
+    --------
+    >>> import pydna
+    >>> from pydna.assembly import Assembly
+    >>> pydna.cache_clear(Assembly)
+    '''
+    name = _cache_name(func)
+    memory.clear(name)
+    backend().clear(name)
+    for n in ([name] if name else list(_stats)):
+        _stats.pop(n, None)
+
+
+if __name__=="__main__":
+    cached = _os.getenv("pydna_cached_funcs", "")
+    _os.environ["pydna_cached_funcs"]=""
+    import doctest
+    doctest.testmod(verbose=True, optionflags=doctest.ELLIPSIS)
+    _os.environ["pydna_cached_funcs"]=cached
@@ -14,6 +14,10 @@ from collections import defaultdict     as _defaultdict
 import itertools                        as _itertools
 from operator import itemgetter         as _itemgetter
 
+try:
+    import numpy as _np
+except ImportError:
+    _np = None
 
 
 
@@ -118,10 +122,110 @@ def kark_sort(s, SA, n, K):
     k += 1
 
 
+def _np_codes(s):
+  '''Returns the characters of s as an array of integer codes that
+  sort in the same order as the characters.'''
+  try:
+    return _np.frombuffer(s.encode("latin-1"), dtype=_np.uint8).astype(_np.int64)
+  except UnicodeEncodeError:
+    return _np.frombuffer(s.encode("utf-32-le"), dtype="<u4").astype(_np.int64)
+
+
+def np_suffix_array(codes):
+  '''Suffix array by prefix doubling using NumPy.
+
+  Short prefixes are packed into single integers. Longer prefixes are
+  ranked by doubling, where only suffixes that still share a rank with
+  another suffix are sorted again (Larsson & Sadakane). The end of the
+  string sorts before all characters, as in direct_kark_sort.
+
+  Returns the suffix array and a list of arrays, one for each prefix
+  length 1, 2, 4 ... Two suffixes have equal values in the i:th array
+  if they share the first 2**i characters. These are used by np_lcp.'''
+  n = len(codes)
+  code = _np.unique(codes, return_inverse=True)[1].astype(_np.int64) + 1
+  base = int(code.max()) + 1 if n else 2
+  levels = [code]
+  k = 1
+  while base**(2*k) < 2**62 and k < n:
+    nxt = code * base**k
+    nxt[:n-k] += code[k:]
+    code = nxt
+    levels.append(code)
+    k *= 2
+
+  sa = _np.argsort(code, kind="mergesort")
+  keys = code[sa]
+  start = _np.ones(n, dtype=bool)
+  start[1:] = keys[1:] != keys[:-1]
+  rank = _np.empty(n, dtype=_np.int64)
+  rank[sa] = _np.maximum.accumulate(_np.where(start, _np.arange(n), 0))
+  single = start.copy()
+  single[:-1] &= start[1:]
+  slots = _np.flatnonzero(~single)
+
+  while len(slots):
+    members = sa[slots]
+    second = _np.full(len(members), -1, dtype=_np.int64)
+    inside = members + k < n
+    second[inside] = rank[members[inside] + k]
+    first = rank[members]
+    order = _np.lexsort((second, first))
+    members, first, second = members[order], first[order], second[order]
+    sa[slots] = members
+    start = _np.ones(len(members), dtype=bool)
+    start[1:] = (first[1:] != first[:-1]) | (second[1:] != second[:-1])
+    rank[members] = _np.maximum.accumulate(_np.where(start, slots, 0))
+    single = start.copy()
+    single[:-1] &= start[1:]
+    slots = slots[~single]
+    levels.append(rank.copy())
+    k *= 2
+
+  return sa, levels
+
+
+def np_lcp(sa, ranks, endAt):
+  '''Longest common prefix between each suffix in sa and the one before it.
+
+  The lcp values are found for all suffixes at once by binary lifting
+  over the rank arrays returned by np_suffix_array. No common prefix
+  extends past the end of the string a suffix belongs to (endAt).'''
+  n = len(sa)
+  a = sa[1:]
+  b = sa[:-1]
+  l = _np.zeros(len(a), dtype=_np.int64)
+  for t in reversed(range(len(ranks))):
+    ia = a+l
+    ib = b+l
+    eq = (ia < n) & (ib < n)
+    _np.minimum(ia, n-1, out=ia)
+    _np.minimum(ib, n-1, out=ib)
+    eq &= ranks[t][ia] == ranks[t][ib]
+    l += eq.astype(_np.int64) << t
+  _np.minimum(l, endAt[a]-a, out=l)
+  _np.minimum(l, endAt[b]-b, out=l)
+  _np.maximum(l, 0, out=l)
+  return l
+
+
 class Rstr_max :
+  '''Maximal repeats in a set of strings.
+
+  The suffix array and lcp table are computed with NumPy if it is
+  available, otherwise by the pure Python routines in this module.
+  The backend can be chosen explicitly with backend="numpy" or
+  backend="python". Both give identical results.'''
 
-  def __init__(self) :
+  def __init__(self, backend=None) :
     self.array_str = []
+    if backend is None:
+      backend = "python" if _np is None else "numpy"
+    if backend not in ("python", "numpy"):
+      raise ValueError("backend has to be 'python' or 'numpy'")
+    if backend == "numpy" and _np is None:
+      raise ImportError("The numpy backend needs NumPy.")
+    self.backend = backend
 
   def add_str(self, str_unicode) :
     self.array_str.append(str_unicode)
@@ -130,6 +234,9 @@ class Rstr_max :
     char_frontier = chr(2)
 
     self.global_suffix = char_frontier.join(self.array_str)
+
+    if self.backend == "numpy":
+      return self._np_step1_sort_suffix()
     
     nbChars = len(self.global_suffix)
     init = [-1]*nbChars
@@ -150,7 +257,42 @@ class Rstr_max :
 
     self.res = direct_kark_sort(self.global_suffix)
 
+  def _np_step1_sort_suffix(self) :
+    nbChars = len(self.global_suffix)
+    lengths = _np.array([len(mot) for mot in self.array_str], dtype=_np.int64)
+    starts = _np.concatenate(([0], _np.cumsum(lengths+1)[:-1])).astype(_np.int64)
+    idxString = _np.full(nbChars, -1, dtype=_np.int64)
+    idxPos = _np.full(nbChars, -1, dtype=_np.int64)
+    endAt = _np.full(nbChars, -1, dtype=_np.int64)
+    inside = _np.repeat(_np.arange(len(lengths)), lengths)
+    frontier = _np.zeros(nbChars, dtype=bool)
+    frontier[starts[1:]-1] = True
+    k = _np.flatnonzero(~frontier)
+    idxString[k] = inside
+    idxPos[k] = k - starts[inside]
+    endAt[k] = (starts+lengths)[inside]
+    self._np_endAt = endAt
+    self.idxString = _array('i', idxString.tolist())
+    self.idxPos = _array('i', idxPos.tolist())
+    self.endAt = _array('i', endAt.tolist())
+    if nbChars:
+      self._np_res, self._np_ranks = np_suffix_array(_np_codes(self.global_suffix))
+    else:
+      self._np_res, self._np_ranks = _np.zeros(0, dtype=_np.int64), []
+    self.res = _array('i', self._np_res.tolist())
+
+  def _np_step2_lcp(self) :
+    n = len(self.res)
+    LCP = _np.zeros(n, dtype=_np.int64)
+    k = len(self.array_str)
+    if n > k:
+      LCP[k-1:n-1] = np_lcp(self._np_res, self._np_ranks, self._np_endAt)[k-1:]
+    self.lcp = _array('i', LCP.tolist())
+    del self._np_res, self._np_ranks, self._np_endAt
+
   def step2_lcp(self) :
+    if self.backend == "numpy":
+      return self._np_step2_lcp()
     n = len(self.res)
     init = [0]*n
     rank = _array('i', init)
@@ -295,6 +437,11 @@ def common_sub_strings(stringx:str, stringy:str, limit=25):
     rstr = Rstr_max()
     rstr.add_str(stringx+"&"+stringy)
     r = rstr.go()
+    return _matches(r, rstr.res, len(stringx), limit)
+
+def _matches(r, res, lenx, limit):
+    '''Pairs up the repeats in the result r from Rstr_max.step3_rstr for a single
+    string stringx+"&"+stringy with suffix array res. Used by common_sub_strings.'''
     match=_defaultdict(int)
     for (offset_end, nb), (l, start_plage) in r.items():
         startsx=[]
@@ -302,9 +449,9 @@ def common_sub_strings(stringx:str, stringy:str, limit=25):
         if l<limit:
             continue
         for o in range(start_plage, start_plage + nb):
-            offset = rstr.idxPos[rstr.res[o]]
-            if offset>len(stringx):
-                startsy.append(offset-len(stringx)-1)
+            offset = res[o]
+            if offset>lenx:
+                startsy.append(offset-lenx-1)
             else:
                 startsx.append(offset)
 
@@ -320,6 +467,140 @@ def common_sub_strings(stringx:str, stringy:str, limit=25):
 
     return match
 
+def common_sub_strings_many(strings, limit=25, pairs=None, executor=None):
+    '''Finds the common substrings longer than limit between pairs of strings
+    in a list. The result is the same as calling common_sub_strings for each
+    pair, but all strings are indexed by one suffix array.
+
+    Pairs of strings that share no substring of at least limit characters are
+    found from the suffix array without further work, so the cost grows with
+    the total length of the strings and the number of overlapping pairs rather
+    than with the number of pairs.
+
+    Without NumPy, this function falls back on calling common_sub_strings for
+    each pair.
+
+    Parameters
+    ----------
+    strings : list of str
+    limit : int, optional
+    pairs : iterable of tuple, optional
+        (i, j) index pairs with i < j to compare. All pairs by default.
+    executor : concurrent.futures.Executor, optional
+        If given, the repeats of the pairs that share at least one substring
+        are found in the executor. Only the parts of the shared suffix and
+        lcp arrays for a pair are sent to the worker.
+
+    Returns
+    -------
+    dict
+        {(i, j): [(starti1, startj1, length1), ...], ...}
+
+        Only pairs with at least one common substring are included. The lists
+        are the same as returned by common_sub_strings(strings[i], strings[j], limit)
+
+    Examples
+    --------
+
+    >>> from pydna.common_sub_strings import common_sub_strings_many
+    >>> result = common_sub_strings_many(["gatgatttcggtagtta", "gtcagtatgtctatctatcgcg", "cggtag"], limit=3)
+    >>> result[(0, 1)]
+    [(1, 6, 3), (7, 17, 3), (10, 4, 3), (12, 3, 3)]
+    >>> result[(0, 2)]
+    [(8, 0, 6)]
+    >>> result[(1, 2)]
+    [(4, 2, 3)]
+    '''
+
+    strings = list(strings)
+    if pairs is None:
+        pairs = _itertools.combinations(range(len(strings)), 2)
+    pairs = sorted(set(pairs))
+
+    if _np is None or not strings or min("".join(strings) or "~") <= "&":
+        return _pairwise(strings, limit, pairs, executor)
+
+    # each string is followed by a terminator that sorts before all characters.
+    # The terminators are unique and decreasing, so that the order among the
+    # suffixes of two strings is the same as in stringx+"&"+stringy
+    nstr = len(strings)
+    lengths = _np.array([len(s) for s in strings], dtype=_np.int64)
+    starts = _np.concatenate(([0], _np.cumsum(lengths+1)[:-1])).astype(_np.int64)
+    total = int(lengths.sum()) + nstr
+    terminator = starts + lengths
+    strid = _np.repeat(_np.arange(nstr), lengths+1)
+    localpos = _np.arange(total, dtype=_np.int64) - starts[strid]
+    codes = _np.empty(total, dtype=_np.int64)
+    letters = _np.ones(total, dtype=bool)
+    letters[terminator] = False
+    codes[letters] = _np.unique(_np_codes("".join(strings)), return_inverse=True)[1] + nstr + 1
+    codes[terminator] = _np.arange(nstr, 0, -1)
+    strid[terminator] = -1
+    endAt = _np.where(letters, terminator[_np.maximum(strid, 0)], -1)
+
+    sa, ranks = np_suffix_array(codes)
+    lcp = np_lcp(sa, ranks, endAt)
+    del ranks
+    sastr = strid[sa]
+
+    # pairs of strings that meet in a block of suffixes sharing >= limit characters
+    inblock = _np.flatnonzero(lcp >= limit)
+    found = set()
+    if len(inblock):
+        breaks = _np.flatnonzero(_np.diff(inblock) > 1) + 1
+        for block in _np.split(inblock, breaks):
+            ids = _np.unique(sastr[block[0]:block[-1]+2])
+            found.update(_itertools.combinations(ids.tolist(), 2))
+
+    jobs = []
+    for i, j in pairs:
+        if (i, j) not in found:
+            continue
+        members = _np.flatnonzero((sastr == i) | (sastr == j))
+        # lcp between consecutive suffixes of the two strings
+        plcp = _np.minimum.reduceat(lcp[:members[-1]], members[:-1])
+        keep = plcp >= limit
+        entry = _np.zeros(len(members), dtype=bool)
+        entry[:-1] |= keep
+        entry[1:] |= keep
+        # only blocks with plcp >= limit can give repeats of length >= limit
+        # the blocks are joined by lcp 0 and scanned as one string
+        chosen = _np.flatnonzero(entry)
+        res = sa[members[chosen]]
+        res = _np.where(sastr[members[chosen]] == i,
+                        localpos[res],
+                        localpos[res] + lengths[i] + 1)
+        sublcp = _np.zeros(len(chosen), dtype=_np.int64)
+        sublcp[:-1] = _np.where(keep[chosen[:-1]], plcp[chosen[:-1]], 0)
+        jobs.append(((i, j), res, sublcp, len(strings[i])))
+
+    # the repeats of each pair are found from its part of the shared arrays,
+    # in the executor if given
+    res, sublcp, lenx = [[job[k] for job in jobs] for k in (1, 2, 3)]
+    if executor is None:
+        matches = map(_pair_matches, res, sublcp, lenx, _itertools.repeat(limit))
+    else:
+        matches = executor.map(_pair_matches, res, sublcp, lenx, _itertools.repeat(limit))
+    return {job[0]: m for job, m in zip(jobs, matches) if m}
+
+def _pair_matches(res, lcp, lenx, limit):
+    # the matches of one pair of strings from its suffix and lcp arrays,
+    # taken from the shared arrays by common_sub_strings_many
+    rstr = Rstr_max()
+    rstr.res = _array('i', res.tolist())
+    rstr.lcp = _array('i', lcp.tolist())
+    return _matches(rstr.step3_rstr(), rstr.res, lenx, limit)
+
+def _pairwise(strings, limit, pairs, executor=None):
+    # calls common_sub_strings for each pair, in the executor if given
+    xs = [strings[i] for i, j in pairs]
+    ys = [strings[j] for i, j in pairs]
+    if executor is None:
+        matches = map(common_sub_strings, xs, ys, _itertools.repeat(limit))
+    else:
+        matches = executor.map(common_sub_strings, xs, ys, _itertools.repeat(limit))
+    return {pair: m for pair, m in zip(pairs, matches) if m}
+
 def terminal_overlap(stringx:str, stringy:str, limit=15):
     '''Finds the the flanking common substrings between stringx and stringy
     longer than limit. This means that the results only contains substrings
@@ -362,8 +643,35 @@ def terminal_overlap(stringx:str, stringy:str, limit=15):
                         0
     
     '''
-    return [m for m in common_sub_strings(stringx, stringy, limit) if (m[0]==0 and m[1]+m[2]==len(stringy))
-                                                                    or (m[1]==0 and m[0]+m[2]==len(stringx))]
+    match = set(_end_overlaps(stringx, stringy, limit))
+    match.update((len(stringx)-l, 0, l) for x, y, l in _end_overlaps(stringy, stringx, limit))
+
+    match = sorted(match)
+
+    match.sort(key=_itemgetter(2), reverse=True)
+
+    return match
+
+def _end_overlaps(stringx, stringy, limit):
+    '''Yields (0, starty, length) for each prefix of stringx of at least limit
+    characters that is also a suffix of stringy.
+
+    The first limit characters of stringx are used as a seed. The seed is
+    located in stringy by substring search and each hit is extended to the
+    end of stringy. Only the hits are compared, so the cost is proportional
+    to the length of stringy and the number of hits.'''
+    if limit < 1:
+        limit = 1
+    seed = stringx[:limit]
+    if len(seed) < limit:
+        return
+    lenx, leny = len(stringx), len(stringy)
+    pos = stringy.find(seed, max(0, leny-lenx))
+    while pos != -1 and pos <= leny-limit:
+        length = leny-pos
+        if stringy.endswith(stringx[:length]):
+            yield (0, pos, length)
+        pos = stringy.find(seed, pos+1)
 
 if __name__=="__main__":
     import os as _os
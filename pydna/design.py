@@ -8,6 +8,8 @@
 
 - :func:primer_design for designing primers for a sequence or a matching primer for an existing primer. Returns an :class:`Amplicon` object (same as the :mod:`amplify` module returns).
 
+- :func:design_many for designing primers for many sequences at once, with checks for gc clamp, self complementarity and unique annealing.
+
 - :func:assembly_fragments Adds tails to primers for a linear assembly through homologous recombination or Gibson assembly.
 
 - :func:circular_assembly_fragments Adds tails to primers for a circular assembly through homologous recombination or Gibson assembly.
@@ -19,19 +21,52 @@ import math                                       as _math
 #from operator import itemgetter                   as _itemgetter
 import os                                         as _os
 import copy                                       as _copy
+import itertools                                  as _itertools
+import collections                                as _collections
+import concurrent.futures                         as _futures
 #from Bio.Alphabet import Alphabet                 as _Alphabet
 #from Bio.Alphabet.IUPAC import IUPACAmbiguousDNA  as _IUPACAmbiguousDNA
 #from Bio.Seq import Seq                           as _Seq
 from pydna.amplify import Anneal                  as _Anneal
 from pydna.amplify import pcr                     as _pcr
+from pydna.amplify import annealing_sites         as _annealing_sites
 from pydna.tm import tmbresluc                    as _tmbresluc
+from pydna.tm import tmstaluc98                   as _tmstaluc98
+from pydna.tm import tm_prefixes                  as _tm_prefixes
 from pydna.dseqrecord import Dseqrecord           as _Dseqrecord
 #from pydna._pretty import pretty_str              as _pretty_str
 from pydna.primer    import Primer                as _Primer
+from pydna.utils     import rc                    as _rc
 
 import logging    as _logging
 _module_logger = _logging.getLogger("pydna."+__name__)
 
+try:
+    import numpy as _np
+except ImportError:
+    _np = None
+
+
+def _prefix_length(target_tm, seq, limit, formula):
+    # The length of the shortest prefix of seq longer than limit with a tm
+    # of at least target_tm. The tm of the prefixes is computed for a window
+    # at the start of seq that is doubled until the length is found.
+    # Returns None if a prefix has no tm, so that the formula can report it.
+    window = limit + 32
+    while True:
+        end = min(window, len(seq))
+        tms = _tm_prefixes(str(seq[:end]), formula)[limit:]
+        found = _np.flatnonzero(tms >= target_tm)
+        missing = _np.flatnonzero(_np.isnan(tms))
+        if len(missing) and (not len(found) or missing[0] < found[0]):
+            return None
+        if len(found):
+            return limit + 1 + int(found[0])
+        if end == len(seq):
+            raise ValueError("The template is too short for a primer with a tm of {}.".format(target_tm))
+        window *= 2
+
+
 def primer_design( template,
                    fp=None,
                    rp=None,
@@ -152,13 +187,23 @@ def primer_design( template,
     
     def design(target_tm, template):
         ''' returns a string '''
-        tmp=0
-        length=limit
-        p = str(template.seq[:length])
-        while tmp<target_tm:
-            length+=1
+        length = None
+        if _np is not None and formula in (_tmbresluc, _tmstaluc98) and 0 < limit < len(template):
+            # the tm of all prefixes of the template end at once
+            length = _prefix_length(target_tm, template.seq, limit, formula)
+        if length is not None:
             p = str(template.seq[:length])
             tmp = formula(p.upper())
+        else:
+            tmp=0
+            length=limit
+            p = str(template.seq[:length])
+            while tmp<target_tm:
+                if length >= len(template):
+                    raise ValueError("The template is too short for a primer with a tm of {}.".format(target_tm))
+                length+=1
+                p = str(template.seq[:length])
+                tmp = formula(p.upper())
         ps = p[:-1]
         tmps = formula(str(ps).upper())
         _module_logger.debug(((p,   tmp),(ps, tmps)))
@@ -183,6 +228,19 @@ def primer_design( template,
     else:
         raise ValueError("Specify maximum one of the two primers.")
 
+    prod, products = _product(template, fp, rp, fprimerc, rprimerc, limit)
+
+    if products>1:
+        import warnings as _warnings
+        from pydna import _PydnaWarning
+        _warnings.warn("designed primers do not yield a unique PCR product",
+                       _PydnaWarning)
+
+    return prod
+
+
+def _product(template, fp, rp, fprimerc, rprimerc, limit):
+    # the PCR product of the designed primers and the number of products
     fp.concentration = fprimerc
     rp.concentration = rprimerc
 
@@ -202,16 +260,220 @@ def primer_design( template,
     rp.description = rp.id+' '+template.accession
     
     ampl = _Anneal( (fp, rp), template, limit=limit)
-    
-    prod = ampl.products[0]
-    
-    if len(ampl.products)>1:
-        import warnings as _warnings
-        from pydna import _PydnaWarning
-        _warnings.warn("designed primers do not yield a unique PCR product",
-                       _PydnaWarning)
 
-    return prod
+    return ampl.products[0], len(ampl.products)
+
+
+_default_constraints = {"target_tm"                 : 55.0,
+                        "min_length"                : 14,
+                        "max_length"                : 40,
+                        "gc_clamp"                  : 1,
+                        "max_self_complementarity"  : 4,
+                        "max_background_sites"      : 1,
+                        "background_mismatches"     : 1,
+                        "background"                : None,
+                        "fprimerc"                  : 1000.0,
+                        "rprimerc"                  : 1000.0,
+                        "saltc"                     : 50.0,
+                        "limit"                     : 13,
+                        "formula"                   : _tmbresluc}
+
+
+def _self_complementarity(primer):
+    # length of the longest 3' end of primer that can anneal to primer
+    primer = primer.upper()
+    k = 0
+    while k < len(primer) and _rc(primer[len(primer)-k-1:]) in primer:
+        k += 1
+    return k
+
+
+def _candidates(seq, c, primerc):
+    # lengths, tm, gc clamp and self complementarity of the primers at the start of seq
+    seq = str(seq[:c["max_length"]])
+    lengths = _np.arange(c["min_length"], len(seq)+1)
+    tms = _tm_prefixes(seq, c["formula"], primerc=primerc, saltc=c["saltc"])[lengths-1]
+    gc = _np.frombuffer(seq.upper().encode("ascii", "replace"), dtype=_np.uint8)
+    gc = _np.isin(gc, (ord("G"), ord("C"))).astype(int)
+    clamp = gc[lengths-1] + _np.where(lengths > 1, gc[_np.maximum(lengths-2, 0)], 0)
+    selfcompl = _np.array([_self_complementarity(seq[:n]) for n in lengths], dtype=int)
+    return [seq[:n] for n in lengths], tms, clamp, selfcompl
+
+
+def _design_one(template, c):
+    # the best amplicon for template and a dict of diagnostics
+    diagnostics = {"name": template.name, "length": len(template)}
+    if len(template) < c["min_length"]:
+        diagnostics["error"] = "template shorter than min_length"
+        return None, diagnostics
+    forward = _candidates(template.seq, c, c["fprimerc"])
+    reverse = _candidates(template.rc().seq, c, c["rprimerc"])
+    sites = _annealing_sites(forward[0] + reverse[0], template, c["limit"])
+    nf = len(forward[0])
+    unique = (_np.array([len(fw) == 1 and not rv for fw, rv in sites[:nf]], dtype=bool),
+              _np.array([len(rv) == 1 and not fw for fw, rv in sites[nf:]], dtype=bool))
+    background = c["background"]
+    if background is None:
+        counts = None
+    elif hasattr(background, "counts"):
+        counts = background.counts(forward[0] + reverse[0], c["background_mismatches"]).sum(axis=1)
+    else:
+        counts = _np.array([len(fw) + len(rv) for fw, rv in background.sites(forward[0] + reverse[0])])
+    if counts is not None:
+        offtarget = counts[:nf] <= c["max_background_sites"], counts[nf:] <= c["max_background_sites"]
+    else:
+        offtarget = _np.ones(nf, dtype=bool), _np.ones(len(reverse[0]), dtype=bool)
+    checks = _collections.OrderedDict()
+    checks["tm"] = ~_np.isnan(forward[1]), ~_np.isnan(reverse[1])
+    checks["gc_clamp"] = forward[2] >= c["gc_clamp"], reverse[2] >= c["gc_clamp"]
+    checks["self_complementarity"] = (forward[3] <= c["max_self_complementarity"],
+                                      reverse[3] <= c["max_self_complementarity"])
+    checks["unique"] = unique
+    checks["background"] = offtarget
+    # penalty of each pair, rows are forward and columns reverse candidates
+    tf, tr = _np.nan_to_num(forward[1])[:, None], _np.nan_to_num(reverse[1])[None, :]
+    target = c["target_tm"]
+    penalty = _np.abs(tf-target) + _np.abs(tr-target) + _np.abs(tf-tr)
+    ok = _np.ones(penalty.shape, dtype=bool)
+    failed = []
+    for name, (f, r) in checks.items():
+        passing = ok & f[:, None] & r[None, :]
+        if not passing.any():
+            failed.append(name)
+        else:
+            ok = passing
+    i, j = _np.unravel_index(_np.argmin(_np.where(ok, penalty, _np.inf)), penalty.shape)
+    fp = _Primer(forward[0][i])
+    rp = _Primer(reverse[0][j])
+    prod, products = _product(template, fp, rp, c["fprimerc"], c["rprimerc"], c["limit"])
+    diagnostics.update(passed=not failed,
+                       failed=failed,
+                       products=products,
+                       forward_tm=float(forward[1][i]),
+                       reverse_tm=float(reverse[1][j]),
+                       gc_clamp=(int(forward[2][i]), int(reverse[2][j])),
+                       self_complementarity=(int(forward[3][i]), int(reverse[3][j])),
+                       background_sites=None if counts is None else (int(counts[i]), int(counts[nf+j])),
+                       candidates=(nf, len(reverse[0])))
+    return prod, diagnostics
+
+
+def _design_chunk(templates, c):
+    return [_design_one(template, c) for template in templates]
+
+
+def design_many(templates, constraints=None, n_jobs=None, executor=None):
+    '''Designs primers for many templates. For each template, all primers
+    from min_length to max_length at each end are scored at once and the
+    best pair meeting the constraints is used.
+
+    The function returns an iterator of (Amplicon, diagnostics) tuples in
+    the same order as the templates. The results are returned as they are
+    made, so that they can be written out while the rest are designed.
+
+    A forward and reverse primer pair is chosen in this way:
+
+    1. The tm, gc clamp and 3' self complementarity of all candidate
+       primers are computed.
+    2. All candidates are searched for in the template and in the
+       background (if given) at the same time.
+    3. The pair with the smallest sum of the differences of the two tm
+       from target_tm and from each other is chosen among the pairs that
+       pass the checks, in this order: tm, gc_clamp, self_complementarity,
+       unique and background. A check that no pair passes is skipped and
+       listed in the diagnostics.
+
+    Parameters
+    ----------
+    templates : iterable of Dseqrecord
+        The sequences to amplify.
+
+    constraints : dict, optional
+        Any of these keys, the default values are given in parenthesis.
+
+        ========================  ===============================================================
+        target_tm                 target tm of both primers (55.0)
+        min_length, max_length    length range of the primers (14, 40)
+        gc_clamp                  least number of G or C of the last two bases at the 3' end (1)
+        max_self_complementarity  longest 3' end that can anneal to the primer itself (4)
+        background                a :class:`pydna.offtarget.OfftargetIndex`, a
+                                  :class:`pydna.templateindex.TemplateIndex` or Dseqrecord
+                                  of other sequences in the PCR, like a genome (None)
+        max_background_sites      largest number of sites in the background for a primer (1)
+        background_mismatches     mismatches allowed in the 3' end of a primer at a site in
+                                  an OfftargetIndex background (1)
+        fprimerc, rprimerc        primer concentrations in nM (1000.0, 1000.0)
+        saltc                     salt concentration in mM (50.0)
+        limit                     the limit for primer annealing (13)
+        formula                   tm formula (:func:`pydna.tm.tmbresluc`)
+        ========================  ===============================================================
+
+    n_jobs : int, optional
+        Number of processes used. -1 means one per CPU. With an executor,
+        the templates are split in chunks for n_jobs workers, or for one
+        worker per CPU if n_jobs is not given.
+
+    executor : concurrent.futures.Executor, optional
+        An executor used instead of starting new processes. It is not shut
+        down.
+
+    Returns
+    -------
+    results : iterator of (Amplicon, dict) tuples
+        The dict holds the diagnostics of the design: the tm, gc clamp,
+        self complementarity and background sites of both primers, the
+        number of PCR products from the template, the checks that could
+        not be met ("failed") and if all checks passed ("passed"). If no
+        primers could be made, the Amplicon is None and the dict has an
+        "error".
+
+    Examples
+    --------
+    >>> from pydna.dseqrecord import Dseqrecord
+    >>> from pydna.design import design_many
+    >>> t = Dseqrecord("atgactgctaacccttccttggtgttgaacaagatcgacgacatttcgttcgaaacttacgatg", name="orf1")
+    >>> amplicon, diagnostics = next(design_many([t]))
+    >>> amplicon.forward_primer
+    f64 17-mer:5'-atgactgctaacccttc-3'
+    >>> amplicon.reverse_primer
+    r64 17-mer:5'-catcgtaagtttcgaac-3'
+    >>> diagnostics["passed"], diagnostics["products"], diagnostics["gc_clamp"]
+    (True, 1, (1, 1))
+    '''
+    if _np is None:
+        raise ImportError("design_many needs numpy.")
+    c = dict(_default_constraints)
+    c.update(constraints or {})
+    unknown = set(c) - set(_default_constraints)
+    if unknown:
+        raise ValueError("Unknown constraints: {}".format(", ".join(sorted(unknown))))
+    if c["min_length"] < c["limit"]:
+        raise ValueError("min_length can not be smaller than limit.")
+    if c["background"] is not None and not hasattr(c["background"], "sites"):
+        from pydna.templateindex import TemplateIndex
+        c["background"] = TemplateIndex(c["background"], c["limit"])
+    templates = [t if hasattr(t, "seq") else _Dseqrecord(t) for t in templates]
+    return _design_many(templates, c, n_jobs, executor)
+
+
+def _design_many(templates, c, n_jobs, executor):
+    # the generator returned by design_many, after the constraints are checked
+    pool = executor
+    if pool is None and n_jobs not in (None, 0, 1):
+        pool = _futures.ProcessPoolExecutor(n_jobs if n_jobs > 0 else None)
+    try:
+        if pool is None:
+            for template in templates:
+                yield _design_one(template, c)
+        else:
+            workers = n_jobs if n_jobs and n_jobs > 0 else _os.cpu_count() or 1
+            size = max(1, len(templates) // (4*workers))
+            chunks = [templates[i:i+size] for i in range(0, len(templates), size)]
+            for results in pool.map(_design_chunk, chunks, _itertools.repeat(c)):
+                yield from results
+    finally:
+        if pool is not executor:
+            pool.shutdown()
 
 
 def assembly_fragments(f, overlap=35, maxlink=40):    
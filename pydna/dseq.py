@@ -15,6 +15,8 @@ from collections.abc import Iterable as _Iterable
 
 import copy                 as _copy
 import itertools            as _itertools
+import bisect               as _bisect
+import collections          as _collections
 
 import sys                  as _sys
 import math                 as _math
@@ -24,9 +26,15 @@ from Bio.Seq                import Seq               as _Seq
 
 from pydna._pretty import pretty_str as _pretty_str
 from pydna.utils  import seguid      as _seg
+from pydna.cache  import digest      as _digest
 from pydna.utils  import rc          as _rc
+from pydna.utils  import _bytes_complement_table
 from pydna.utils  import flatten     as _flatten
 from pydna.common_sub_strings import common_sub_strings as _common_sub_strings
+from pydna.restriction import search          as _search
+from pydna.restriction import _strand_sites
+from pydna.restriction import _fragment_cuts
+from pydna.restriction import _cuts
 
 from Bio.Restriction import RestrictionBatch as _RestrictionBatch
 from Bio.Restriction import CommOnly
@@ -302,6 +310,9 @@ class Dseq(_Seq):
 
     '''
 
+    __slots__ = ("_watson", "_crick", "_buffer", "_wspan", "_cspan", "_todata", "_ovhg",
+                 "_linear", "_circular", "length", "pos", "alphabet")
+
     def __init__( self,
                   watson,
                   crick         = None,
@@ -311,11 +322,14 @@ class Dseq(_Seq):
                   pos           = 0,
                   alphabet      = _IUPACAmbiguousDNA() ):
 
+        if type(watson) is not _pretty_str:
+            watson = _pretty_str(watson)
+
         if crick is None:
             if ovhg is None:
-                crick = _rc(watson)
+                # the crick strand is made from watson when it is first used
                 ovhg = 0
-                self.todata = watson     
+                todata = watson     
             else: # ovhg given, but no crick strand
                 raise ValueError("ovhg defined without crick strand!")                
         else: # crick strand given
@@ -336,36 +350,182 @@ class Dseq(_Seq):
                 sns = ((ovhg*" ")  + _pretty_str(watson))
                 asn = ((-ovhg*" ") + _pretty_str(_rc(crick)))
 
-                self.todata = "".join([a.strip() or b.strip() for a,b in _itertools.zip_longest(sns,asn, fillvalue=" ")])
+                todata = "".join([a.strip() or b.strip() for a,b in _itertools.zip_longest(sns,asn, fillvalue=" ")])
 
             else: # ovhg given             
                 if ovhg==0:                    
                     if len(watson)==len(crick):
-                        self.todata = watson
+                        todata = watson
                     elif len(watson)>len(crick):
-                        self.todata = watson                    
+                        todata = watson                    
                     else:
-                        self.todata = watson + _rc(crick[:len(crick)-len(watson)])                   
+                        todata = watson + _rc(crick[:len(crick)-len(watson)])                   
                 elif ovhg>0:                       
                     if ovhg+len(watson) > len(crick):                            
-                        self.todata = _rc(crick[-ovhg:])+watson                            
+                        todata = _rc(crick[-ovhg:])+watson                            
                     else:                            
-                        self.todata = _rc(crick[-ovhg:]) + watson + _rc(crick[: len(crick)-ovhg-len(watson)])
+                        todata = _rc(crick[-ovhg:]) + watson + _rc(crick[: len(crick)-ovhg-len(watson)])
                 else: # ovhg < 0
                     if -ovhg+len(crick) > len(watson):
-                        self.todata = watson+_rc(crick[:-ovhg+len(crick)-len(watson)])                            
+                        todata = watson+_rc(crick[:-ovhg+len(crick)-len(watson)])                            
                     else:
-                        self.todata = watson
+                        todata = watson
                         
         self._circular = bool(circular) and bool(linear)^bool(circular) or linear==False and circular is None
         self._linear   = not self._circular
 
-        self.watson = _pretty_str(watson)
-        self.crick  = _pretty_str(crick)
-        self.length = max(len(watson)+max(0,ovhg), len(crick)+max(0,-ovhg))
+        self._buffer = None
+        self._watson = watson
+        if crick is None:
+            self._crick = None
+            self.length = len(watson)
+        else:
+            self._crick = _pretty_str(crick)
+            self.length = max(len(watson)+max(0,ovhg), len(crick)+max(0,-ovhg))
         self._ovhg  = ovhg
         self.pos    = pos
-        _Seq.__init__(self, _pretty_str(self.todata), alphabet)
+        _Seq.__init__(self, todata if type(todata) is _pretty_str else _pretty_str(todata), alphabet)
+
+
+    @classmethod
+    def frombuffer(cls, buffer, linear=None, circular=None):
+        '''Returns a blunt Dseq object stored in a buffer of ASCII bytes.
+
+        The buffer can be bytes, a bytearray, a memoryview or a memory
+        mapped file. It is not copied, the sequence takes about one byte
+        per bp and the strands are only made into strings when they are
+        used. Slices are views of the same buffer, so they are made in
+        time proportional to the length of the slice.
+
+        Parameters
+        ----------
+        buffer : bytes-like object or str
+            The watson strand.
+
+        linear : bool, optional
+            True indicates that sequence is linear, False that it is circular.
+
+        circular : bool, optional
+            True indicates that sequence is circular, False that it is linear.
+
+        Examples
+        --------
+        >>> from pydna.dseq import Dseq
+        >>> chromosome = bytearray(b"ggatccAAAgaattc")
+        >>> a = Dseq.frombuffer(chromosome)
+        >>> a
+        Dseq(-15)
+        ggatccAAAgaattc
+        cctaggTTTcttaag
+        >>> b = a[6:9]
+        >>> b.watson
+        'AAA'
+        >>> chromosome[7:8] = b"G"
+        >>> b.watson
+        'AGA'
+        '''
+        if isinstance(buffer, str):
+            buffer = buffer.encode("ascii")
+        buffer = memoryview(buffer)
+        return cls._fromview(buffer, (0, len(buffer)), (0, len(buffer)),
+                             bool(circular) and bool(linear)^bool(circular) or linear==False and circular is None)
+
+
+    @classmethod
+    def _fromview(cls, buffer, wspan, cspan, circular):
+        # wspan is the watson strand and cspan the reverse complement of
+        # the crick strand, both as (start, stop) in buffer.
+        obj = cls.__new__(cls)
+        obj._buffer = buffer
+        obj._wspan  = wspan
+        obj._cspan  = cspan
+        obj._watson = obj._crick = obj._todata = None
+        obj._circular = circular
+        obj._linear   = not circular
+        obj.length  = max(wspan[1], cspan[1]) - min(wspan[0], cspan[0])
+        obj._ovhg   = wspan[0] - cspan[0]
+        obj.pos     = 0
+        obj.alphabet = _IUPACAmbiguousDNA()
+        return obj
+
+
+    @property
+    def watson(self):
+        '''The watson (upper) strand 5'-3'.'''
+        if self._buffer is None:
+            return self._watson
+        return _pretty_str(self._buffer[self._wspan[0]:self._wspan[1]].tobytes().decode("ascii"))
+
+
+    @property
+    def crick(self):
+        '''The crick (lower) strand 5'-3'.'''
+        if self._buffer is None:
+            if self._crick is None:
+                self._crick = _pretty_str(_rc(self._watson))
+            return self._crick
+        return _pretty_str(self._buffer[self._cspan[0]:self._cspan[1]].tobytes().translate(_bytes_complement_table)[::-1].decode("ascii"))
+
+
+    @property
+    def _data(self):
+        if self._buffer is None:
+            return self._todata
+        start, stop = min(self._wspan[0], self._cspan[0]), max(self._wspan[1], self._cspan[1])
+        return _pretty_str(self._buffer[start:stop].tobytes().decode("ascii"))
+
+
+    @_data.setter
+    def _data(self, value):
+        self._todata = value
+
+
+    @property
+    def todata(self):
+        '''The sequence as a string, watson strand and the overhangs of the crick strand.'''
+        return self._data
+
+
+    def __len__(self):
+        if self._buffer is None:
+            return len(self._todata)
+        return self.length
+
+
+    def _state(self):
+        state = self.__dict__.copy()
+        state.update((name, getattr(self, name)) for name in Dseq.__slots__ if hasattr(self, name))
+        return state
+
+
+    def __copy__(self):
+        # copies share the strings or the buffer
+        obj = self.__class__.__new__(self.__class__)
+        obj.__setstate__(self._state())
+        return obj
+
+
+    def __getstate__(self):
+        state = self._state()
+        if self._buffer is not None:
+            # only the part of the buffer used by this sequence is pickled
+            start, stop = min(self._wspan[0], self._cspan[0]), max(self._wspan[1], self._cspan[1])
+            state["_buffer"] = self._buffer[start:stop].tobytes()
+            state["_wspan"] = (self._wspan[0]-start, self._wspan[1]-start)
+            state["_cspan"] = (self._cspan[0]-start, self._cspan[1]-start)
+        return state
+
+
+    def __setstate__(self, state):
+        if "watson" in state: # pickled by an earlier version of pydna
+            state["_watson"], state["_crick"] = state.pop("watson"), state.pop("crick")
+            state["_todata"] = state.pop("_data")
+            state.pop("todata", None)
+            state["_buffer"] = None
+        for name, value in state.items():
+            setattr(self, name, value)
+        if self._buffer is not None and not isinstance(self._buffer, memoryview):
+            self._buffer = memoryview(self._buffer)
 
 
     @property
@@ -458,6 +618,8 @@ class Dseq(_Seq):
         '''Returns a subsequence. This method is used by the slice notation'''
 
         if self.linear:
+            if isinstance(sl, slice) and sl.step in (None, 1):
+                return self._linear_slice(sl)
             sns = (self._ovhg*" " + self.watson)[sl]
             asn = (-self._ovhg*" " + self.crick[::-1])[sl]
             ovhg = max((len(sns) - len(sns.lstrip()),
@@ -470,6 +632,14 @@ class Dseq(_Seq):
                        sl.step)
             if sl.start>len(self) or sl.stop>len(self):
                 return Dseq("")
+            if self._buffer is not None and sl.step in (None, 1) and sl.start>=0 and sl.stop>0:
+                offset = self._wspan[0]
+                if sl.start<sl.stop:
+                    span = (offset+sl.start, offset+sl.stop)
+                    return Dseq._fromview(self._buffer, span, span, False)
+                buffer = memoryview(self._buffer[offset+sl.start:self._wspan[1]].tobytes() +
+                                    self._buffer[offset:offset+sl.stop].tobytes())
+                return Dseq._fromview(buffer, (0, len(buffer)), (0, len(buffer)), False)
             if sl.start<sl.stop:
                 return Dseq(self.watson[sl],self.crick[::-1][sl][::-1], ovhg=0, linear=True)
             else:
@@ -486,6 +656,44 @@ class Dseq(_Seq):
                 return Dseq(w, c, ovhg=0, linear=True)
 
 
+    def _linear_slice(self, sl):
+        # Slices the watson and crick strands as if they were padded with
+        # spaces for the overhangs (see above), but copies only the slice.
+        if self._buffer is None:
+            nw = len(self._watson)
+            nc = nw if self._crick is None else len(self._crick)
+        else:
+            nw, nc = self._wspan[1]-self._wspan[0], self._cspan[1]-self._cspan[0]
+        ws, cs = max(0, self._ovhg), max(0, -self._ovhg)
+        aw, bw, _ = sl.indices(ws+nw)
+        ac, bc, _ = sl.indices(cs+nc)
+        wlo, whi = max(aw, ws)-ws, max(bw, ws)-ws
+        clo, chi = max(ac, cs)-cs, max(bc, cs)-cs   # in the reversed crick strand
+        if whi>wlo:
+            leadw = max(0, ws-aw)
+        else:
+            wlo, whi, leadw = 0, 0, max(0, bw-aw)
+        if chi>clo:
+            leadc = max(0, cs-ac)
+        else:
+            clo, chi, leadc = 0, 0, max(0, bc-ac)
+        ovhg = max((leadw, -leadc), key=abs)
+        if self._buffer is None:
+            if self._crick is None:
+                if (wlo, whi) == (clo, chi):
+                    return Dseq(self._watson[wlo:whi], linear=True)
+                return Dseq(self._watson[wlo:whi], _rc(self._watson[clo:chi]), ovhg=ovhg, linear=True)
+            return Dseq(self._watson[wlo:whi], self._crick[nc-chi:nc-clo], ovhg=ovhg, linear=True)
+        wspan = (self._wspan[0]+wlo, self._wspan[0]+whi)
+        cspan = (self._cspan[0]+clo, self._cspan[0]+chi)
+        if (whi>wlo and chi>clo and wspan[0]-cspan[0] == ovhg and
+            max(wspan[0], cspan[0]) <= min(wspan[1], cspan[1])):
+            return Dseq._fromview(self._buffer, wspan, cspan, False)
+        return Dseq(self._buffer[wspan[0]:wspan[1]].tobytes().decode("ascii"),
+                    self._buffer[cspan[0]:cspan[1]].tobytes().translate(_bytes_complement_table)[::-1].decode("ascii"),
+                    ovhg=ovhg, linear=True)
+
+
     def __eq__( self, other ):
         '''Compare to another Dseq object OR an object that implements
         watson, crick and ovhg properties. This comparison is case
@@ -583,6 +791,7 @@ class Dseq(_Seq):
     def reverse_complement(self):
         '''Returns a Dseq object where watson and crick have switched
         places. This represents the same double stranded sequence.
+        A new Dseq is returned each time.
 
         Examples
         --------
@@ -600,6 +809,11 @@ class Dseq(_Seq):
         >>>
 
        '''
+        if self._buffer is not None:
+            (ws, we), (cs, ce) = self._wspan, self._cspan
+            start, stop = min(ws, cs), max(we, ce)
+            buffer = memoryview(self._buffer[start:stop].tobytes().translate(_bytes_complement_table)[::-1])
+            return Dseq._fromview(buffer, (stop-ce, stop-cs), (stop-we, stop-ws), self.circular)
         ovhg = len(self.watson) - len(self.crick) + self._ovhg
         return Dseq(self.crick, self.watson, ovhg=ovhg, circular = self.circular)
 
@@ -1080,7 +1294,7 @@ class Dseq(_Seq):
     def no_cutters(self, batch = CommOnly):
         """Returns the enzymes in a RestrictionBatch that do **not** 
         cut the sequence."""
-        ana = batch.search(self)
+        ana = _search(self, batch)
         ncut = {enz:sitelist for (enz,sitelist) in ana.items() if not sitelist}
         return _RestrictionBatch(ncut)
     
@@ -1103,7 +1317,7 @@ class Dseq(_Seq):
     def n_cutters(self, n=3, batch = CommOnly):
         """Returns the enzymes in a RestrictionBatch that cut the sequence 
         n times."""
-        ana = batch.search(self)
+        ana = _search(self, batch)
         ncut = {enz:sitelist for (enz,sitelist) in ana.items() if len(sitelist)==n}
         return _RestrictionBatch(ncut)
     
@@ -1111,7 +1325,7 @@ class Dseq(_Seq):
     def cutters(self, batch = CommOnly):
         """Returns the enzymes in a RestrictionBatch that cut the sequence 
         at least once."""
-        ana = batch.search(self)
+        ana = _search(self, batch)
         ncut = {enz:sitelist for (enz,sitelist) in ana.items() if sitelist}
         return _RestrictionBatch(ncut)
 
@@ -1136,6 +1350,14 @@ class Dseq(_Seq):
         return _seg( _pretty_str(o) + w + "|" + c)
 
 
+    def __pydna_cache_key__(self):
+        """Returns the key used by :func:`pydna.utils.memorize` for this Dseq.
+
+        Unlike the SEGUID, the key is case sensitive and different for
+        the reverse complement, since both are kept in results."""
+        return _digest("Dseq", self.watson, self.crick, self._ovhg, self.circular)
+
+
     def cut(self, *enzymes):
         '''Returns a list of linear Dseq fragments produced in the digestion.
         If there are no cuts, an empty list is returned.
@@ -1183,28 +1405,32 @@ class Dseq(_Seq):
         '''
 
         if len(enzymes)==1 and hasattr(enzymes[0], "intersection"):
-            enzymecuts=[]
-            for e in enzymes[0]:
-                cuts=e.search(self.mung())
-                enzymecuts.append((cuts, e))
-            enzymecuts.sort()
+            ana = _search(self.mung(), enzymes[0])
+            enzymecuts = sorted((ana[e], e) for e in enzymes[0])
             enzymes=[e for (c,e) in enzymecuts]
         else:        
             enzymes = list(dict.fromkeys(_flatten(enzymes)))  # flatten
-        pad = "n"*50
+        # the strands are scanned once, the fragments are cut at the sites
+        # found inside of them. Fragments of circular sequences are parts
+        # of the strands joined with themselves.
         if self.linear:
-            frags=[self]    
+            wsites = _strand_sites(self.watson, enzymes)
+            csites = _strand_sites(self.crick,  enzymes)
+            frags=[(self, 0, 0)]
         else:
             l=len(self)
+            wsites = _strand_sites(self.watson*2, enzymes)
+            csites = _strand_sites(self.crick*2,  enzymes)
             for e in enzymes:
-                wpos = [x-len(pad)-1 for x in e.search(_Seq(pad+self.watson + self.watson[:e.size-1])+pad)]
-                cpos = [x-len(pad)-1 for x in e.search(_Seq(pad+self.crick  +  self.crick[:e.size-1])+pad)]
+                # cut positions over the origin are not moved into the sequence
+                wpos = [x-1 for x in _cuts(e, tuple([s for s in st if s<=l] for st in wsites[e]), l, False, drop=False)]
+                cpos = [x-1 for x in _cuts(e, tuple([s for s in st if s<=l] for st in csites[e]), l, False, drop=False)]
                 for w,c in _itertools.product(wpos, cpos):
                     if w%len(self) == (self.length - c + e.ovhg)%len(self):
-                        frags = [ Dseq( self.watson[w%l:] + self.watson[:w%l], 
-                                        self.crick[c%l:]  + self.crick[:c%l], 
-                                        ovhg=e.ovhg, 
-                                        pos=w) ]
+                        frags = [ (Dseq( self.watson[w%l:] + self.watson[:w%l], 
+                                         self.crick[c%l:]  + self.crick[:c%l], 
+                                         ovhg=e.ovhg, 
+                                         pos=w), w%l, c%l) ]
                         break
                 else:
                     continue
@@ -1213,38 +1439,43 @@ class Dseq(_Seq):
                frags = []
         newfrags=[]
         for enz in enzymes:
-            for frag in frags:           
-                
-                ws = [x-1 for x in enz.search(_Seq(frag.watson)+"N")]                
-                cs = [x-1 for x in enz.search(_Seq(frag.crick )+"N")]
-
-                sitepairs = [(sw, sc) for sw, sc in _itertools.product(ws,cs[::-1])
-                             if (sw + max(0, frag.ovhg) -
-                             max(0, enz.ovhg)
-                             ==
-                             len(frag.crick)-sc -
-                             min(0, frag.ovhg) +
-                             min(0, enz.ovhg))]
-                
+            # only the fragments with a site of enz on the watson strand are cut
+            offsets = [woffset for frag, woffset, coffset in frags]
+            hits = {_bisect.bisect_left(offsets, s)-1 for s in _itertools.chain(*wsites[enz])}
+            for i, (frag, woffset, coffset) in enumerate(frags):
+                if i not in hits:
+                    newfrags.append((frag, woffset, coffset))
+                    continue
+
+                ws = [x-1 for x in _fragment_cuts(wsites[enz], enz, woffset, len(frag.watson))]
+                cs = _collections.Counter(x-1 for x in _fragment_cuts(csites[enz], enz, coffset, len(frag.crick)))
+
+                # the crick cut that matches each watson cut
+                shift = (len(frag.crick) - min(0, frag.ovhg) + min(0, enz.ovhg)
+                         - max(0, frag.ovhg) + max(0, enz.ovhg))
+                sitepairs = [(sw, shift-sw) for sw in ws for n in range(cs[shift-sw])]
+                if not sitepairs:
+                    newfrags.append((frag, woffset, coffset))
+                    continue
 
                 sitepairs.append( (self.length, 0) )
 
                 w2, c1 = sitepairs[0]
             
-                newfrags.append(Dseq(frag.watson[:w2],
-                                     frag.crick[c1:], 
-                                     ovhg=frag.ovhg, 
-                                     pos=frag.pos))
+                newfrags.append((Dseq(frag.watson[:w2],
+                                      frag.crick[c1:], 
+                                      ovhg=frag.ovhg, 
+                                      pos=frag.pos), woffset, coffset+c1))
 
                 for (w1, c2), (w2, c1)  in zip(sitepairs[:-1], sitepairs[1:]):
-                    newfrags.append(Dseq(frag.watson[w1:w2], 
-                                         frag.crick[c1:c2], 
-                                         ovhg = enz.ovhg, 
-                                         pos= frag.pos + w1-max(0,enz.ovhg)))
+                    newfrags.append((Dseq(frag.watson[w1:w2], 
+                                          frag.crick[c1:c2], 
+                                          ovhg = enz.ovhg, 
+                                          pos= frag.pos + w1-max(0,enz.ovhg)), woffset+w1, coffset+c1))
 
             frags=newfrags
             newfrags=[]
-        return tuple(frags) if frags else (self,)
+        return tuple(frag for frag, woffset, coffset in frags) if frags else (self,)
 
 if __name__=="__main__":
     import os as _os
@@ -44,10 +44,14 @@ from pydna.utils  import seguid   as _seg
 from pydna.utils  import cseguid  as _cseg
 from pydna.utils  import rc       as _rc
 from pydna.utils  import memorize as _memorize
+from pydna.cache  import digest   as _digest
 from pydna.utils  import flatten     as _flatten
 
 from pydna._pretty import pretty_str as _pretty_str
 from pydna.dseq import Dseq as _Dseq
+from pydna.restriction import search as _search
+from pydna.packed import dumps as _dumps
+from pydna.packed import loads as _loads
 
 from Bio.Restriction import RestrictionBatch as _RestrictionBatch
 from Bio.Restriction import CommOnly
@@ -171,7 +175,7 @@ class Dseqrecord(_SeqRecord):
                               *args,
                               **kwargs )       
         # record is a Dseq object ?
-        elif hasattr(record, "watson"):
+        elif isinstance(record, _Dseq):
             if record.circular and linear:
                 record = record[:]
             elif record.linear and circular:
@@ -193,7 +197,7 @@ class Dseqrecord(_SeqRecord):
                 setattr(self, key, value )
             record.letter_annotations = {}
             # record.seq is a Dseq object ?
-            if hasattr(record.seq, "watson"):
+            if isinstance(record.seq, _Dseq):
                 new_seq = _copy.copy(record.seq)
                 if new_seq.circular and linear:
                     new_seq = new_seq[:]
@@ -753,6 +757,29 @@ class Dseqrecord(_SeqRecord):
         return answer
 
 
+    def __pydna_cache_key__(self):
+        '''Returns the key used by :func:`pydna.utils.memorize` for this record.'''
+        return _digest(super().__pydna_cache_key__(), self.n)
+
+
+    def __reduce__(self):
+        # pickled in the packed binary format, see pydna.packed
+        return (_loads, (_dumps(self),))
+
+
+    def __copy__(self):
+        obj = self.__class__.__new__(self.__class__)
+        obj.__dict__.update(self.__dict__)
+        return obj
+
+
+    def __deepcopy__(self, memo):
+        obj = self.__class__.__new__(self.__class__)
+        memo[id(self)] = obj
+        obj.__dict__.update(_copy.deepcopy(self.__dict__, memo))
+        return obj
+
+
     def __eq__( self, other ):
         try:
             if self.seq == other.seq and str(self.__dict__) == str(other.__dict__):
@@ -879,7 +906,9 @@ class Dseqrecord(_SeqRecord):
     def number_of_cuts(self, *enzymes):
         """ This method returns the number of cuts by digestion with the Restriction enzymes contained in 
         the iterable."""
-        return sum([len(enzyme.search(self.seq)) for enzyme in _flatten(enzymes)]) # flatten
+        enzymes = _flatten(enzymes) # flatten
+        ana = _search(self.seq, enzymes)
+        return sum([len(ana[enzyme]) for enzyme in enzymes])
 
 
     def reverse_complement(self):
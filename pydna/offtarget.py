@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright 2013-2018 by Björn Johansson.  All rights reserved.
+# This code is part of the Python-dna distribution and governed by its
+# license.  Please see the LICENSE.txt file that should have been included
+# as part of this package.
+
+'''This module provides the :class:`OfftargetIndex` class for finding where
+primers may anneal in background sequences, like the genome of the host
+that a PCR template is amplified from.
+
+The 3' end (the seed) of each primer is searched for on both strands of
+all background sequences, allowing for mismatches. All primers and all
+sequences with up to the given number of mismatches are searched for at
+the same time in a sorted k-mer index of the background. The index can be
+stored as memory mapped numpy files, so that it is only made once for a
+genome. This module needs numpy.'''
+
+import os          as _os
+import tempfile    as _tempfile
+import itertools   as _itertools
+import collections as _collections
+import logging     as _logging
+_module_logger = _logging.getLogger("pydna."+__name__)
+
+import numpy as _np
+
+from pydna.amplify import _kmer_index
+from pydna.amplify import _head_codes
+from pydna.utils   import rc    as _rc
+from pydna.utils   import seguid as _seg
+
+Site = _collections.namedtuple("Site", "sequence position strand mismatches")
+Site.__doc__ = '''A possible annealing site of a primer in an :class:`OfftargetIndex`.
+
+sequence is the name of the background sequence, position the start of the
+seed on its forward strand, strand 1 if the seed is found on the forward
+strand and -1 if on the reverse strand, and mismatches the number of
+mismatches in the seed.'''
+
+
+def _masks(k, mismatches):
+    # xor masks that change the given number of nucleotides in a k-mer code,
+    # and the number of changed nucleotides for each mask
+    masks, counts = [0], [0]
+    for m in range(1, mismatches+1):
+        for positions in _itertools.combinations(range(k), m):
+            for changes in _itertools.product((1, 2, 3), repeat=m):
+                mask = 0
+                for p, c in zip(positions, changes):
+                    mask |= c << 2*(k-1-p)
+                masks.append(mask)
+                counts.append(m)
+    return _np.array(masks, dtype=_np.uint64), _np.array(counts, dtype=_np.int8)
+
+
+class OfftargetIndex(object):
+    '''Seed index of the forward strand of one or more background sequences.
+
+    Parameters
+    ----------
+    records : iterable of Dseqrecord, SeqRecord or str
+        The background sequences, for example the chromosomes of a genome
+        returned by :func:`pydna.parsers.parse` or
+        :meth:`pydna.genbank.Genbank.nucleotide`.
+
+    seed : int, optional
+        Length of the 3' end of the primers that is searched for, at most 32.
+        The default is the same as the default limit of :class:`pydna.amplify.Anneal`.
+
+    directory : str, optional
+        If given, the index is read from this directory if it was stored
+        there before, otherwise it is made and stored there. The arrays are
+        memory mapped, so several processes can share the same index.
+
+    Examples
+    --------
+    >>> from pydna.dseqrecord import Dseqrecord
+    >>> from pydna.offtarget import OfftargetIndex
+    >>> chromosome = Dseqrecord("ttgacctgatcgatcaagggtattttaatcgatcatgacggtcaatagg", name="chrI")
+    >>> index = OfftargetIndex([chromosome], seed=10)
+    >>> index
+    OfftargetIndex(1 sequences, 49 bp, seed=10)
+    >>> index.sites(["aaaactgatcgatcaa"])
+    [[Site(sequence='chrI', position=7, strand=1, mismatches=0)]]
+    >>> for site in index.sites(["aaaactgatcgatcaa"], mismatches=1)[0]:
+    ...     print(site)
+    Site(sequence='chrI', position=5, strand=-1, mismatches=1)
+    Site(sequence='chrI', position=7, strand=1, mismatches=0)
+    Site(sequence='chrI', position=24, strand=-1, mismatches=1)
+    >>> index.counts(["aaaactgatcgatcaa", "gggggggggggg"], mismatches=1)
+    array([[1, 2],
+           [0, 0]])
+    >>> index.screen(["aaaactgatcgatcaa", "gggggggggggg"], mismatches=1)
+    [False, True]
+    '''
+
+    def __init__(self, records, seed=13, directory=None):
+        if not 0 < seed <= 32:
+            raise ValueError("seed has to be between 1 and 32, not {}".format(seed))
+        if hasattr(records, "seq") or isinstance(records, str):
+            records = [records]
+        self.seed = seed
+        self.directory = directory
+        self.names, self.lengths, texts = [], [], []
+        for i, record in enumerate(records):
+            self.names.append(str(getattr(record, "name", "seq{}".format(i))))
+            seq = getattr(record, "seq", record)
+            text = str(getattr(seq, "watson", seq)).upper()
+            self.lengths.append(len(text))
+            if getattr(seq, "circular", False):
+                # seeds across the origin
+                text += text[:seed-1]
+            texts.append(text)
+        self.starts = _np.cumsum([0] + [len(t)+1 for t in texts[:-1]]).astype(_np.int64)
+        self.key = "{}_{}".format(_seg("|".join(self.names + texts)), seed)
+        self.codes = self.positions = None
+        if directory:
+            self._load()
+        if self.codes is None:
+            # the sequences are joined with N so that no seed spans two of them
+            self.codes, self.positions = _kmer_index("N".join(texts), seed)
+            if directory:
+                self._save()
+
+    def _paths(self):
+        return [_os.path.join(self.directory, "{}.{}.npy".format(self.key, name)) for name in ("codes", "positions")]
+
+    def _load(self):
+        paths = self._paths()
+        if all(_os.path.exists(p) for p in paths):
+            self.codes, self.positions = [_np.load(p, mmap_mode="r") for p in paths]
+            _module_logger.info("loaded offtarget index %s", self.key)
+
+    def _save(self):
+        _os.makedirs(self.directory, exist_ok=True)
+        for path, array in zip(self._paths(), (self.codes, self.positions)):
+            fd, tmp = _tempfile.mkstemp(dir=self.directory, suffix=".npy")
+            with _os.fdopen(fd, "wb") as f:
+                _np.save(f, array)
+            _os.replace(tmp, path)
+        _module_logger.info("saved offtarget index %s", self.key)
+        self._load()
+
+    def _search(self, primers, mismatches):
+        # arrays of primer, position on the joined forward strand, strand and
+        # mismatches of all seed matches, each site once with its fewest mismatches
+        masks, counts = _masks(self.seed, mismatches)
+        queries, owners, strands = [], [], []
+        for i, primer in enumerate(primers):
+            seed = str(getattr(primer, "seq", primer))[-self.seed:].upper()
+            if len(seed) < self.seed:
+                continue
+            for strand, text in ((1, seed), (-1, _rc(seed))):
+                codes = _head_codes(text)
+                if codes is None:
+                    _module_logger.warning("primer %s has too many ambiguous nucleotides", i)
+                    continue
+                queries.extend(codes)
+                owners.extend([i]*len(codes))
+                strands.extend([strand]*len(codes))
+        queries = _np.array(queries, dtype=_np.uint64)
+        query = (queries[:, None] ^ masks[None, :]).ravel()
+        left = _np.searchsorted(self.codes, query, side="left")
+        right = _np.searchsorted(self.codes, query, side="right")
+        n = right - left
+        total = int(n.sum())
+        # expand the index ranges to one row per site
+        rows = _np.repeat(_np.arange(len(query)), n)
+        first = _np.repeat(left - _np.concatenate(([0], _np.cumsum(n)[:-1])), n)
+        positions = _np.asarray(self.positions)[first + _np.arange(total)] if total else _np.zeros(0, dtype=_np.int64)
+        owner = _np.repeat(_np.array(owners, dtype=_np.int64), len(masks))[rows]
+        strand = _np.repeat(_np.array(strands, dtype=_np.int8), len(masks))[rows]
+        mm = _np.tile(counts, len(queries))[rows]
+        order = _np.lexsort((mm, positions, strand, owner))
+        owner, strand, positions, mm = owner[order], strand[order], positions[order], mm[order]
+        keep = _np.ones(len(owner), dtype=bool)
+        keep[1:] = (owner[1:] != owner[:-1]) | (strand[1:] != strand[:-1]) | (positions[1:] != positions[:-1])
+        return owner[keep], positions[keep], strand[keep], mm[keep]
+
+    def sites(self, primers, mismatches=0):
+        '''Returns a list of the :class:`Site` objects of each primer, sorted
+        by sequence, position and strand.
+
+        Parameters
+        ----------
+        primers : iterable of str, Seq, SeqRecord or Primer objects
+            Primer sequences 5'-3'.
+
+        mismatches : int, optional
+            Largest number of mismatches in the seed.
+        '''
+        primers = list(primers)
+        owner, positions, strand, mm = self._search(primers, mismatches)
+        sequence = _np.searchsorted(self.starts, positions, side="right") - 1
+        local = positions - self.starts[sequence]
+        result = [[] for p in primers]
+        order = _np.lexsort((strand, local, sequence, owner))
+        for i in order.tolist():
+            s = int(sequence[i])
+            result[owner[i]].append(Site(self.names[s], int(local[i]), int(strand[i]), int(mm[i])))
+        return result
+
+    def counts(self, primers, mismatches=0):
+        '''Returns an array with a row for each primer with the number of
+        sites with 0, 1 ... mismatches mismatches.'''
+        primers = list(primers)
+        owner, positions, strand, mm = self._search(primers, mismatches)
+        result = _np.zeros((len(primers), mismatches+1), dtype=int)
+        _np.add.at(result, (owner, mm.astype(_np.int64)), 1)
+        return result
+
+    def screen(self, primers, mismatches=1, max_sites=1):
+        '''Returns a list of booleans, True for the primers with at most
+        max_sites sites with up to mismatches mismatches.
+
+        The default allows one site, since primers for a sequence that is
+        part of the background anneal there.'''
+        return (self.counts(primers, mismatches).sum(axis=1) <= max_sites).tolist()
+
+    def rank(self, primers, mismatches=1):
+        '''Returns the primers sorted by their sites in the background. Primers
+        with fewer perfect sites come first, then the primers with fewer sites
+        with one mismatch and so on.'''
+        primers = list(primers)
+        counts = self.counts(primers, mismatches)
+        order = _np.lexsort(counts.T[::-1]) if len(primers) else []
+        return [primers[i] for i in order]
+
+    def __len__(self):
+        return sum(self.lengths)
+
+    def __repr__(self):
+        return "OfftargetIndex({} sequences, {} bp, seed={})".format(len(self.names), len(self), self.seed)
+
+    def __getstate__(self):
+        # stored indices are read from disk again instead of being pickled
+        state = self.__dict__.copy()
+        if self.directory:
+            state["codes"] = state["positions"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.codes is None:
+            self._load()
+
+
+if __name__=="__main__":
+    cached = _os.getenv("pydna_cached_funcs", "")
+    _os.environ["pydna_cached_funcs"]=""
+    import doctest
+    doctest.testmod(verbose=True, optionflags=doctest.ELLIPSIS)
+    _os.environ["pydna_cached_funcs"]=cached
@@ -0,0 +1,613 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright 2013-2018 by Björn Johansson.  All rights reserved.
+# This code is part of the Python-dna distribution and governed by its
+# license.  Please see the LICENSE.txt file that should have been included
+# as part of this package.
+
+'''This module provides a compact binary format for :class:`pydna.dseq.Dseq`
+and :class:`pydna.dseqrecord.Dseqrecord` objects, including subclasses like
+:class:`pydna.amplicon.Amplicon`, :class:`pydna.contig.Contig` and
+:class:`pydna.genbankfile.GenbankFile`.
+
+The sequence is stored with two bits per nucleotide if it only contains
+A, C, G and T, and with four bits per nucleotide if it contains other
+IUPAC codes. Lower case stretches are stored as a list of intervals.
+Feature locations and qualifiers are stored in tables, where all strings
+are kept once in a common string table. Annotations and the other
+attributes of a record, like the template of an Amplicon, are pickled.
+
+Dseqrecords are pickled in this format, so it is also used by the pydna
+cache and when records are sent to other processes.
+
+:func:`dumps` and :func:`dump` write one sequence or a list of sequences.
+:func:`loads` and :func:`load` read them back, and :class:`PackedFile`
+reads single records from a memory mapped file made by :func:`dump`.
+
+Examples
+--------
+>>> from pydna.dseqrecord import Dseqrecord
+>>> from pydna.packed import dumps, loads
+>>> record = Dseqrecord("GGATCCaaaGAATTC", name="myseq")
+>>> record.add_feature(0, 6, label="BamHI")
+>>> data = dumps(record)
+>>> copy = loads(data)
+>>> copy.name, str(copy.seq), copy.features[0].qualifiers["label"]
+('myseq', 'GGATCCaaaGAATTC', 'BamHI')
+'''
+
+import io          as _io
+import bisect      as _bisect
+import re          as _re
+import mmap        as _mmap
+import struct      as _struct
+import pickle      as _pickle
+import importlib   as _importlib
+import collections as _collections
+import logging     as _logging
+_module_logger = _logging.getLogger("pydna."+__name__)
+
+try:
+    import numpy as _np
+except ImportError:
+    _np = None
+
+from Bio.SeqFeature         import SeqFeature       as _BioSeqFeature
+from Bio.SeqFeature         import FeatureLocation  as _FeatureLocation
+from Bio.SeqFeature         import CompoundLocation as _CompoundLocation
+from Bio.SeqFeature         import ExactPosition    as _ExactPosition
+from Bio.SeqFeature         import BeforePosition   as _BeforePosition
+from Bio.SeqFeature         import AfterPosition    as _AfterPosition
+from Bio.Alphabet.IUPAC     import IUPACAmbiguousDNA as _IUPACAmbiguousDNA
+from pydna.seqfeature       import SeqFeature       as _SeqFeature
+from pydna.dseq             import Dseq             as _Dseq
+from pydna.utils            import rc               as _rc
+from pydna._pretty          import pretty_str       as _pretty_str
+
+_version = 1
+
+# magic, version, kind, encoding, flags, length, watson start and stop,
+# crick start and stop, pos, number of strings, lower case intervals,
+# features, location parts and qualifiers, bytes of packed sequence and
+# pickled attributes
+_header = _struct.Struct("<4sBBBB6q5I2Q")
+_meta = _struct.Struct("<4i")
+_feature = _struct.Struct("<4i4I")
+_part = _struct.Struct("<qqbBBii")
+_qualifier = _struct.Struct("<iiB")
+_file_header = _struct.Struct("<4sB3x")
+_file_footer = _struct.Struct("<QQ4s")
+
+_record_magic = b"PDNR"
+_file_magic = b"PDNF"
+_index_magic = b"PDNI"
+
+# kind
+_DSEQ, _RECORD = 0, 1
+# flags
+_CIRCULAR = 1
+# encodings
+_UTF8, _TWOBIT, _FOURBIT, _ASCII = 0, 2, 4, 8
+
+_iupac = b"ACGTRYSWKMBDHVN-"
+_hexdigits = b"0123456789abcdef"
+_to_twobit = bytes.maketrans(b"ACGT", b"0123")
+_to_fourbit = bytes.maketrans(_iupac, _hexdigits)
+_from_twobit = {h: "ACGT"[i//4]+"ACGT"[i%4] for i, h in enumerate(_hexdigits)}
+_from_fourbit = str.maketrans(_hexdigits.decode("ascii"), _iupac.decode("ascii"))
+_lower = _re.compile("[a-z]+")
+
+_positions = (_ExactPosition, _BeforePosition, _AfterPosition)
+_strands = {1: 1, -1: -1, 0: 0, None: 2}
+_feature_keys = {"location", "type", "id", "qualifiers"}
+_location_keys = {"_start", "_end", "_strand", "ref", "ref_db"}
+
+
+def _encode(data):
+    # Returns encoding, packed bytes and lower case intervals for data.
+    try:
+        upper = data.upper().encode("ascii")
+    except UnicodeEncodeError:
+        return _UTF8, data.encode("utf-8"), []
+    runs = [] if data.encode("ascii") == upper else [m.span() for m in _lower.finditer(data)]
+    if not upper.translate(None, b"ACGT"):
+        padded = upper + b"A"*(-len(upper) % 4)
+        packed = int(padded.translate(_to_twobit), 4).to_bytes(len(padded)//4, "big") if padded else b""
+        return _TWOBIT, packed, runs
+    if not upper.translate(None, _iupac):
+        padded = upper + b"A"*(len(upper) % 2)
+        return _FOURBIT, bytes.fromhex(padded.translate(_to_fourbit).decode("ascii")), runs
+    return _ASCII, data.encode("ascii"), []
+
+
+def _unpack_twobit(packed):
+    # the ACGT string of two bit codes, four per byte
+    if _np is None:
+        return bytes(packed).hex().translate(_from_twobit)
+    codes = _np.frombuffer(packed, dtype=_np.uint8)
+    bases = _np.empty((len(codes), 4), dtype=_np.uint8)
+    for i in range(4):
+        bases[:, i] = (codes >> (6-2*i)) & 3
+    return _np.frombuffer(b"ACGT", dtype=_np.uint8)[bases].tobytes().decode("ascii")
+
+
+def _decode(encoding, packed, runs, start, stop):
+    # Returns data[start:stop] from the packed bytes of data.
+    if encoding == _TWOBIT:
+        text = _unpack_twobit(packed[start//4:(stop+3)//4])[start % 4:start % 4 + stop - start]
+    elif encoding == _FOURBIT:
+        text = bytes(packed[start//2:(stop+1)//2]).hex().translate(_from_fourbit)[start % 2:start % 2 + stop - start]
+    elif encoding == _ASCII:
+        return bytes(packed[start:stop]).decode("ascii")
+    else:
+        return bytes(packed).decode("utf-8")[start:stop]
+    pieces, position = [], start
+    for a, b in runs:
+        if b <= start or a >= stop:
+            continue
+        a, b = max(a, start), min(b, stop)
+        pieces.append(text[position-start:a-start])
+        pieces.append(text[a-start:b-start].lower())
+        position = b
+    if not pieces:
+        return text
+    pieces.append(text[position-start:])
+    return "".join(pieces)
+
+
+class _Strings(object):
+    # the string table of a packed record
+    def __init__(self):
+        self.index = {}
+
+    def __call__(self, text):
+        if text is None:
+            return -1
+        return self.index.setdefault(text, len(self.index))
+
+    def pack(self):
+        blobs = [s.encode("utf-8") for s in self.index]
+        offsets = [0]
+        for blob in blobs:
+            offsets.append(offsets[-1] + len(blob))
+        return _struct.pack("<{}I".format(len(offsets)), *offsets) + b"".join(blobs)
+
+
+def _text(value):
+    return value is None or isinstance(value, str)
+
+
+def _pack_features(features, strings):
+    rows, parts, qualifiers, exotic = [], [], [], {}
+    for i, feature in enumerate(features):
+        location = feature.location
+        simple = (type(feature) in (_SeqFeature, _BioSeqFeature) and
+                  set(feature.__dict__) == _feature_keys and
+                  _text(feature.type) and _text(feature.id) and
+                  isinstance(feature.qualifiers, dict))
+        if simple and location is not None:
+            locations = location.parts if type(location) is _CompoundLocation else [location]
+            simple = all(type(p) is _FeatureLocation and
+                         set(p.__dict__) == _location_keys and
+                         type(p._start) in _positions and
+                         type(p._end) in _positions and
+                         _text(p.ref) and _text(p.ref_db) and
+                         p._strand in _strands for p in locations)
+        if simple:
+            values = []
+            for key, value in feature.qualifiers.items():
+                if not isinstance(key, str):
+                    simple = False
+                    break
+                if type(value) is str:
+                    values.append((key, value, 1))
+                elif type(value) is list and all(type(v) is str for v in value):
+                    values.extend((key, v, 0) for v in value)
+                    if not value:
+                        values.append((key, None, 2))
+                else:
+                    simple = False
+                    break
+        if not simple:
+            exotic[i] = feature
+            rows.append((-3, -1, -1, 0, 0, 0, 0, 0))
+            continue
+        if location is None:
+            operator, locations = -2, []
+        elif type(location) is _CompoundLocation:
+            operator = strings(location.operator)
+        else:
+            operator = -1
+        rows.append((strings(feature.type),
+                     strings(feature.id),
+                     operator,
+                     type(feature) is _SeqFeature,
+                     len(parts), len(locations),
+                     len(qualifiers), len(values)))
+        for p in locations:
+            parts.append((int(p._start), int(p._end), _strands[p._strand],
+                          _positions.index(type(p._start)), _positions.index(type(p._end)),
+                          strings(p.ref), strings(p.ref_db)))
+        for key, value, kind in values:
+            qualifiers.append((strings(key), strings(value), kind))
+    return rows, parts, qualifiers, exotic
+
+
+def _pack(obj):
+    '''Returns a Dseq or Dseqrecord as bytes.'''
+    strings = _Strings()
+    if isinstance(obj, _Dseq):
+        kind, seq = _DSEQ, obj
+    else:
+        kind, seq = _RECORD, obj.seq
+    data = str(seq._data)
+    ovhg = seq.ovhg
+    watson = seq.watson
+    wstart = max(0, ovhg)
+    wspan = (wstart, wstart+len(watson))
+    extras = {}
+    if seq._buffer is not None:
+        cspan = (seq._cspan[0]-min(seq._wspan[0], seq._cspan[0]), seq._cspan[1]-min(seq._wspan[0], seq._cspan[0]))
+    elif seq._crick is None:
+        cspan = wspan
+    else:
+        cstart = max(0, -ovhg)
+        cspan = (cstart, cstart+len(seq._crick))
+        if _rc(data[cspan[0]:cspan[1]]) != seq._crick:
+            # the strands are not complementary
+            extras["crick"] = seq._crick
+    if data[wspan[0]:wspan[1]] != watson:
+        extras["watson"] = watson
+    if seq.length != len(data):
+        extras["length"] = seq.length
+    encoding, packed, runs = _encode(data)
+    if type(seq.alphabet) is not _IUPACAmbiguousDNA:
+        extras["alphabet"] = seq.alphabet
+    if kind == _RECORD:
+        rows, parts, qualifiers, exotic = _pack_features(obj.features, strings)
+        state = obj.__dict__
+        # names that are not strings are pickled with the other attributes
+        names = [k for k in ("name", "id", "description") if _text(state.get(k))]
+        meta = _meta.pack(strings("{}:{}".format(type(obj).__module__, type(obj).__qualname__)),
+                          *(strings(state.get(k)) if k in names else -2 for k in ("name", "id", "description")))
+        extras["keys"] = list(state)
+        extras["state"] = {k: v for k, v in state.items() if k not in ["_seq", "features"] + names}
+        if exotic:
+            extras["features"] = exotic
+    else:
+        rows, parts, qualifiers = [], [], []
+        meta = _meta.pack(-1, -1, -1, -1)
+    extrasbytes = _pickle.dumps(extras, protocol=_pickle.HIGHEST_PROTOCOL) if extras else b""
+    header = _header.pack(_record_magic, _version, kind, encoding,
+                          _CIRCULAR if seq.circular else 0,
+                          len(data), wspan[0], wspan[1], cspan[0], cspan[1], seq.pos,
+                          len(strings.index), len(runs), len(rows), len(parts), len(qualifiers),
+                          len(packed), len(extrasbytes))
+    return b"".join([header,
+                     strings.pack(),
+                     _struct.pack("<{}q".format(2*len(runs)), *(x for run in runs for x in run)),
+                     packed,
+                     meta,
+                     b"".join(_feature.pack(*row) for row in rows),
+                     b"".join(_part.pack(*part) for part in parts),
+                     b"".join(_qualifier.pack(*q) for q in qualifiers),
+                     extrasbytes])
+
+
+class _Table(object):
+    # A read only sequence of the rows of a struct table in a buffer.
+    def __init__(self, buffer, offset, struct, count):
+        self.view = buffer[offset:offset+count*struct.size]
+        self.struct = struct
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.count)
+            size = self.struct.size
+            return list(self.struct.iter_unpack(self.view[start*size:max(start, stop)*size]))[::step]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("table index out of range")
+        return self.struct.unpack_from(self.view, index*self.struct.size)
+
+    def __iter__(self):
+        return self.struct.iter_unpack(self.view)
+
+
+class _StringTable(object):
+    # The string table of a packed record, strings are decoded when used.
+    def __init__(self, buffer, offset, count):
+        self.offsets = _Table(buffer, offset, _struct.Struct("<I"), count+1)
+        self.blob = buffer[offset+4*(count+1):]
+        self.decoded = {}
+
+    def __getitem__(self, index):
+        try:
+            return self.decoded[index]
+        except KeyError:
+            (a,), (b,) = self.offsets[index], self.offsets[index+1]
+            text = self.decoded[index] = bytes(self.blob[a:b]).decode("utf-8")
+            return text
+
+    def size(self):
+        return 4*len(self.offsets) + self.offsets[-1][0]
+
+
+class _Reader(object):
+    # The sections of a packed record in a bytes-like object. Only the
+    # header is read here, the tables are read when they are used.
+    def __init__(self, buffer):
+        buffer = memoryview(buffer)
+        (magic, version, self.kind, self.encoding, self.flags,
+         self.length, ws, we, cs, ce, self.pos,
+         nstrings, nruns, nfeatures, nparts, nqualifiers,
+         npacked, nextras) = _header.unpack_from(buffer)
+        if magic != _record_magic:
+            raise ValueError("Not a packed pydna sequence.")
+        if version > _version:
+            raise ValueError("Packed with a newer version of pydna.")
+        self.wspan, self.cspan = (ws, we), (cs, ce)
+        offset = _header.size
+        self.strings = _StringTable(buffer, offset, nstrings)
+        offset += self.strings.size()
+        self.runs = _Table(buffer, offset, _struct.Struct("<qq"), nruns)
+        offset += 16*nruns
+        self.packed = buffer[offset:offset+npacked]
+        offset += npacked
+        self.meta = _meta.unpack_from(buffer, offset)
+        offset += _meta.size
+        self.features = _Table(buffer, offset, _feature, nfeatures)
+        offset += nfeatures*_feature.size
+        self.parts = _Table(buffer, offset, _part, nparts)
+        offset += nparts*_part.size
+        self.qualifiers = _Table(buffer, offset, _qualifier, nqualifiers)
+        offset += nqualifiers*_qualifier.size
+        self._extras = buffer[offset:offset+nextras]
+
+    @property
+    def extras(self):
+        if not isinstance(self._extras, dict):
+            self._extras = _pickle.loads(self._extras) if len(self._extras) else {}
+        return self._extras
+
+    def string(self, index):
+        return self.strings[index] if index >= 0 else None
+
+    def data(self, start=0, stop=None):
+        stop = self.length if stop is None else stop
+        # the lower case intervals that end after start and begin before stop
+        first = max(0, _bisect.bisect_left(self.runs, (start,))-1)
+        last = _bisect.bisect_left(self.runs, (stop,))
+        return _decode(self.encoding, self.packed, self.runs[first:last], start, stop)
+
+
+def _dseq(reader, data):
+    # a Dseq made from the decoded sequence without the checks in Dseq.__init__
+    seq = _Dseq.__new__(_Dseq)
+    ws, we = reader.wspan
+    cs, ce = reader.cspan
+    extras = reader.extras
+    watson = extras.get("watson", data[ws:we])
+    if "crick" in extras:
+        crick = extras["crick"]
+    elif (cs, ce) == (ws, we) and we-ws == len(data):
+        crick = None
+    else:
+        crick = _rc(data[cs:ce])
+    seq.__setstate__({"_watson": _pretty_str(watson),
+                      "_crick": None if crick is None else _pretty_str(crick),
+                      "_buffer": None,
+                      "_todata": _pretty_str(data),
+                      "_ovhg": ws-cs,
+                      "_linear": not reader.flags & _CIRCULAR,
+                      "_circular": bool(reader.flags & _CIRCULAR),
+                      "length": extras.get("length", len(data)),
+                      "pos": reader.pos,
+                      "alphabet": extras.get("alphabet") or _IUPACAmbiguousDNA()})
+    return seq
+
+
+def _location(reader, parts):
+    locations = []
+    for start, end, strand, startkind, endkind, ref, ref_db in parts:
+        location = _FeatureLocation.__new__(_FeatureLocation)
+        location.__dict__.update(_start=_positions[startkind](start),
+                                 _end=_positions[endkind](end),
+                                 _strand=None if strand == 2 else strand,
+                                 ref=reader.string(ref),
+                                 ref_db=reader.string(ref_db))
+        locations.append(location)
+    return locations
+
+
+def _features(reader, indices=None):
+    # The features of the packed record, or the features with the given indices.
+    features = []
+    exotic = reader.extras.get("features", {})
+    rows = enumerate(reader.features) if indices is None else ((i, reader.features[i]) for i in indices)
+    for i, (kind, identifier, operator, pydnafeature, pstart, pcount, qstart, qcount) in rows:
+        if kind == -3:
+            features.append(exotic[i])
+            continue
+        feature = (_SeqFeature if pydnafeature else _BioSeqFeature).__new__(_SeqFeature if pydnafeature else _BioSeqFeature)
+        locations = _location(reader, reader.parts[pstart:pstart+pcount])
+        if operator == -2:
+            location = None
+        elif operator == -1:
+            location = locations[0]
+        else:
+            location = _CompoundLocation(locations, reader.string(operator))
+        qualifiers = _collections.OrderedDict()
+        for key, value, vkind in reader.qualifiers[qstart:qstart+qcount]:
+            key = reader.strings[key]
+            if vkind == 1:
+                qualifiers[key] = reader.strings[value]
+            elif vkind == 2:
+                qualifiers[key] = []
+            else:
+                qualifiers.setdefault(key, []).append(reader.strings[value])
+        feature.__dict__.update(location=location,
+                                type=reader.string(kind),
+                                id=reader.string(identifier),
+                                qualifiers=qualifiers)
+        features.append(feature)
+    return features
+
+
+def _unpack(buffer):
+    '''Returns the Dseq or Dseqrecord packed in buffer.'''
+    reader = _Reader(buffer)
+    seq = _dseq(reader, reader.data())
+    if reader.kind == _DSEQ:
+        return seq
+    classname, name, identifier, description = reader.meta
+    modulename, _, qualname = reader.strings[classname].partition(":")
+    cls = _importlib.import_module(modulename)
+    for attr in qualname.split("."):
+        cls = getattr(cls, attr)
+    obj = cls.__new__(cls)
+    state = reader.extras["state"]
+    state.update(_seq=seq, features=_features(reader))
+    for key, index in (("name", name), ("id", identifier), ("description", description)):
+        if index != -2:
+            state[key] = reader.string(index)
+    obj.__dict__.update((key, state[key]) for key in reader.extras["keys"])
+    return obj
+
+
+def dumps(obj):
+    '''Returns a Dseq, a Dseqrecord or an iterable of these as bytes.
+
+    A single object is returned by :func:`loads` as it was, an iterable
+    as a list.
+    '''
+    if isinstance(obj, _Dseq) or hasattr(obj, "features"):
+        return _pack(obj)
+    handle = _io.BytesIO()
+    dump(obj, handle)
+    return handle.getvalue()
+
+
+def loads(data):
+    '''Returns the object or the list of objects in data made by :func:`dumps`.'''
+    if bytes(data[:4]) == _file_magic:
+        return list(PackedFile(data))
+    return _unpack(data)
+
+
+def dump(obj, file):
+    '''Writes a Dseq, a Dseqrecord or an iterable of these to file, which
+    is a path or a binary file object.
+
+    Files with many records can be read one record at a time with
+    :class:`PackedFile`. Only one record at a time is held in memory
+    while the file is written.
+    '''
+    if isinstance(file, str):
+        with open(file, "wb") as handle:
+            return dump(obj, handle)
+    if isinstance(obj, _Dseq) or hasattr(obj, "features"):
+        file.write(_pack(obj))
+        return
+    file.write(_file_header.pack(_file_magic, _version))
+    offsets = [_file_header.size]
+    for item in obj:
+        offsets.append(offsets[-1] + file.write(_pack(item)))
+    file.write(_struct.pack("<{}Q".format(len(offsets)), *offsets))
+    file.write(_file_footer.pack(offsets[-1], len(offsets)-1, _index_magic))
+
+
+def load(file):
+    '''Returns the object or list of objects in file made by :func:`dump`.
+    file can be a path or a binary file object.'''
+    if isinstance(file, str):
+        with open(file, "rb") as handle:
+            return load(handle)
+    return loads(file.read())
+
+
+class PackedFile(object):
+    '''Random access to the records in a file written by :func:`dump`.
+
+    The file is memory mapped and only the records that are asked for are
+    read and unpacked.
+
+    Parameters
+    ----------
+    source : str or bytes-like object
+        A path to a file made by :func:`dump`, or the bytes returned
+        by :func:`dumps` for a list of records.
+
+    Examples
+    --------
+    >>> import os, tempfile
+    >>> from pydna.dseqrecord import Dseqrecord
+    >>> from pydna.packed import dump, PackedFile
+    >>> path = os.path.join(tempfile.mkdtemp(), "seqs.pdn")
+    >>> dump([Dseqrecord("aaa"), Dseqrecord("cccc", circular=True)], path)
+    >>> with PackedFile(path) as records:
+    ...     print(len(records), repr(records[1]))
+    2 Dseqrecord(o4)
+    '''
+
+    def __init__(self, source):
+        self._file = self._mmap = None
+        if isinstance(source, str):
+            self._file = open(source, "rb")
+            self._mmap = _mmap.mmap(self._file.fileno(), 0, access=_mmap.ACCESS_READ)
+            self._buffer = memoryview(self._mmap)
+        else:
+            self._buffer = memoryview(source)
+        magic, version = _file_header.unpack_from(self._buffer)
+        if magic != _file_magic:
+            raise ValueError("Not a pydna packed file.")
+        index, count, magic = _file_footer.unpack_from(self._buffer, len(self._buffer)-_file_footer.size)
+        if magic != _index_magic:
+            raise ValueError("The pydna packed file is incomplete.")
+        self._offsets = _struct.unpack_from("<{}Q".format(count+1), self._buffer, index)
+
+    def __len__(self):
+        return len(self._offsets)-1
+
+    def _view(self, index):
+        return self._buffer[self._offsets[index]:self._offsets[index+1]]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("record index out of range")
+        return _unpack(self._view(index))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self):
+        '''Releases the memory map and closes the file.'''
+        self._buffer.release()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+if __name__=="__main__":
+    import os as _os
+    cached = _os.getenv("pydna_cached_funcs", "")
+    _os.environ["pydna_cached_funcs"]=""
+    import doctest
+    doctest.testmod(verbose=True, optionflags=doctest.ELLIPSIS)
+    _os.environ["pydna_cached_funcs"]=cached
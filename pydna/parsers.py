@@ -5,20 +5,131 @@
 # license.  Please see the LICENSE.txt file that should have been included
 # as part of this package.
 
-'''Provides two functions, parse and parse_primers'''
+'''Provides the functions parse, iter_parse, parse_many and parse_primers'''
 
 import os        as _os
 import re        as _re
 import io        as _io
 import textwrap  as _textwrap
 import glob      as _glob
+import itertools as _itertools
+import concurrent.futures as _futures
+import logging   as _logging
+_module_logger = _logging.getLogger("pydna."+__name__)
 
 from Bio                    import SeqIO              as _SeqIO
 from Bio.Alphabet.IUPAC     import IUPACAmbiguousDNA  as _IUPACAmbiguousDNA
-from Bio.GenBank            import RecordParser       as _RecordParser
 from pydna.genbankfile           import GenbankFile        as _GenbankFile
 from pydna.dseqrecord            import Dseqrecord         as _Dseqrecord
 from pydna.primer                import Primer             as _Primer
+from pydna                       import cache              as _cache
+
+_start = _re.compile(r"\s*(>|LOCUS\s|ID\s)")
+
+
+def _chunks(handle):
+    # Yields (format, lines) for each sequence record in handle without
+    # reading more than one record at a time into memory. Text between
+    # records is skipped. A FASTA record ends at an empty line or where
+    # the next record starts, GenBank and EMBL records end with //.
+    fmt, lines = None, []
+    for line in iter(handle.readline, ""):
+        if fmt in ("genbank", "embl"):
+            lines.append(line)
+            if line.lstrip().startswith("//"):
+                yield fmt, lines
+                fmt, lines = None, []
+            continue
+        start = _start.match(line)
+        if fmt == "fasta" and (start or not line.strip()):
+            if len(lines) > 1:
+                yield fmt, lines
+            fmt, lines = None, []
+        if start:
+            fmt = {">": "fasta", "L": "genbank", "I": "embl"}[start.group(1)[0]]
+            lines = [line]
+        elif fmt == "fasta":
+            lines.append(line)
+    if fmt == "fasta" and len(lines) > 1:
+        yield fmt, lines
+
+
+def _records(handle, ds, path):
+    from pydna.seqfeature import SeqFeature as _SeqFeature
+    for fmt, lines in _chunks(handle):
+        if lines[0][:1].isspace():
+            raw = _textwrap.dedent("".join(lines))
+        else:
+            raw = "".join(lines)
+        try:
+            parsed = _SeqIO.read(_io.StringIO(raw), fmt, alphabet=_IUPACAmbiguousDNA())
+        except ValueError:
+            continue
+        topology = parsed.annotations.get("topology")
+        if topology:
+            circular = topology == "circular"
+        else:
+            circular = "circular" in lines[0]
+        for feature in parsed.features:
+            # the features are not shared with anything, so
+            # they are made into pydna SeqFeatures in place
+            feature.__class__ = _SeqFeature
+        if ds and path:
+            yield _GenbankFile(parsed, circular=circular, path=path)
+        elif ds:
+            yield _Dseqrecord(parsed, circular=circular)
+        else:
+            yield parsed
+
+
+def iter_parse(data, ds = True):
+    '''Yields the DNA sequences found in data one at a time, see :func:`parse`.
+
+    Files are read one record at a time, so that files of any size can be
+    processed in constant memory. The format of each record is recognized
+    from its first line, and each record is parsed only once.
+
+    Parameters
+    ----------
+    data : string, file object or iterable
+        A path to a local file, a string containing sequences, an open
+        text file, or an iterable of these.
+
+    ds : bool
+        If True double stranded :class:`Dseqrecord` objects are returned.
+        If False single stranded :class:`Bio.SeqRecord` objects are returned.
+
+    Examples
+    --------
+    >>> from pydna.parsers import iter_parse
+    >>> records = iter_parse(">a\\naaa\\n\\n>b\\ncccc\\n")
+    >>> next(records)
+    Dseqrecord(-3)
+    >>> next(records).seq
+    Dseq(-4)
+    cccc
+    gggg
+    '''
+    # a string is an iterable datatype but on Python2.x it doesn't have an __iter__ method.
+    if not hasattr(data, '__iter__') or isinstance(data, (str, bytes)) or hasattr(data, "read"):
+        data = (data,)
+
+    for item in data:
+        if hasattr(item, "read"):
+            # item is an open file
+            yield from _records(item, ds, None)
+            continue
+        try:
+            # item is a path to a utf-8 encoded text file?
+            f = open(item, 'r', encoding="utf-8")
+        except IOError:
+            # item was not a path, add sequences parsed from item
+            yield from _records(_io.StringIO(item), ds, None)
+        else:
+            # item was a readable text file, seqences are parsed from the file
+            with f:
+                yield from _records(f, ds, item)
+
 
 def parse(data, ds = True):
     '''This function returns *all* DNA sequences found in data. If no
@@ -59,83 +170,93 @@ def parse(data, ds = True):
     See Also
     --------
     read
+    iter_parse
 
     '''
-    
-    def embl_gb_fasta(raw, ds, path=None):
-        
-        pattern =  r"(?:>.+\n^(?:^[^>]+?)(?=\n\n|>|LOCUS|ID))|(?:(?:LOCUS|ID)(?:(?:.|\n)+?)^//)"
-        
-        result_list = []
-
-        rawseqs = _re.findall(pattern, _textwrap.dedent(raw + "\n\n"), flags=_re.MULTILINE)
-        
-        for rawseq in rawseqs:
-            handle = _io.StringIO(rawseq)
-            if "circular" in rawseq.splitlines()[0]:
-                circular = True
-            else:
-                circular = False
+    return list(iter_parse(data, ds))
+
+
+def _parse_file(path, ds):
+    return parse(path, ds)
+
+
+def parse_many(paths, ds = True, n_jobs = None, executor = None):
+    '''Returns the sequences in all files in paths, in the same order as
+    :func:`parse`.
+
+    The files are parsed by n_jobs processes, or by an executor.
+
+    If pydna.parsers.parse_many is listed in the pydna_cached_funcs
+    environment variable (cached_funcs in pydna.ini), the sequences of each
+    file are stored by the cache backend of :mod:`pydna.cache`, under the
+    absolute path, modification time and size of the file. Files that have
+    not changed since they were last parsed are read from the cache.
+
+    Parameters
+    ----------
+    paths : iterable
+        Paths to local files.
+
+    ds : bool
+        If True double stranded :class:`pydna.genbankfile.GenbankFile`
+        objects are returned, otherwise :class:`Bio.SeqRecord` objects.
+
+    n_jobs : int, optional
+        Number of processes used to parse files that are not cached. -1
+        means one per CPU.
+
+    executor : concurrent.futures.Executor, optional
+        An executor used instead of starting new processes. It is not shut
+        down.
+
+    Returns
+    -------
+    list
+        contains GenbankFile or SeqRecord objects
+    '''
+    paths = list(paths)
+    name = "pydna.parsers.parse_many"
+    results = [None]*len(paths)
+    keys = []
+    cached = name in _os.environ["pydna_cached_funcs"]
+    for i, path in enumerate(paths):
+        stat = _os.stat(path)
+        keys.append(_cache.key((_os.path.abspath(path), stat.st_mtime_ns, stat.st_size, ds), {}))
+    if cached:
+        backend = _cache.backend()
+        ttl = _cache.ttl(name)
+        for i, key in enumerate(keys):
             try:
-                parsed = _SeqIO.read(handle, "embl", alphabet=_IUPACAmbiguousDNA())
-            except ValueError:
-                handle.seek(0)
-                try:
-                    parsed = _SeqIO.read(handle, "genbank", alphabet=_IUPACAmbiguousDNA())
-                    handle.seek(0)
-                    parser = _RecordParser()
-                    residue_type = parser.parse(handle).residue_type
-                    if "circular" in residue_type:
-                        circular = True
-                    else:
-                        circular = False
-                except ValueError:
-                    handle.seek(0)
-                    try:
-                        parsed = _SeqIO.read(handle, "fasta", alphabet=_IUPACAmbiguousDNA())
-                    except ValueError:
-                        parsed = ""
-            handle.close()
-            if parsed:
-                from copy import deepcopy as _deepcopy  ## TODO: clean up !
-                from pydna.seqfeature import SeqFeature as _SeqFeature
-                nfs = [_SeqFeature() for f in parsed.features]
-                for f, nf in zip(parsed.features, nfs):
-                    nf.__dict__ =_deepcopy(f.__dict__)
-                parsed.features = nfs
-                if ds and path:
-                    result_list.append( _GenbankFile(parsed, circular=circular, path=path) )
-                elif ds:
-                    result_list.append(  _Dseqrecord(parsed, circular=circular) )
-                else:
-                    result_list.append(  parsed )
-            
-
-                
-        return result_list
+                results[i] = backend.get(name, key, ttl)
+            except KeyError:
+                _cache._stats[name][1] += 1
+            else:
+                _cache._stats[name][0] += 1
+                for record in results[i]:
+                    if ds:
+                        record.path = paths[i]
+        _module_logger.info("%s of %s files found in cache", len(paths)-results.count(None), len(paths))
+
+    missing = [i for i, result in enumerate(results) if result is None]
+    pool = executor
+    if pool is None and n_jobs not in (None, 0, 1) and len(missing) > 1:
+        pool = _futures.ProcessPoolExecutor(n_jobs if n_jobs > 0 else None)
+    try:
+        if pool is None:
+            parsed = map(_parse_file, [paths[i] for i in missing], _itertools.repeat(ds))
+        else:
+            chunksize = max(1, len(missing) // (4*(_os.cpu_count() or 1)))
+            parsed = pool.map(_parse_file, [paths[i] for i in missing], _itertools.repeat(ds), chunksize=chunksize)
+        for i, records in zip(missing, parsed):
+            results[i] = records
+            if cached:
+                backend.set(name, keys[i], records)
+    finally:
+        if pool is not executor:
+            pool.shutdown()
+    return [record for records in results for record in records]
+
 
-    # a string is an iterable datatype but on Python2.x it doesn't have an __iter__ method.
-    if not hasattr(data, '__iter__') or isinstance(data, (str, bytes)):
-        data = (data,)
-        
-    sequences = []
-    
-    for item in data:
-        try:
-            # item is a path to a utf-8 encoded text file?
-            with open(item, 'r', encoding="utf-8") as f:    
-                raw = f.read()  
-        except IOError:
-            # item was not a path, add sequences parsed from item
-            raw=item
-            path=None
-        else:   
-            # item was a readable text file, seqences are parsed from the file
-            path = item
-        finally:
-            sequences.extend( embl_gb_fasta(raw, ds, path) )
-    return sequences
-    
 def parse_primers(data):
     """ """
     return [_Primer(x) for x in parse(data, ds=False)]
@@ -12,6 +12,7 @@ from Bio.Seq import Seq                           as _Seq
 #from Bio.SeqRecord import SeqRecord               as _SeqRecord
 from pydna.seqrecord import SeqRecord             as _SeqRecord
 from pydna.tm import tmbresluc                    as _tmbresluc
+from pydna.cache import digest                    as _digest
 
 class Primer(_SeqRecord):
     '''This class can hold information about a primer and its position on a template 
@@ -66,6 +67,11 @@ class Primer(_SeqRecord):
         return result
     
 
+    def __pydna_cache_key__(self):
+        '''Returns the key used by :func:`pydna.utils.memorize` for this primer.'''
+        return _digest(super().__pydna_cache_key__(), self.position, self._fp, self.concentration, self.template)
+
+
     def tm(self, saltc=50.0, formula=_tmbresluc):
         return formula( str(self.seq).upper(), primerc=self.concentration, saltc=saltc )
 
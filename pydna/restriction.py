@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright 2013-2018 by Björn Johansson.  All rights reserved.
+# This code is part of the Python-dna distribution and governed by its
+# license.  Please see the LICENSE.txt file that should have been included
+# as part of this package.
+
+'''This module provides a restriction site scanner that finds the sites of
+all enzymes in a :class:`Bio.Restriction.RestrictionBatch` at the same time.
+
+The :func:`search` function returns the same cut positions as the search
+method of Biopython restriction enzymes and batches. The recognition sites
+are found for each sequence only once and kept in memory, so that later
+searches of the same sequence, with the same or other enzymes, reuse them.
+
+If numpy is available, long sequences are scanned by coding each k-mer of
+the sequence with two bits per nucleotide. The sites of all enzymes with the
+same length and the same positions of N are looked up in one sorted table of
+codes. Short sequences, and sites with many ambiguous nucleotides, are
+searched with the regular expressions that Biopython uses.
+
+:func:`restriction_map` collects the cut positions of many enzymes in many
+sequences in a :class:`RestrictionMap`, which can be saved and compared.'''
+
+import re          as _re
+import itertools   as _itertools
+import bisect      as _bisect
+import collections as _collections
+import functools   as _functools
+import json        as _json
+import threading   as _threading
+import os          as _os
+import concurrent.futures as _futures
+import logging     as _logging
+_module_logger = _logging.getLogger("pydna."+__name__)
+
+try:
+    import numpy as _np
+except ImportError:
+    _np = None
+
+from Bio.Restriction.Restriction import _check_bases
+from pydna.utils import seguid as _seg
+
+_max_variants = 1024  # largest number of unambiguous sequences a site is expanded to
+_min_kmer_scan = 300  # shorter sequences are searched with regular expressions
+_max_scans = 64       # number of sequences for which the sites are kept
+_scans = _collections.OrderedDict()
+_not_iupac = str.maketrans("", "", "ABCDGHKMNRSTVWY")
+_lock = _threading.Lock()  # guards _scans and the results stored on enzymes
+
+
+class _Target(object):
+    # Stands in for Bio.Restriction.FormattedSeq when the _drop method of
+    # an enzyme removes or wraps the cuts that are outside of the sequence.
+    def __init__(self, length, linear):
+        self.length = length
+        self.linear = linear
+
+    def __len__(self):
+        return self.length
+
+    def is_linear(self):
+        return self.linear
+
+
+@_functools.lru_cache(maxsize=None)
+def _patterns(enzyme):
+    # The recognition site of the enzyme as regular expressions, the
+    # reverse complement is second for non palindromic enzymes.
+    return tuple(p for n, p in _re.findall(r"\(\?=\(\?P<(\w+)>(.*?)\)\)", enzyme.compsite.pattern))
+
+
+@_functools.lru_cache(maxsize=None)
+def _compiled(pattern):
+    return _re.compile("(?=({}))".format(pattern))
+
+
+@_functools.lru_cache(maxsize=64)
+def _site_table(patterns):
+    '''Groups the patterns by length and positions of N. Returns a list of
+    (length, mask, offsets, keys, owners) where keys are the sorted two bit
+    codes of all unambiguous sequences matching the patterns in the group,
+    with N coded as A. mask removes the N positions from a code, offsets are
+    the positions that are not N and owners lists the patterns for each key.
+    Patterns with more than _max_variants codes are returned in a second list.'''
+    groups = _collections.defaultdict(dict)
+    rest = []
+    for pattern in patterns:
+        positions = [p.strip("[]") for p in _re.findall(r"\[[A-Z]+\]|.", pattern)]
+        variants = 1
+        for p in positions:
+            if p != ".":
+                variants *= len(p)
+        if variants > _max_variants or len(positions) > 32:
+            rest.append(pattern)
+            continue
+        codes, mask = [0], 0
+        for p in positions:
+            mask <<= 2
+            if p == ".":
+                codes = [code<<2 for code in codes]
+            else:
+                mask |= 3
+                codes = [(code<<2)|"ACGT".index(b) for code in codes for b in p]
+        table = groups[(len(positions), mask)]
+        for code in codes:
+            table.setdefault(code, []).append(pattern)
+    result = []
+    for (length, mask), table in sorted(groups.items()):
+        keys = sorted(table)
+        offsets = [j for j in range(length) if (mask >> 2*(length-1-j)) & 3]
+        result.append((length,
+                       _np.uint64(mask),
+                       _np.array(offsets, dtype=_np.int64),
+                       _np.array(keys, dtype=_np.uint64),
+                       [table[key] for key in keys]))
+    return result, rest
+
+
+def _scan_regex(data, patterns):
+    return {pattern: [m.start()+1 for m in _compiled(pattern).finditer(data)] for pattern in patterns}
+
+
+def _scan_kmers(data, patterns):
+    '''Returns a dict with the 1-based start positions of each pattern in
+    data, using the table made by :func:`_site_table`.'''
+    table, rest = _site_table(tuple(sorted(patterns)))
+    found = _collections.defaultdict(list)
+    lut = _np.full(256, 4, dtype=_np.uint8)
+    for i, c in enumerate("ACGT"):
+        lut[ord(c)] = i
+    seq = lut[_np.frombuffer(data.encode("ascii"), dtype=_np.uint8)]
+    n = len(seq)
+    invalid = seq == 4
+    check = invalid.any()
+    bases = (seq & 3).astype(_np.uint64)
+    codes = _np.zeros(n, dtype=_np.uint64)
+    two = _np.uint64(2)
+    done = 0
+    for length, mask, offsets, keys, owners in table:
+        m = n-length+1
+        if m <= 0:
+            break
+        while done < length:
+            # codes[i] is the code of data[i:i+done+1]
+            k = n-done
+            _np.left_shift(codes[:k], two, out=codes[:k])
+            _np.bitwise_or(codes[:k], bases[done:], out=codes[:k])
+            done += 1
+        masked = codes[:m] & mask
+        index = _np.searchsorted(keys, masked)
+        _np.minimum(index, len(keys)-1, out=index)
+        positions = _np.flatnonzero(keys[index] == masked)
+        if check and len(positions):
+            # other characters than ACGT only match N
+            positions = positions[~invalid[positions[:, None] + offsets].any(axis=1)]
+        index = index[positions]
+        order = _np.argsort(index, kind="mergesort")
+        index, positions = index[order], positions[order]
+        bounds = _np.searchsorted(index, _np.arange(len(keys)+1)).tolist()
+        for key, owner in enumerate(owners):
+            if bounds[key] < bounds[key+1]:
+                starts = (positions[bounds[key]:bounds[key+1]]+1).tolist()
+                for pattern in owner:
+                    found[pattern].append(starts)
+    result = _scan_regex(data, rest)
+    for pattern in set(patterns).difference(rest):
+        starts = found.get(pattern, [])
+        result[pattern] = sorted(_itertools.chain.from_iterable(starts)) if len(starts) > 1 else list(_itertools.chain(*starts))
+    return result
+
+
+def _sequence(seq):
+    # The sequence as Biopython formats it for restriction analysis
+    data = str(seq).upper()
+    if data.translate(_not_iupac):
+        data = _check_bases(data)[1:]
+    return data
+
+
+def scan(seq, enzymes, linear=True):
+    '''Returns a dict with the 1-based start positions of the recognition
+    sites of each enzyme in seq. For non palindromic enzymes, a second list
+    holds the sites on the other strand.
+
+    The sites of all enzymes are found in one scan of seq and kept for the
+    sequence, so later calls only scan for enzymes that were not searched
+    for before.
+
+    Examples
+    --------
+    >>> from pydna.restriction import scan
+    >>> from Bio.Restriction import BamHI, BsaI
+    >>> scan("GGATCCaaGAGACCaaGGTCTC", (BamHI, BsaI))
+    {BamHI: ([1],), BsaI: ([17], [9])}
+    '''
+    return _scan(_sequence(seq), enzymes, linear)
+
+
+def _scan(data, enzymes, linear):
+    key = (_seg(data), linear)
+    with _lock:
+        sites = _scans.pop(key, None)
+        if sites is None:
+            sites = {}
+        _scans[key] = sites
+        while len(_scans) > _max_scans:
+            _scans.popitem(last=False)
+    enzymes = list(enzymes)
+    missing = {p for enzyme in enzymes for p in _patterns(enzyme)}.difference(sites)
+    if missing:
+        size = max(len(_re.findall(r"\[[A-Z]+\]|.", p)) for p in missing)
+        text = data if linear else data + data[:size-1]
+        if _np is not None and len(text) >= _min_kmer_scan:
+            new = _scan_kmers(text, missing)
+        else:
+            new = _scan_regex(text, missing)
+        if not linear:
+            new = {p: [s for s in starts if s <= len(data)] for p, starts in new.items()}
+        sites.update(new)
+    return {enzyme: tuple(sites[p] for p in _patterns(enzyme)) for enzyme in enzymes}
+
+
+def _cuts(enzyme, sites, length, linear, drop=True):
+    # The cut positions of enzyme made in the same way as enzyme.search.
+    # _modify and _rev_modify add the same distances to every site
+    offsets = list(enzyme._modify(0))
+    results = [s+o for s in sites[0] for o in offsets]
+    if not enzyme.is_palindromic():
+        forward = set(sites[0])
+        offsets = list(enzyme._rev_modify(0))
+        results += [s+o for s in sites[1] if s not in forward for o in offsets]
+        results.sort()
+    if results and drop:
+        with _lock:
+            enzyme.dna = _Target(length, linear)
+            enzyme.results = results
+            enzyme._drop()
+            results = enzyme.results
+    return results
+
+
+def _strand_sites(seq, enzymes):
+    # The sites of enzymes in one strand of a Dseq, found in one scan
+    return _scan(_sequence(seq), enzymes, True)
+
+
+def _fragment_cuts(sites, enzyme, offset, length):
+    # The cut positions of enzyme in the part of a scanned strand from offset
+    # with length nucleotides, the same as found in the part with an N added
+    # to its end. Only the sites inside the part are used, so the part does
+    # not have to be scanned again.
+    last = offset + length - enzyme.size + 1
+    inside = tuple([s-offset for s in starts[_bisect.bisect_right(starts, offset):_bisect.bisect_right(starts, last)]]
+                   for starts in sites)
+    return _cuts(enzyme, inside, length+1, True)
+
+
+def search(seq, enzymes, linear=True):
+    '''Returns a dict with the cut positions for each enzyme in seq,
+    as returned by :meth:`Bio.Restriction.RestrictionBatch.search`.
+
+    Parameters
+    ----------
+    seq : str, Seq or Dseq
+        The sequence to search.
+
+    enzymes : RestrictionBatch or iterable of enzymes
+
+    linear : bool, optional
+        If False, sites over the origin are included.
+
+    Examples
+    --------
+    >>> from pydna.restriction import search
+    >>> from Bio.Restriction import BamHI, EcoRI, RestrictionBatch
+    >>> search("ggatccnnngaattc", [BamHI, EcoRI])
+    {BamHI: [2], EcoRI: [11]}
+    >>> from Bio.Seq import Seq
+    >>> batch = RestrictionBatch([BamHI, EcoRI])
+    >>> search("ggatccnnngaattc", batch) == batch.search(Seq("ggatccnnngaattc"))
+    True
+    '''
+    data = _sequence(seq)
+    return {enzyme: _cuts(enzyme, sites, len(data), linear) for enzyme, sites in _scan(data, enzymes, linear).items()}
+
+
+def _map_one(data, enzymes, linear):
+    # the cut positions of each enzyme in data, run in worker processes
+    return [_cuts(enzyme, sites, len(data), linear) for enzyme, sites in _scan(data, enzymes, linear).items()]
+
+
+class RestrictionMap(object):
+    '''Cut positions of a number of enzymes in a number of sequences, made
+    by :func:`restriction_map`.
+
+    The cuts are stored in three columns of equal length: sequence, enzyme
+    and position. sequence and enzyme are indices into the names and
+    enzymes lists. The columns are numpy arrays if numpy is installed, and
+    lists otherwise. The rows are sorted by sequence, enzyme and position.
+
+    Attributes
+    ----------
+    names : list of str
+        The names of the sequences.
+    seguids : list of str
+        The seguid checksums of the sequences.
+    lengths : list of int
+    circular : list of bool
+    enzymes : list of str
+        The names of the enzymes.
+    sequence, enzyme, position : array
+        One row for each cut.
+    '''
+
+    _columns = ("names", "seguids", "lengths", "circular", "enzymes", "sequence", "enzyme", "position")
+
+    def __init__(self, names, seguids, lengths, circular, enzymes, sequence, enzyme, position):
+        self.names = list(names)
+        self.seguids = list(seguids)
+        self.lengths = list(lengths)
+        self.circular = list(circular)
+        self.enzymes = list(enzymes)
+        self.sequence, self.enzyme, self.position = (_np.array(column, dtype=_np.int64) if _np is not None else list(column)
+                                                     for column in (sequence, enzyme, position))
+        self._bounds = None
+
+    def __len__(self):
+        return len(self.position)
+
+    def __repr__(self):
+        return "RestrictionMap({} sequences, {} enzymes, {} cuts)".format(len(self.names), len(self.enzymes), len(self))
+
+    def __eq__(self, other):
+        if not isinstance(other, RestrictionMap):
+            return NotImplemented
+        return self._as_lists() == other._as_lists()
+
+    def _as_lists(self):
+        return {"names": self.names,
+                "seguids": self.seguids,
+                "lengths": [int(n) for n in self.lengths],
+                "circular": [bool(c) for c in self.circular],
+                "enzymes": self.enzymes,
+                "sequence": [int(i) for i in self.sequence],
+                "enzyme": [int(i) for i in self.enzyme],
+                "position": [int(p) for p in self.position]}
+
+    def _rows(self):
+        # the first and last+1 rows of the cuts of each sequence and enzyme
+        if self._bounds is None:
+            bounds = {}
+            for row, key in enumerate(zip([int(i) for i in self.sequence], [int(i) for i in self.enzyme])):
+                bounds[key] = (bounds.get(key, (row,))[0], row+1)
+            self._bounds = bounds
+        return self._bounds
+
+    def positions(self, sequence, enzyme):
+        '''Returns the cut positions of enzyme in sequence. Both can be given
+        by name or by index.'''
+        if not isinstance(sequence, int):
+            sequence = self.names.index(str(sequence))
+        if not isinstance(enzyme, int):
+            enzyme = self.enzymes.index(str(enzyme))
+        first, last = self._rows().get((sequence, enzyme), (0, 0))
+        return [int(p) for p in self.position[first:last]]
+
+    def counts(self):
+        '''Returns the number of cuts of each enzyme (columns) in each
+        sequence (rows), as a numpy array if numpy is installed.'''
+        table = [[0]*len(self.enzymes) for name in self.names]
+        for (sequence, enzyme), (first, last) in self._rows().items():
+            table[sequence][enzyme] = last-first
+        if _np is not None:
+            return _np.array(table, dtype=_np.int64).reshape(len(self.names), len(self.enzymes))
+        return table
+
+    def to_dict(self):
+        '''Returns a dict of lists with one item per cut and the keys
+        sequence, seguid, enzyme and position, that can be given to
+        pandas.DataFrame.'''
+        sequence = [int(i) for i in self.sequence]
+        return {"sequence": [self.names[i] for i in sequence],
+                "seguid": [self.seguids[i] for i in sequence],
+                "enzyme": [self.enzymes[int(i)] for i in self.enzyme],
+                "position": [int(p) for p in self.position]}
+
+    def dumps(self):
+        '''Returns the map as a JSON string.'''
+        return _json.dumps(self._as_lists(), sort_keys=True)
+
+    @classmethod
+    def loads(cls, text):
+        '''Makes a RestrictionMap from a string made by :meth:`dumps`.'''
+        columns = _json.loads(text)
+        return cls(*(columns[column] for column in cls._columns))
+
+    def diff(self, other):
+        '''Compares the cuts with those in another RestrictionMap, matching
+        sequences and enzymes by name.
+
+        Returns
+        -------
+        list of tuples
+            (name, enzyme, positions in self, positions in other) for each
+            sequence and enzyme where the positions differ. The positions
+            are None for a sequence or enzyme missing from one of the maps.
+        '''
+        def cuts(rmap):
+            result = {}
+            for name in rmap.names:
+                for enzyme in rmap.enzymes:
+                    result[(name, enzyme)] = []
+            for (sequence, enzyme), (first, last) in rmap._rows().items():
+                result[(rmap.names[sequence], rmap.enzymes[enzyme])] = [int(p) for p in rmap.position[first:last]]
+            return result
+        mine, theirs = cuts(self), cuts(other)
+        result = []
+        for name in _collections.OrderedDict.fromkeys(self.names + other.names):
+            for enzyme in sorted(set(self.enzymes) | set(other.enzymes)):
+                a, b = mine.get((name, enzyme)), theirs.get((name, enzyme))
+                if a != b:
+                    result.append((name, enzyme, a, b))
+        return result
+
+
+def restriction_map(records, enzymes, n_jobs=None, executor=None):
+    '''Returns the cut positions of all enzymes in all records as a
+    :class:`RestrictionMap`.
+
+    Each sequence is scanned once for the sites of all enzymes. The cut
+    positions are the same as from the search method of the enzymes, with
+    sites across the origin included for circular sequences.
+
+    Parameters
+    ----------
+    records : iterable
+        Dseqrecord, SeqRecord, Dseq, Seq or str objects.
+
+    enzymes : RestrictionBatch or iterable of enzymes
+        The enzymes are sorted by name in the map.
+
+    n_jobs : int, optional
+        Number of processes used. -1 means one per CPU.
+
+    executor : concurrent.futures.Executor, optional
+        An executor used instead of starting new processes. It is not shut
+        down.
+
+    Examples
+    --------
+    >>> from pydna.restriction import restriction_map
+    >>> from pydna.dseqrecord import Dseqrecord
+    >>> from Bio.Restriction import BamHI, EcoRI
+    >>> a = Dseqrecord("ggatccnnngaattc", name="a")
+    >>> b = Dseqrecord("attcggatccaaaga", circular=True, name="b")
+    >>> rmap = restriction_map([a, b], [EcoRI, BamHI])
+    >>> rmap
+    RestrictionMap(2 sequences, 2 enzymes, 4 cuts)
+    >>> rmap.enzymes
+    ['BamHI', 'EcoRI']
+    >>> rmap.positions("b", "EcoRI")
+    [15]
+    >>> rmap.counts()
+    array([[1, 1],
+           [1, 1]])
+    >>> rmap.to_dict()["position"]
+    [2, 11, 6, 15]
+    '''
+    enzymes = sorted(set(enzymes), key=str)
+    names, seguids, lengths, circular, texts = [], [], [], [], []
+    for i, record in enumerate(records):
+        names.append(str(getattr(record, "name", i)))
+        circular.append(bool(getattr(record, "circular", False) or
+                             getattr(record, "annotations", {}).get("topology") == "circular"))
+        texts.append(_sequence(getattr(record, "seq", record)))
+        lengths.append(len(texts[-1]))
+        seguids.append(_seg(texts[-1]))
+    linear = [not c for c in circular]
+
+    pool = executor
+    if pool is None and n_jobs not in (None, 0, 1):
+        pool = _futures.ProcessPoolExecutor(n_jobs if n_jobs > 0 else None)
+    try:
+        if pool is None:
+            results = map(_map_one, texts, _itertools.repeat(enzymes), linear)
+        else:
+            chunksize = max(1, len(texts) // (4*(_os.cpu_count() or 1)))
+            results = pool.map(_map_one, texts, _itertools.repeat(enzymes), linear, chunksize=chunksize)
+        sequence, enzyme, position = [], [], []
+        for i, cuts in enumerate(results):
+            for j, positions in enumerate(cuts):
+                positions = sorted(positions)
+                sequence.extend([i]*len(positions))
+                enzyme.extend([j]*len(positions))
+                position.extend(positions)
+    finally:
+        if pool is not executor:
+            pool.shutdown()
+    return RestrictionMap(names, seguids, lengths, circular, [str(e) for e in enzymes], sequence, enzyme, position)
+
+
+def scan_cache_clear():
+    '''Forgets the sites found for all sequences.'''
+    _scans.clear()
+
+
+if __name__=="__main__":
+    import os as _os
+    cached = _os.getenv("pydna_cached_funcs", "")
+    _os.environ["pydna_cached_funcs"]=""
+    import doctest
+    doctest.testmod(verbose=True, optionflags=doctest.ELLIPSIS)
+    _os.environ["pydna_cached_funcs"]=cached
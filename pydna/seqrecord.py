@@ -33,6 +33,7 @@ from Bio.Alphabet.IUPAC     import IUPACAmbiguousDNA as _IUPACAmbiguousDNA
 
 from pydna.common_sub_strings import common_sub_strings as _common_sub_strings
 from pydna.utils  import seguid  as _seg
+from pydna.cache  import digest  as _digest
 from pydna._pretty import pretty_str as _pretty_str
 from pydna.seqfeature       import SeqFeature as _SeqFeature
 
@@ -393,6 +394,16 @@ class SeqRecord(_SeqRecord):
 
         .. [#] http://wiki.christophchamp.com/index.php/SEGUID'''
         return _seg(str(self.seq))
+
+
+    def __pydna_cache_key__(self):
+        '''Returns the key used by :func:`pydna.utils.memorize` for this record.
+
+        The key depends on the sequence, name, id, description and
+        features. Other annotations, like the date, do not change the key.'''
+        seq = self.seq if hasattr(self.seq, "__pydna_cache_key__") else str(self.seq)
+        features = [(f.type, str(f.location), sorted(f.qualifiers.items())) for f in self.features]
+        return _digest(type(self).__name__, seq, self.name, self.id, self.description, features)
     
 
     def olaps(self, other, *args, **kwargs):
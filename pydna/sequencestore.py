@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright 2013-2018 by Björn Johansson.  All rights reserved.
+# This code is part of the Python-dna distribution and governed by its
+# license.  Please see the LICENSE.txt file that should have been included
+# as part of this package.
+
+'''This module provides the :class:`SequenceStore` class, a directory of
+sequences stored on disk in the packed format of :mod:`pydna.packed`.
+
+Each sequence is stored with an index of the feature coordinates. The
+files are memory mapped, so a region of a large sequence like a chromosome
+can be read without reading the rest of the sequence and its features:
+
+>>> import tempfile
+>>> from pydna.dseqrecord import Dseqrecord
+>>> from pydna.sequencestore import SequenceStore
+>>> record = Dseqrecord("aaaGGATCCaaaGAATTCaaa", id="X12345.1")
+>>> record.add_feature(3, 9, label="BamHI")
+>>> record.add_feature(12, 18, label="EcoRI")
+>>> store = SequenceStore(tempfile.mkdtemp())
+>>> store.add(record)
+StoredSequence(X12345.1, 21 bp)
+>>> region = store["X12345.1"][6:15]
+>>> region
+Dseqrecord(-9)
+>>> region.id
+'X12345.1:7-15'
+>>> str(region.seq)
+'TCCaaaGAA'
+>>> [str(f.location) for f in region.features]
+['[<0:3](+)', '[6:>9](+)']
+>>> store.close()
+
+Features that extend outside of the region are cut at the ends of the
+region and get a fuzzy position (<0 or >9 above) at the cut.
+'''
+
+import os              as _os
+import copy            as _copy
+import mmap            as _mmap
+import struct          as _struct
+import bisect          as _bisect
+import tempfile        as _tempfile
+import urllib.parse    as _urlparse
+import logging         as _logging
+_module_logger = _logging.getLogger("pydna."+__name__)
+
+from Bio.SeqFeature    import FeatureLocation  as _FeatureLocation
+from Bio.SeqFeature    import CompoundLocation as _CompoundLocation
+from Bio.SeqFeature    import BeforePosition   as _BeforePosition
+from Bio.SeqFeature    import AfterPosition    as _AfterPosition
+from pydna.dseq        import Dseq             as _Dseq
+from pydna.dseqrecord  import Dseqrecord       as _Dseqrecord
+from pydna             import packed           as _packed
+
+_version = 1
+
+# magic, version, size of the packed record, number of index entries and
+# the largest bin shift used
+_store_header = _struct.Struct("<4sB3xQQB7x")
+# bin, start, end, feature
+_entry = _struct.Struct("<qqqI")
+
+_store_magic = b"PDNS"
+_suffix = ".pdn"
+
+# Features are placed in the smallest bin that holds them. The smallest
+# bins are 2**14 bp and each level of bins is 8 times larger than the
+# level below.
+_first_shift, _shift_step = 14, 3
+
+
+def _bin(start, end):
+    # the bin shift and the bin of a feature from start to end
+    shift = _first_shift
+    while start >> shift != (end-1) >> shift:
+        shift += _shift_step
+    return shift, (shift << 48) | (start >> shift)
+
+
+def _index(features):
+    # the index entries of features sorted by bin and start
+    entries, maxshift = [], _first_shift
+    for i, feature in enumerate(features):
+        if feature.location is None:
+            continue
+        start = min(int(p.start) for p in feature.location.parts)
+        end = max(int(p.end) for p in feature.location.parts)
+        if end <= start:
+            continue
+        shift, key = _bin(start, end)
+        maxshift = max(maxshift, shift)
+        entries.append((key, start, end, i))
+    entries.sort()
+    return entries, maxshift
+
+
+def _clip(location, start, stop):
+    # the location of the part of location in start:stop, counted from start
+    parts = []
+    for part in location.parts:
+        if part.end <= start or part.start >= stop:
+            continue
+        if part.start < start:
+            pstart = _BeforePosition(0)
+        else:
+            pstart = part._start._shift(-start)
+        if part.end > stop:
+            pend = _AfterPosition(stop-start)
+        else:
+            pend = part._end._shift(-start)
+        parts.append(_FeatureLocation(pstart, pend, part.strand, ref=part.ref, ref_db=part.ref_db))
+    if not parts:
+        return None
+    if len(parts) == 1:
+        return parts[0]
+    return _CompoundLocation(parts, location.operator)
+
+
+class StoredSequence(object):
+    '''A sequence in a :class:`SequenceStore`.
+
+    Slicing returns a linear :class:`pydna.dseqrecord.Dseqrecord` of a
+    region. Only the part of the sequence in the region and the features
+    overlapping it are read from the file. The whole record is returned
+    by :meth:`record`.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = _mmap.mmap(self._file.fileno(), 0, access=_mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+        magic, version, size, count, self._maxshift = _store_header.unpack_from(self._buffer)
+        if magic != _store_magic:
+            raise ValueError("{} is not a pydna sequence store file.".format(path))
+        if version > _version:
+            raise ValueError("{} was stored with a newer version of pydna.".format(path))
+        offset = _store_header.size
+        self._record = self._buffer[offset:offset+size]
+        self._reader = _packed._Reader(self._record)
+        self._entries = _packed._Table(self._buffer, offset+size, _entry, count)
+        classname, name, identifier, description = self._reader.meta
+        self.name = self._reader.string(name) if name != -2 else None
+        self.id = self._reader.string(identifier) if identifier != -2 else None
+        self.description = self._reader.string(description) if description != -2 else None
+
+    def __len__(self):
+        return self._reader.length
+
+    @property
+    def circular(self):
+        return bool(self._reader.flags & _packed._CIRCULAR)
+
+    def __repr__(self):
+        return "StoredSequence({}, {} bp)".format(self.id, len(self))
+
+    def record(self):
+        '''Returns the whole stored record.'''
+        return _packed._unpack(self._record)
+
+    def _overlapping(self, start, stop):
+        # indices of the features overlapping start:stop in their original order
+        found = []
+        for shift in range(_first_shift, self._maxshift+1, _shift_step):
+            for b in range(start >> shift, ((stop-1) >> shift) + 1):
+                key = (shift << 48) | b
+                i = _bisect.bisect_left(self._entries, (key,))
+                while i < len(self._entries):
+                    k, fstart, fend, index = self._entries[i]
+                    if k != key or fstart >= stop:
+                        break
+                    if fend > start:
+                        found.append(index)
+                    i += 1
+        return sorted(found)
+
+    def __getitem__(self, sl):
+        if not isinstance(sl, slice):
+            raise TypeError("StoredSequence only supports slicing.")
+        if sl.step not in (None, 1):
+            raise ValueError("StoredSequence slices can not have a step.")
+        length = len(self)
+        start, stop = sl.start, sl.stop
+        start = 0 if start is None else start+length if start < 0 else start
+        stop = length if stop is None else stop+length if stop < 0 else stop
+        if self.circular and start > stop:
+            # region across the origin
+            result = self[start:] + self[:stop]
+            result.id = "{}:{}-{}".format(self.id, start+1, stop)
+            return result
+        start, stop, step = slice(start, stop).indices(length)
+        stop = max(start, stop)
+        reader = self._reader
+        if (reader.wspan != (0, length) or reader.cspan != (0, length) or
+            "watson" in reader.extras or "crick" in reader.extras):
+            # the stored sequence is not double stranded over its whole length
+            return self.record()[start:stop]
+        seq = _Dseq(reader.data(start, stop))
+        features = []
+        indices = self._overlapping(start, stop) if stop > start else []
+        for feature in _packed._features(reader, indices):
+            location = _clip(feature.location, start, stop)
+            if location is not None:
+                feature = _copy.copy(feature)
+                feature.location = location
+                features.append(feature)
+        result = _Dseqrecord(seq,
+                             name=self.name or "name",
+                             id="{}:{}-{}".format(self.id, start+1, stop),
+                             description=self.description or "description")
+        result.features = features
+        return result
+
+    def close(self):
+        '''Releases the memory map and closes the file.'''
+        self._entries.view.release()
+        self._reader = self._record = self._entries = None
+        self._buffer.release()
+        self._mmap.close()
+        self._file.close()
+
+
+class SequenceStore(object):
+    '''A directory of sequences with random access to regions.
+
+    Parameters
+    ----------
+    directory : str, optional
+        The directory of the store. It is made if it does not exist.
+        The default is the "sequences" directory in the pydna data
+        directory set by the pydna_data_dir environment variable.
+
+    Sequences are added with :meth:`add` or :meth:`download` and are
+    returned by their accession as :class:`StoredSequence` objects:
+
+    >>> store = SequenceStore()                     # doctest: +SKIP
+    >>> store.download("NC_001133.9")               # doctest: +SKIP
+    StoredSequence(NC_001133.9, 230218 bp)
+    >>> store["NC_001133.9"][1000:2000]             # doctest: +SKIP
+    Dseqrecord(-1000)
+    '''
+
+    def __init__(self, directory=None):
+        if directory is None:
+            directory = _os.path.join(_os.environ["pydna_data_dir"], "sequences")
+        _os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._open = {}
+
+    def _path(self, accession):
+        return _os.path.join(self.directory, _urlparse.quote(accession, safe="")+_suffix)
+
+    def add(self, record, accession=None):
+        '''Stores a Dseqrecord under accession, which is the id of the
+        record by default. A sequence stored under the same accession
+        before is replaced. Returns the :class:`StoredSequence`.'''
+        accession = accession or record.id
+        if not accession or accession in ("id", "id?", "."):
+            raise ValueError("The record has no id, an accession has to be given.")
+        blob = _packed._pack(record)
+        entries, maxshift = _index(record.features)
+        self._close(accession)
+        handle, temporary = _tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with _os.fdopen(handle, "wb") as f:
+            f.write(_store_header.pack(_store_magic, _version, len(blob), len(entries), maxshift))
+            f.write(blob)
+            f.write(b"".join(_entry.pack(*entry) for entry in entries))
+        _os.replace(temporary, self._path(accession))
+        _module_logger.info("stored %s in %s", accession, self.directory)
+        return self[accession]
+
+    def download(self, accession):
+        '''Downloads accession from Genbank using :func:`pydna.genbank.genbank`
+        and stores it. Returns the :class:`StoredSequence`.'''
+        from pydna.genbank import genbank
+        return self.add(genbank(accession), accession)
+
+    def __getitem__(self, accession):
+        if accession not in self._open:
+            path = self._path(accession)
+            if not _os.path.exists(path):
+                raise KeyError(accession)
+            self._open[accession] = StoredSequence(path)
+        return self._open[accession]
+
+    def __contains__(self, accession):
+        return _os.path.exists(self._path(accession))
+
+    def __iter__(self):
+        return iter(self.accessions())
+
+    def __len__(self):
+        return len(self.accessions())
+
+    def accessions(self):
+        '''Returns a sorted list of the stored accessions.'''
+        return sorted(_urlparse.unquote(name[:-len(_suffix)])
+                      for name in _os.listdir(self.directory) if name.endswith(_suffix))
+
+    def __delitem__(self, accession):
+        if accession not in self:
+            raise KeyError(accession)
+        self._close(accession)
+        _os.remove(self._path(accession))
+
+    def _close(self, accession):
+        stored = self._open.pop(accession, None)
+        if stored is not None:
+            stored.close()
+
+    def close(self):
+        '''Closes the memory mapped files of the store.'''
+        for accession in list(self._open):
+            self._close(accession)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return "SequenceStore({})".format(self.directory)
+
+
+if __name__=="__main__":
+    import os as _os
+    cached = _os.getenv("pydna_cached_funcs", "")
+    _os.environ["pydna_cached_funcs"]=""
+    import doctest
+    doctest.testmod(verbose=True, optionflags=doctest.ELLIPSIS)
+    _os.environ["pydna_cached_funcs"]=cached
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright 2013-2018 by Björn Johansson.  All rights reserved.
+# This code is part of the Python-dna distribution and governed by its
+# license.  Please see the LICENSE.txt file that should have been included
+# as part of this package.
+
+'''This module provides the :class:`TemplateIndex` class, a k-mer index of a
+PCR template that can be used instead of the template in :class:`pydna.amplify.Anneal`
+and :func:`pydna.amplify.pcr`.
+
+The index can be stored as memory mapped numpy files, so that it is only
+made once for large templates like chromosomes. This module needs numpy.'''
+
+import os       as _os
+import tempfile as _tempfile
+import logging  as _logging
+_module_logger = _logging.getLogger("pydna."+__name__)
+
+import numpy as _np
+
+from pydna.amplify import _kmer_index
+from pydna.amplify import annealing_sites as _annealing_sites
+from pydna.utils   import seguid          as _seg
+from pydna.cache   import digest          as _digest
+
+
+class TemplateIndex(object):
+    '''K-mer index of both strands of a template for primer annealing.
+
+    Parameters
+    ----------
+    template : Dseqrecord
+        The template sequence 5'-3'.
+
+    limit : int, optional
+        limit length of the annealing part of the primers, at most 32.
+        Only primers annealing with the same limit can use the index.
+
+    directory : str, optional
+        If given, the index is read from this directory if it was stored
+        there before, otherwise it is made and stored there. The arrays are
+        memory mapped, so several processes can share the same index.
+
+    Examples
+    --------
+    >>> from pydna.dseqrecord import Dseqrecord
+    >>> from pydna.templateindex import TemplateIndex
+    >>> from pydna.amplify import Anneal
+    >>> from pydna.readers import read
+    >>> template = Dseqrecord("tacactcaccgtctatcattatctactatcgactgtatcatctgatagcac")
+    >>> index = TemplateIndex(template)
+    >>> index
+    TemplateIndex(51, limit=13)
+    >>> p1 = read(">p1\\ntacactcaccgtctatcattatc", ds = False)
+    >>> p2 = read(">p2\\ngtgctatcagatgatacagtcg", ds = False)
+    >>> index.sites([p1, p2])
+    [([(23, 23)], []), ([], [(29, 22)])]
+    >>> Anneal((p1, p2), index).products
+    [Amplicon(51)]
+    '''
+
+    def __init__(self, template, limit=13, directory=None):
+        if not 0 < limit <= 32:
+            raise ValueError("limit has to be between 1 and 32, not {}".format(limit))
+        self.template = template
+        self.limit = limit
+        self.directory = directory
+        self._build()
+
+    def _build(self):
+        self.watson_index = self.crick_index = None
+        if self.directory:
+            self._load()
+        if self.watson_index is None:
+            seq = self.template.seq
+            tw, tc = (seq.watson, seq.crick) if seq.linear else (seq.watson*2, seq.crick*2)
+            self.watson_index = _kmer_index(tw, self.limit)
+            self.crick_index  = _kmer_index(tc, self.limit)
+            if self.directory:
+                self._save()
+
+    @property
+    def key(self):
+        '''The index is stored under this key. It is the SEGUID of the
+        template strands in their given orientation, the topology and the
+        limit. The lSEGUID or cSEGUID can not be used, since positions
+        depend on the orientation and origin of the template.'''
+        seq = self.template.seq
+        return "{}_{}_{}".format(_seg("{}|{}|{}".format(seq.ovhg, seq.watson, seq.crick)),
+                                 "circular" if seq.circular else "linear",
+                                 self.limit)
+
+    def _paths(self):
+        return [_os.path.join(self.directory, "{}.{}.npy".format(self.key, strand)) for strand in ("watson", "crick")]
+
+    def _load(self):
+        paths = self._paths()
+        if all(_os.path.exists(p) for p in paths):
+            # each file holds the codes and the positions as two rows of uint64
+            arrays = [_np.load(p, mmap_mode="r") for p in paths]
+            self.watson_index, self.crick_index = [(a[0], a[1].view(_np.int64)) for a in arrays]
+            _module_logger.info("loaded template index %s", self.key)
+
+    def _save(self):
+        _os.makedirs(self.directory, exist_ok=True)
+        for path, (codes, positions) in zip(self._paths(), (self.watson_index, self.crick_index)):
+            fd, tmp = _tempfile.mkstemp(dir=self.directory, suffix=".npy")
+            with _os.fdopen(fd, "wb") as f:
+                _np.save(f, _np.vstack((codes, positions.astype(_np.int64).view(_np.uint64))))
+            _os.replace(tmp, path)
+        _module_logger.info("saved template index %s", self.key)
+        self._load()
+
+    def sites(self, primers):
+        '''Returns the annealing sites for primers as :func:`pydna.amplify.annealing_sites`.'''
+        return _annealing_sites(primers, self.template, self.limit, index=self)
+
+    def __len__(self):
+        return len(self.template)
+
+    def __repr__(self):
+        return "TemplateIndex({}, limit={})".format(len(self), self.limit)
+
+    def __getstate__(self):
+        # stored indices are read from disk again instead of being pickled
+        state = self.__dict__.copy()
+        if self.directory:
+            state["watson_index"] = state["crick_index"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.watson_index is None:
+            self._build()
+
+    def __pydna_cache_key__(self):
+        return _digest("TemplateIndex", self.template, self.limit)
+
+
+if __name__=="__main__":
+    cached = _os.getenv("pydna_cached_funcs", "")
+    _os.environ["pydna_cached_funcs"]=""
+    import doctest
+    doctest.testmod(verbose=True, optionflags=doctest.ELLIPSIS)
+    _os.environ["pydna_cached_funcs"]=cached
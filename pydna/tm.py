@@ -6,6 +6,41 @@
 # as part of this package.
 import math as _math
 
+try:
+    import numpy as _np
+except ImportError:
+    _np = None
+
+from pydna import _thermodynamic_data
+
+# SantaLucia 1998 nearest neighbour and helix initiation data for tmstaluc98
+_nntermsl={ "AA": (7.9  , 22.2),
+            "TT": (7.9  , 22.2),
+            "AT": (7.2  , 20.4),
+            "TA": (7.2  , 21.3),
+            "CA": (8.5  , 22.7),
+            "TG": (8.5  , 22.7),
+            "GT": (8.4  , 22.4),
+            "AC": (8.4  , 22.4),
+            "CT": (7.8  , 21.0),
+            "AG": (7.8  , 21.0),
+            "GA": (8.2  , 22.2),
+            "TC": (8.2  , 22.2),
+            "CG": (10.6 , 27.2),
+            "GC": (9.8  , 24.4),
+            "GG": (8    , 19.9),
+            "CC": (8    , 19.9),
+            "A" : (0    , 0   ),
+            "C" : (0    , 0   ),
+            "G" : (0    , 0   ),
+            "T" : (0    , 0   )  }
+
+_helixinit = { "G": (-0.1 ,2.8),
+               "C": (-0.1 ,2.8),
+               "A": (-2.3, -4.1),
+               "T": (-2.3, -4.1) }
+
+
 def tmstaluc98(primer,*args, dnac=50, saltc=50, **kwargs):
     '''Returns the melting temperature (Tm) of the primer using
     the nearest neighbour algorithm. Formula and thermodynamic data
@@ -56,39 +91,14 @@ def tmstaluc98(primer,*args, dnac=50, saltc=50, **kwargs):
 
     '''
 
-    nntermsl={  "AA": (7.9  , 22.2),
-                "TT": (7.9  , 22.2),
-                "AT": (7.2  , 20.4),
-                "TA": (7.2  , 21.3),
-                "CA": (8.5  , 22.7),
-                "TG": (8.5  , 22.7),
-                "GT": (8.4  , 22.4),
-                "AC": (8.4  , 22.4),
-                "CT": (7.8  , 21.0),
-                "AG": (7.8  , 21.0),
-                "GA": (8.2  , 22.2),
-                "TC": (8.2  , 22.2),
-                "CG": (10.6 , 27.2),
-                "GC": (9.8  , 24.4),
-                "GG": (8    , 19.9),
-                "CC": (8    , 19.9),
-                "A" : (0    , 0   ),
-                "C" : (0    , 0   ),
-                "G" : (0    , 0   ),
-                "T" : (0    , 0   )  }
-
-    helixinit = {   "G": (-0.1 ,2.8),
-                    "C": (-0.1 ,2.8),
-                    "A": (-2.3, -4.1),
-                    "T": (-2.3, -4.1) }
     primer = primer.upper()
-    dH, dS = helixinit[primer[0]]
-    H ,  S = helixinit[primer[-1]]
+    dH, dS = _helixinit[primer[0]]
+    H ,  S = _helixinit[primer[-1]]
     dH = dH+H
     dS = dS+S
     for p in range(len(primer)):
         dn = primer[p:p+2]
-        H,S = nntermsl[dn]
+        H,S = _nntermsl[dn]
         dH+=H
         dS+=S
     R = 1.987 # universal gas constant in Cal/degrees C*Mol
@@ -220,8 +230,6 @@ def tmbresluc(primer, *args, primerc=500.0, saltc=50, thermodynamics=False, **kw
 
     '''
 
-    from . import _thermodynamic_data
-
     saltc = float(saltc)/1000
     pri  = primerc/10E7
     dS = -12.4
@@ -274,6 +282,218 @@ def basictm(primer, *args, **kwargs):
     primer = str(primer).lower()
     return (primer.count("a") + primer.count("t"))*2 + (primer.count("g") + primer.count("c"))*4
 
+def _codes(seqs, lookup, pad):
+    # The sequences as rows of codes in an array padded with pad, and their lengths.
+    seqs = [str(s).encode("ascii", "replace") for s in seqs]
+    lengths = _np.array([len(s) for s in seqs], dtype=_np.int64)
+    codes = _np.full((len(seqs), lengths.max() if len(seqs) else 0), pad, dtype=_np.uint8)
+    codes[_np.arange(codes.shape[1]) < lengths[:, None]] = lookup[_np.frombuffer(b"".join(seqs), dtype=_np.uint8)]
+    return codes, lengths
+
+
+def _nn_sums(codes, init, dHtable, dStable):
+    # dH and dS summed from left to right like the scalar functions, so the
+    # results are identical. Each column starts with the init values, the
+    # nearest neighbour values of the padding are zero.
+    pairs = codes[:, :-1], codes[:, 1:]
+    dH = _np.cumsum(_np.column_stack(init[0] + [dHtable[pairs]]), axis=1)[:, -1]
+    dS = _np.cumsum(_np.column_stack(init[1] + [dStable[pairs]]), axis=1)[:, -1]
+    return dH, dS
+
+
+def _bresluc_tables():
+    # 26 letters, an unknown character and the padding
+    dH = _np.full((28, 28), _np.nan)
+    dS = _np.full((28, 28), _np.nan)
+    for i in range(26):
+        for j in range(26):
+            if j in _thermodynamic_data.dHBr.get(i, {}):
+                dH[i, j] = _thermodynamic_data.dHBr[i][j]
+                dS[i, j] = _thermodynamic_data.dSBr[i][j]
+    dH[:, 27] = dS[:, 27] = 0
+    lookup = _np.full(256, 26, dtype=_np.uint8)
+    for i in range(26):
+        lookup[97+i] = lookup[65+i] = i
+    return lookup, dH, dS
+
+
+def _staluc_tables():
+    # A, C, G, T, an unknown character and the padding
+    dH = _np.full((6, 6), _np.nan)
+    dS = _np.full((6, 6), _np.nan)
+    for dn, (H, S) in _nntermsl.items():
+        if len(dn) == 2:
+            dH["ACGT".index(dn[0]), "ACGT".index(dn[1])] = H
+            dS["ACGT".index(dn[0]), "ACGT".index(dn[1])] = S
+    dH[:4, 5] = dS[:4, 5] = dH[5, 5] = dS[5, 5] = 0
+    helix = _np.full((2, 6), _np.nan)
+    for i, n in enumerate("ACGT"):
+        helix[:, i] = _helixinit[n]
+    lookup = _np.full(256, 4, dtype=_np.uint8)
+    for i, n in enumerate("ACGT"):
+        lookup[ord(n)] = lookup[ord(n.lower())] = i
+    return lookup, dH, dS, helix
+
+
+_tables = {}
+
+
+def _check(tm, seqs):
+    if _np.isnan(tm).any():
+        raise ValueError("No thermodynamic data for primer {}".format(seqs[int(_np.flatnonzero(_np.isnan(tm))[0])]))
+
+
+def _tmbresluc_many(seqs, *args, primerc=500.0, saltc=50, thermodynamics=False, **kwargs):
+    # positional arguments are ignored, like in tmbresluc
+    if "bresluc" not in _tables:
+        _tables["bresluc"] = _bresluc_tables()
+    lookup, dHtable, dStable = _tables["bresluc"]
+    codes, lengths = _codes(seqs, lookup, 27)
+    n = len(seqs)
+    saltc = float(saltc)/1000
+    pri  = primerc/10E7
+    dH, dS = _nn_sums(codes, ([_np.full(n, -3400.0)], [_np.full(n, -12.4)]), dHtable, dStable)
+    tm = (dH / (1.9872 * _math.log(pri / 1600) + dS) + (16.6 * _math.log(saltc)) / _math.log(10)) - 273.15
+    _check(tm, seqs)
+    if thermodynamics:
+        return tm, dH, dS
+    return tm
+
+
+def _tmstaluc98_many(seqs, *args, dnac=50, saltc=50, **kwargs):
+    # positional arguments are ignored, like in tmstaluc98
+    if not seqs:
+        return _np.array([])
+    if "staluc" not in _tables:
+        _tables["staluc"] = _staluc_tables()
+    lookup, dHtable, dStable, helix = _tables["staluc"]
+    codes, lengths = _codes(seqs, lookup, 5)
+    if (lengths == 0).any():
+        raise ValueError("Empty primer.")
+    first = codes[:, 0]
+    last = codes[_np.arange(len(seqs)), lengths-1]
+    dH, dS = _nn_sums(codes, ([helix[0][first], helix[0][last]], [helix[1][first], helix[1][last]]), dHtable, dStable)
+    R = 1.987
+    k = (dnac/4.0)*1e-9
+    dS = dS-0.368*(lengths-1)*_math.log(float(saltc)/1e3)
+    tm = ((1000* (-dH))/(-dS+(R * (_math.log(k)))))-273.15
+    _check(tm, seqs)
+    return tm
+
+
+def tm_many(seqs, formula=None, *args, **kwargs):
+    """Returns the melting temperatures of many primers.
+
+    The primers are encoded as rows of an integer array and the nearest
+    neighbour values for all primers are looked up and summed at once.
+    The results are identical to calling the formula for each primer.
+
+    Parameters
+    ----------
+    seqs : iterable
+        Primer sequences 5'-3' as strings or sequence objects.
+
+    formula : function, optional
+        :func:`tmbresluc` (default) or :func:`tmstaluc98`. Other functions
+        are called once per primer.
+
+    Keyword arguments, like primerc, dnac, saltc and thermodynamics, are
+    the same as for the formula.
+
+    Returns
+    -------
+    tm : numpy.ndarray
+        An array of the tm of each primer. A list is returned if numpy
+        is not installed.
+
+    Examples
+    --------
+    >>> from pydna.tm import tm_many, tmbresluc, tmstaluc98
+    >>> primers = ["ACGTCATCGACACTATCATCGAC", "ggatcctatcgtagcta"]
+    >>> tm_many(primers).tolist() == [tmbresluc(p) for p in primers]
+    True
+    >>> tm_many(primers, tmstaluc98, saltc=100).tolist() == [tmstaluc98(p, saltc=100) for p in primers]
+    True
+    """
+    formula = formula or tmbresluc
+    seqs = list(seqs)
+    if _np is not None and formula is tmbresluc:
+        return _tmbresluc_many(seqs, *args, **kwargs)
+    if _np is not None and formula is tmstaluc98:
+        return _tmstaluc98_many(seqs, *args, **kwargs)
+    result = [formula(s, *args, **kwargs) for s in seqs]
+    if _np is None:
+        return result
+    if kwargs.get("thermodynamics"):
+        return tuple(_np.array(x) for x in zip(*result))
+    return _np.array(result, dtype=float)
+
+def _tmstaluc98_prefixes(seq, *args, dnac=50, saltc=50, **kwargs):
+    # tmstaluc98 adds the helix initiation values of the first and last
+    # base before the nearest neighbour values. There are only two helix
+    # initiation values, so the sums are made for both and the one for the
+    # last base of each prefix is used.
+    if "staluc" not in _tables:
+        _tables["staluc"] = _staluc_tables()
+    lookup, dHtable, dStable, helix = _tables["staluc"]
+    codes = lookup[_np.frombuffer(seq.encode("ascii", "replace"), dtype=_np.uint8)]
+    if not len(codes):
+        return _np.array([])
+    pairs = codes[:-1], codes[1:]
+    dH, dS = {}, {}
+    for last in (0, 1):   # A and C have the same values as T and G
+        dH[last] = _np.cumsum(_np.concatenate(([helix[0][codes[0]] + helix[0][last]], dHtable[pairs])))
+        dS[last] = _np.cumsum(_np.concatenate(([helix[1][codes[0]] + helix[1][last]], dStable[pairs])))
+    gc = _np.isin(codes, (1, 2))
+    dH = _np.where(gc, dH[1], dH[0])
+    dS = _np.where(gc, dS[1], dS[0])
+    dH[_np.cumsum(codes == 4) > 0] = _np.nan
+    R = 1.987
+    k = (dnac/4.0)*1e-9
+    dS = dS-0.368*_np.arange(len(codes))*_math.log(float(saltc)/1e3)
+    return ((1000* (-dH))/(-dS+(R * (_math.log(k)))))-273.15
+
+
+def tm_prefixes(seq, formula=None, *args, **kwargs):
+    """Returns the melting temperatures of all prefixes of seq, seq[:1],
+    seq[:2] up to seq[:len(seq)], as an array.
+
+    For :func:`tmbresluc` (default) and :func:`tmstaluc98` the nearest
+    neighbour dH and dS are summed once along seq, so the tm of each prefix
+    is found in constant time. Other formulas are called for each prefix.
+    The results are identical to calling the formula for each prefix.
+    Prefixes with characters without thermodynamic data get nan. This
+    function needs numpy.
+
+    Examples
+    --------
+    >>> from pydna.tm import tm_prefixes, tmbresluc
+    >>> seq = "ACGTCATCGACACTATCATCGAC"
+    >>> tm_prefixes(seq).tolist() == [tmbresluc(seq[:n]) for n in range(1, len(seq)+1)]
+    True
+    """
+    if _np is None:
+        raise ImportError("tm_prefixes needs numpy.")
+    formula = formula or tmbresluc
+    seq = str(seq)
+    if formula is tmstaluc98:
+        return _tmstaluc98_prefixes(seq, *args, **kwargs)
+    if formula is not tmbresluc:
+        return _np.array([formula(seq[:n], *args, **kwargs) for n in range(1, len(seq)+1)], dtype=float)
+    if "bresluc" not in _tables:
+        _tables["bresluc"] = _bresluc_tables()
+    lookup, dHtable, dStable = _tables["bresluc"]
+    primerc = kwargs.get("primerc", 500.0)
+    saltc = float(kwargs.get("saltc", 50))/1000
+    pri  = primerc/10E7
+    codes = lookup[_np.frombuffer(seq.encode("ascii", "replace"), dtype=_np.uint8)]
+    pairs = codes[:-1], codes[1:]
+    dH = _np.cumsum(_np.concatenate(([-3400.0], dHtable[pairs])))
+    dS = _np.cumsum(_np.concatenate(([-12.4], dStable[pairs])))
+    # a character without data gives nan for all prefixes that contain it
+    dH[_np.cumsum(codes == 26) > 0] = _np.nan
+    return (dH / (1.9872 * _math.log(pri / 1600) + dS) + (16.6 * _math.log(saltc)) / _math.log(10)) - 273.15
+
 # http://www.promega.com/techserv/tools/biomath/calc11.htm#melt_results        
         
 
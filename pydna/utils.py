@@ -6,20 +6,20 @@
 # as part of this package.
 '''This module provides miscellaneous functions.'''
 
-import shelve      as _shelve
 import os          as _os
 import re          as _re
 import logging     as _logging
-import base64      as _base64
-import pickle      as _pickle
-import hashlib     as _hashlib
 import keyword     as _keyword
 import collections as _collections
 import itertools   as _itertools
+import base64      as _base64
+import hashlib     as _hashlib
+import concurrent.futures as _futures
 _module_logger = _logging.getLogger("pydna."+__name__)
 
 from Bio.SeqUtils.CheckSum  import seguid   as _base64_seguid
 from pydna._pretty  import pretty_str       as _pretty_str
+from pydna          import cache            as _cache
 from Bio.Seq             import _maketrans
 from Bio.Seq             import reverse_complement as _reverse_complement
 from Bio.Data.IUPACData  import ambiguous_dna_complement as _amb_compl
@@ -29,10 +29,14 @@ from Bio.Seq import reverse_complement as _rc
 
 _amb_compl.update({"U":"A"})
 _complement_table = _maketrans(_amb_compl)
+_bytes_complement_table = "".join(map(chr, range(256))).translate(_complement_table).encode("latin-1")
 
 
 def memorize(filename):
-    """Decorator for caching fucntions and classes, see pydna.download and pydna.Assembly for use"""
+    """Decorator for caching fucntions and classes, see pydna.download and pydna.Assembly for use.
+
+    Results are stored by the cache backend in :mod:`pydna.cache` under filename
+    if filename is listed in the pydna_cached_funcs environment variable."""
     def decorator(f):
         def wrappee( *args, **kwargs):
             _module_logger.info( "#### memorizer ####" )
@@ -41,21 +45,34 @@ def memorize(filename):
             if filename not in _os.environ["pydna_cached_funcs"]:
                 _module_logger.info("cache filename not among cached functions, made it new!")
                 return f(*args, **kwargs)               
-            key = _base64.urlsafe_b64encode(_hashlib.sha1(_pickle.dumps((args, kwargs))).digest()).decode("ascii")
+            key = _cache.key(args, kwargs)
             _module_logger.info( "key = %s", key )
-            cache = _shelve.open(_os.path.join(_os.environ["pydna_data_dir"], identifier_from_string(filename)), writeback=False)
+            ttl = _cache.ttl(filename)
             try:
-                result = cache[key]
+                result = _cache.memory.get(filename, key, ttl)
             except KeyError:
-                _module_logger.info("no result for key %s in shelve %s", key, identifier_from_string(filename))
+                pass
+            else:
+                _cache._stats[filename][0] += 1
+                _cache._stats[filename][2] += 1
+                _module_logger.info( "found %s in memory", key)
+                return result
+            cache = _cache.backend()
+            try:
+                result = cache.get(filename, key, ttl)
+            except KeyError:
+                _cache._stats[filename][1] += 1
+                _module_logger.info("no result for key %s in cache %s", key, filename)
                 result = f(*args, **kwargs)
                 _module_logger.info("made it new!")
-                cache[key] = result
+                cache.set(filename, key, result)
                 _module_logger.info("saved result under key %s", key)
             else:
+                _cache._stats[filename][0] += 1
                 _module_logger.info( "found %s in cache", key)
-            cache.close()
+            _cache.memory.set(filename, key, result)
             return result
+        wrappee.cache_name = filename
         return wrappee
     return decorator        
 
@@ -205,38 +222,78 @@ def eq(*args,**kwargs):
     return same
 
 
-def SmallestRotation(s):
-    prev,rep = None,0
-    ds=2*s
-    lends=len(ds)
-    old = 0
-    k = 0
-    w=""
-    while k < lends:
-        i,j = k,k+1
-        while j < lends and ds[i] <= ds[j]:
-            i = (ds[i] == ds[j]) and i+1 or k
+def _min_rotation_index(seq):
+    '''Returns the start position of the lexicographically smallest rotation
+    of seq, which can be any sequence of comparable items (Duval).'''
+    n = len(seq)
+    ds = seq+seq
+    i = ans = 0
+    while i < n:
+        ans = i
+        j, k = i+1, i
+        while j < 2*n and ds[k] <= ds[j]:
+            k = i if ds[k] < ds[j] else k+1
             j += 1
-        while k < i+1:
-            k += j-i
-            prev=w
-            w=ds[old:k]
-            old = k
-            if w == prev:
-                rep += 1
-            else:
-                prev,rep = w,1
-            if len(w)*rep == len(s):
-                return w*rep
-            
-            
-#try:
-#    import pyximport
-#except ImportError:
-#    pass
-#else:
-#    pyximport.install()
-#    from pydna._smallest import SmallestRotation
+        while i <= k:
+            i += j-k
+    return ans
+
+
+_smaller = [dict.fromkeys(range(o)) for o in range(256)]
+
+
+def SmallestRotation(s):
+    '''Returns the lexicographically smallest rotation of the str or bytes s.
+
+    The smallest rotation has to start with one of the longest runs of the
+    smallest character. The sequence is cut into blocks at these runs, and
+    the smallest rotation of the list of blocks is found with Duval's
+    algorithm. Comparing blocks as strings gives the same order as
+    comparing the rotations, since no block contains a run as long as the
+    one it starts with. There are usually only a few blocks, so that
+    almost all work is done by str.find and string comparisons.
+
+    Examples
+    --------
+    >>> from pydna.utils import SmallestRotation
+    >>> SmallestRotation("tttaaa")
+    'aaattt'
+    >>> SmallestRotation(b"GATCGAT")
+    b'ATCGATG'
+    '''
+    n = len(s)
+    if n < 2:
+        return s
+    # the smallest character, min(s) is slow for long strings.
+    # If c is not the smallest, removing the smaller characters shortens s
+    c = min(s[:64])
+    if isinstance(s, (bytes, bytearray)):
+        if len(s.translate(None, bytes(range(c)))) < n:
+            c = min(s)
+        c = bytes((c,))
+    elif ord(c) > 255 or len(s.translate(_smaller[ord(c)])) < n:
+        c = min(s)
+    # rotate so that s does not start inside a run of c
+    p = n - len(s.lstrip(c))
+    if p == n:
+        return s
+    s = s[p:] + s[:p]
+    # all runs of the longest length m are found with str.find
+    run = c
+    while run+c in s:
+        run += c
+    starts = []
+    i = s.find(run)
+    while i != -1:
+        starts.append(i)
+        i = s.find(run, i+len(run))
+    if len(starts) > 1:
+        blocks = [s[a:b] for a, b in zip(starts, starts[1:])]
+        blocks.append(s[starts[-1]:] + s[:starts[0]])
+        start = starts[_min_rotation_index(blocks)]
+    else:
+        start = starts[0]
+    return s[start:] + s[:start]
     
 
 def identifier_from_string(s:str) -> str:
@@ -275,6 +332,107 @@ def cseguid(seq: str) -> _pretty_str:
     return seguid( min( SmallestRotation(seq.upper()), SmallestRotation(str(_rc(seq)).upper())))
 
 
+def _sha1_b64(seq):
+    # seguid of an uppercase str
+    return _pretty_str(_base64.urlsafe_b64encode(_hashlib.sha1(seq.encode("latin-1")).digest()).decode("ascii").rstrip("="))
+
+
+def _seguid_chunk(seqs):
+    return [_sha1_b64(s.upper()) for s in seqs]
+
+
+def _lseguid_chunk(seqs):
+    result = []
+    for s in seqs:
+        u = s.upper()
+        if "U" in u: # RNA is complemented differently by Biopython
+            result.append(lseguid(s))
+        else:
+            result.append(_sha1_b64(min(u, u.translate(_complement_table)[::-1])))
+    return result
+
+
+def _cseguid_chunk(seqs):
+    result = []
+    for s in seqs:
+        u = s.upper()
+        if "U" in u:
+            result.append(cseguid(s))
+        else:
+            result.append(_sha1_b64(min(SmallestRotation(u), SmallestRotation(u.translate(_complement_table)[::-1]))))
+    return result
+
+
+def _checksums(chunkfunc, seqs, as_dict, n_jobs, chunksize):
+    n_jobs = n_jobs or _os.cpu_count() or 1
+    def results():
+        items = iter(seqs)
+        with _futures.ThreadPoolExecutor(n_jobs) as pool:
+            while True:
+                window = list(_itertools.islice(items, chunksize*n_jobs))
+                if not window:
+                    break
+                strings = [str(getattr(item, "seq", item)) for item in window]
+                futures = [pool.submit(chunkfunc, strings[i:i+chunksize]) for i in range(0, len(strings), chunksize)]
+                for item, checksum in zip(window, _itertools.chain.from_iterable(f.result() for f in futures)):
+                    yield item, checksum
+    if as_dict:
+        unique = _collections.OrderedDict()
+        for item, checksum in results():
+            unique.setdefault(checksum, item)
+        return unique
+    return (checksum for item, checksum in results())
+
+
+def seguid_many(seqs, as_dict=False, n_jobs=None, chunksize=256):
+    '''Returns the :func:`seguid` for each sequence in seqs.
+
+    The checksums are calculated in chunks of chunksize sequences on n_jobs
+    threads (one per CPU by default), while seqs is read. seqs can be any
+    iterable of strings or sequence objects like Dseqrecords.
+
+    Returns
+    -------
+    iterator or OrderedDict
+        An iterator over the checksums in the same order as seqs. If
+        as_dict is True, an OrderedDict with each checksum as key and the
+        first sequence with that checksum as value.
+
+    Examples
+    --------
+    >>> from pydna.utils import seguid_many
+    >>> list(seguid_many(["aaaaaaa", "AAAAAAA", "tttttt"]))
+    ['-bKGnebMkia5kNg_gF7IORXMnIU', '-bKGnebMkia5kNg_gF7IORXMnIU', 'yxicz3momCL24LIxXBRiivblf9k']
+    >>> seguid_many(["aaaaaaa", "AAAAAAA", "tttttt"], as_dict=True)
+    OrderedDict([('-bKGnebMkia5kNg_gF7IORXMnIU', 'aaaaaaa'), ('yxicz3momCL24LIxXBRiivblf9k', 'tttttt')])
+    '''
+    return _checksums(_seguid_chunk, seqs, as_dict, n_jobs, chunksize)
+
+
+def lseguid_many(seqs, as_dict=False, n_jobs=None, chunksize=256):
+    '''Returns the :func:`lseguid` for each sequence in seqs, see :func:`seguid_many`.
+
+    Examples
+    --------
+    >>> from pydna.utils import lseguid_many
+    >>> list(lseguid_many(["aaacccggt", "ACCGGGTTT"]))
+    ['lSakF0OUuIQNdbSq4Ygj4kABQgg', 'lSakF0OUuIQNdbSq4Ygj4kABQgg']
+    '''
+    return _checksums(_lseguid_chunk, seqs, as_dict, n_jobs, chunksize)
+
+
+def cseguid_many(seqs, as_dict=False, n_jobs=None, chunksize=256):
+    '''Returns the :func:`cseguid` for each sequence in seqs, see :func:`seguid_many`.
+
+    Examples
+    --------
+    >>> from pydna.utils import cseguid_many
+    >>> list(cseguid_many(["aaacccggt", "cggtaaacc", "ACCGGGTTT"]))
+    ['lSakF0OUuIQNdbSq4Ygj4kABQgg', 'lSakF0OUuIQNdbSq4Ygj4kABQgg', 'lSakF0OUuIQNdbSq4Ygj4kABQgg']
+    '''
+    return _checksums(_cseguid_chunk, seqs, as_dict, n_jobs, chunksize)
+
+
 def flatten(*args): # flatten
     """Flattens an iterable of iterables down to str, bytes, bytearray or any of the pydna or Biopython seq objects"""
     output = []
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''Compares pydna.utils.SmallestRotation with the Lyndon factorization it
+replaced for random circular sequences of 100 kb and longer.
+
+    python scripts/benchmark_smallest_rotation.py
+'''
+
+import random
+import timeit
+
+from pydna.utils import SmallestRotation, cseguid
+
+
+def lyndon_smallest_rotation(s):
+    # the earlier pydna implementation
+    prev,rep = None,0
+    ds=2*s
+    lends=len(ds)
+    old = 0
+    k = 0
+    w=""
+    while k < lends:
+        i,j = k,k+1
+        while j < lends and ds[i] <= ds[j]:
+            i = (ds[i] == ds[j]) and i+1 or k
+            j += 1
+        while k < i+1:
+            k += j-i
+            prev=w
+            w=ds[old:k]
+            old = k
+            if w == prev:
+                rep += 1
+            else:
+                prev,rep = w,1
+            if len(w)*rep == len(s):
+                return w*rep
+
+
+random.seed(42)
+
+print("{:>10} {:>12} {:>12} {:>8}".format("length", "old (ms)", "new (ms)", "speedup"))
+for length in (100000, 300000, 1000000, 3000000):
+    s = "".join(random.choice("ACGT") for i in range(length))
+    assert SmallestRotation(s) == lyndon_smallest_rotation(s)
+    number = 5
+    old = timeit.timeit(lambda: lyndon_smallest_rotation(s), number=number)/number
+    new = timeit.timeit(lambda: SmallestRotation(s), number=number)/number
+    print("{:>10} {:>12.2f} {:>12.2f} {:>7.0f}x".format(length, old*1000, new*1000, old/new))
+
+s = "".join(random.choice("ACGT") for i in range(1000000))
+print("cseguid of a 1 Mb sequence: {:.1f} ms".format(timeit.timeit(lambda: cseguid(s), number=5)/5*1000))
@@ -680,5 +680,102 @@ def test_shifts():
     actacacacgtactgactGcctccaagatagagtcagtaaccacagct''')
     f=pcr(f,r,t)
 
+def test_annealing_positions_many():
+    import random
+    from pydna.amplify import _annealing_positions, _annealing_positions_many
+    from pydna.utils import rc
+    random.seed(42)
+    for trial in range(200):
+        t = "".join(random.choice("ACGTacgtN") for i in range(random.randint(0, 300)))
+        primers = []
+        for j in range(random.randint(1, 20)):
+            if t and random.random() < 0.7:
+                a = random.randint(0, len(t))
+                p = t[a:a+random.randint(0, 30)]
+                p = rc(p) if random.random() < 0.5 else p
+                p = "".join(random.choice("RYSWKMBDHVN") if random.random() < 0.1 else c for c in p)
+            else:
+                p = "".join(random.choice("ACGTRYN") for i in range(random.randint(0, 25)))
+            primers.append("gg"+p if random.random() < 0.3 else p)
+        limit = random.randint(1, 14)
+        assert _annealing_positions_many(primers, t, limit) == [_annealing_positions(p, t, limit) for p in primers]
+
+
+def test_annealing_sites():
+    from pydna.amplify import annealing_sites, Anneal
+    from pydna.dseqrecord import Dseqrecord
+    from pydna.primer import Primer
+    t = Dseqrecord("tacactcaccgtctatcattatctactatcgactgtatcatctgatagcac", circular=True)
+    primers = [Primer("tacactcaccgtctatcattatc"),
+               Primer("gtgctatcagatgatacagtcg"),
+               Primer("atcattatctactatcgactg"),
+               Primer("tcgatagtagataatgatagac"),
+               Primer("ccccccccccccccc")]
+    ann = Anneal(primers, t)
+    sites = annealing_sites(primers, t)
+    assert sorted(p.position for p in ann.forward_primers) == sorted(pos for fw, rv in sites for pos, fp in fw)
+    assert sorted(p.position for p in ann.reverse_primers) == sorted(pos for fw, rv in sites for pos, fp in rv)
+    assert sites[-1] == ([], [])
+
+
+def test_annealing_positions_mismatched():
+    import random
+    from pydna.amplify import _annealing_positions, _annealing_positions_mismatched, _iupac
+    from pydna.utils import rc
+    random.seed(7)
+    for trial in range(100):
+        t = "".join(random.choice("ACGTacgtN") for i in range(random.randint(0, 300)))
+        primers = []
+        for j in range(random.randint(1, 10)):
+            if len(t) > 30 and random.random() < 0.7:
+                a = random.randint(0, len(t)-30)
+                p = list(rc(t[a:a+random.randint(10, 30)]))
+                for i in range(random.randint(0, 3)):
+                    p[random.randrange(len(p))] = random.choice("ACGTR")
+                p = "".join(p)
+            else:
+                p = "".join(random.choice("ACGTRYN") for i in range(random.randint(0, 25)))
+            primers.append(p)
+        limit = random.randint(1, 14)
+        assert ([[s[:2] for s in sites] for sites in _annealing_positions_mismatched(primers, t, limit, 0)] ==
+                [_annealing_positions(p, t, limit) for p in primers])
+        for k in (1, 2):
+            for p, sites in zip(primers, _annealing_positions_mismatched(primers, t, limit, k)):
+                head = rc(p)[:limit].upper()
+                expected = []
+                for pos in range(len(t)-limit+1):
+                    wrong = [j for j, c in enumerate(head) if t[pos+j].upper() not in _iupac[c]]
+                    if len(p) >= limit and len(wrong) <= k:
+                        expected.append((pos, len(wrong), wrong[0] if wrong else None))
+                assert [(s[0], s[2], s[3]) for s in sites] == expected
+
+
+def test_anneal_mismatches():
+    from pydna.amplify import Anneal, pcr
+    from pydna.dseqrecord import Dseqrecord
+    t = Dseqrecord("tacactcaccgtctatcattatctactatcgactgtatcatctgatagcac", circular=True)
+    primers = ["tacactcaccgtctatcatgatc", "gtgctatcagatgatacagtcg"]
+    assert Anneal(primers, t).forward_primers == []
+    ann = Anneal(primers, t, max_mismatches=1)
+    fp, = ann.forward_primers
+    rp, = ann.reverse_primers
+    assert (fp.position, fp.mismatches, fp.three_prime_mismatch) == (23, 1, 3)
+    assert (rp.position, rp.mismatches, rp.three_prime_mismatch) == (29, 0, None)
+    assert "(1 mismatch, closest 3 nt from the 3' end)" in ann.report()
+    assert len(pcr(primers, t, max_mismatches=1)) == 51
+
+    # primers across the origin of a circular template
+    s = t.shifted(30)
+    ann = Anneal(["tacactcaccgtctatcatgatc", "gtgctatcagatgatacagtcg"], s, max_mismatches=2)
+    assert [p.position for p in ann.forward_primers] == [44]
+    assert [(p.position, p.mismatches) for p in ann.reverse_primers] == [(50, 0)]
+
+    # the mismatched nucleotides of the primers are in the product
+    linear = Dseqrecord("tacactcaccgtctatcattatctactatcgactgtatcatctgatagcac")
+    product = pcr(["ccctacactcaccgtctatcatgatc", "gtgctatcagatgatacagtcg"], linear, max_mismatches=1)
+    assert product.seq.watson == "ccctacactcaccgtctatcatgatctactatcgactgtatcatctgatagcac"
+    assert str(product.seq.crick) == str(product.seq.reverse_complement().watson)
+
+
 if __name__ == '__main__':
     pytest.main([__file__, "-vv", "-s", "--cov=pydna","--cov-report=html"])
\ No newline at end of file
@@ -635,6 +635,108 @@ def test_assemble_pGUP1(monkeypatch):
     assert pGUP1.seguid() == "42wIByERn2kSe_Exn405RYwhffU"
     
   
+def test_shared_suffix_array(monkeypatch):
+    monkeypatch.setenv("pydna_cached_funcs", "")
+    import random
+    from pydna.dseqrecord import Dseqrecord
+    from pydna.assembly import Assembly
+    from pydna.common_sub_strings import common_sub_strings
+
+    def pairwise(x, y, limit):
+        return common_sub_strings(x, y, limit)
+
+    random.seed(1)
+    def rnd(n):
+        return "".join(random.choice("gatc") for i in range(n))
+    overlaps = [rnd(30) for i in range(7)]
+    fragments = [Dseqrecord(overlaps[i]+rnd(100)+overlaps[i+1]) for i in range(6)]
+    fragments.append(Dseqrecord(overlaps[6]+rnd(50)+overlaps[0]))
+    fragments[3] = fragments[3].rc()
+
+    asm1 = Assembly(fragments, limit=25)
+    asm2 = Assembly(fragments, limit=25, algorithm=pairwise)
+
+    assert sorted(asm1.G.edges()) == sorted(asm2.G.edges())
+    assert [c.cseguid() for c in asm1.circular_products] == [c.cseguid() for c in asm2.circular_products]
+    assert [c.lseguid() for c in asm1.linear_products] == [c.lseguid() for c in asm2.linear_products]
+    assert len(asm1.circular_products) == 1
+
+
+def test_lazy_products(monkeypatch):
+    monkeypatch.setenv("pydna_cached_funcs", "")
+    from pydna.dseqrecord import Dseqrecord
+    from pydna.assembly import Assembly
+    from pydna import _PydnaWarning
+
+    a = Dseqrecord("acgatgctatactgCCCCCtgtgctgtgctcta")
+    b = Dseqrecord("tgtgctgtgctctaTTTTTtattctggctgtatc")
+    c = Dseqrecord("tattctggctgtatcGGGGGtacgatgctatactg")
+
+    x = Assembly((a,b,c), limit=14)
+    assert x._linear is None and x._circular is None
+    assert sorted(len(p) for p in x.iter_linear()) == [14, 54, 73]
+    assert x._linear is None
+    assert [len(p) for p in x.linear] == [73, 54, 14]
+    assert x.linear is x.linear_products
+    assert [len(p) for p in x.iter_circular()] == [59]
+    assert [len(p) for p in x.circular_products] == [59]
+
+    y = Assembly((a,b,c), limit=14, max_products=1)
+    assert len(y.linear_products) == 1
+    assert len(y.circular_products) == 1
+    assert len(list(y.iter_linear(max_products=2))) == 2
+    assert list(y.iter_linear(max_products=0)) == []
+    assert list(x.iter_circular(max_products=0)) == []
+
+    z = Assembly((a,b,c), limit=14, timeout=1e-12)
+    with pytest.warns(_PydnaWarning):
+        assert z.linear_products == []
+    import warnings
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        assert z.circular_products == []
+    assert len([w for w in caught if issubclass(w.category, _PydnaWarning)]) == 1
+
+    # the time is out after the first cycle was found, its product is built
+    import itertools
+    import pydna.assembly
+    clock = itertools.chain([0, 0], itertools.repeat(10))
+    class Time(object):
+        @staticmethod
+        def time():
+            return next(clock)
+    monkeypatch.setattr(pydna.assembly, "_time", Time)
+    with pytest.warns(_PydnaWarning):
+        assert [len(p) for p in x.iter_circular(timeout=1)] == [59]
+
+
+def test_parallel(monkeypatch):
+    monkeypatch.setenv("pydna_cached_funcs", "")
+    import random
+    from concurrent.futures import ThreadPoolExecutor
+    from pydna.dseqrecord import Dseqrecord
+    from pydna.assembly import Assembly
+    from pydna.common_sub_strings import terminal_overlap
+
+    random.seed(7)
+    def rnd(n): return "".join(random.choice("ACGT") for i in range(n))
+    ends = [rnd(30) for i in range(6)]
+    frags = [Dseqrecord(ends[i]+rnd(200)+ends[i+1]) for i in range(5)]
+    frags.append(Dseqrecord(ends[5]+rnd(200)+ends[0]))
+
+    def result(x):
+        return (list(x.G.nodes()),
+                sorted((u, v, d["start"], d["end"]) for u, v, d in x.G.edges(data=True)),
+                [str(p.seq) for p in x.linear_products],
+                [str(p.seq) for p in x.circular_products])
+
+    for kwargs in ({}, {"algorithm": terminal_overlap}):
+        serial = result(Assembly(frags, limit=25, **kwargs))
+        with ThreadPoolExecutor(2) as executor:
+            assert result(Assembly(frags, limit=25, executor=executor, **kwargs)) == serial
+        assert result(Assembly(frags, limit=25, n_jobs=2, **kwargs)) == serial
+
+
 def test_35(monkeypatch):
     import sys
     sys.modules.pop("pydna.assembly", None)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import pytest
+
+
+def test_parse_size():
+    from pydna.cache import _parse_size
+    assert _parse_size("0") == 0
+    assert _parse_size("1000") == 1000
+    assert _parse_size("2kB") == 2048
+    assert _parse_size("1.5 MB") == 1572864
+    assert _parse_size("1GiB") == 1024**3
+    with pytest.raises(ValueError):
+        _parse_size("much")
+
+
+def test_ttl(monkeypatch):
+    from pydna.cache import ttl
+    monkeypatch.setenv("pydna_cached_funcs", "pydna.genbank.Genbank.nucleotide:3600, pydna.amplify.Anneal")
+    assert ttl("pydna.genbank.Genbank.nucleotide") == 3600
+    assert ttl("pydna.amplify.Anneal") is None
+    assert ttl("pydna.assembly.Assembly") is None
+
+
+def test_sqlite_backend(tmpdir):
+    from pydna.cache import SQLiteCache
+    cache = SQLiteCache(str(tmpdir.join("cache.sqlite")))
+    with pytest.raises(KeyError):
+        cache.get("f", "a")
+    cache.set("f", "a", [1, 2, 3])
+    cache.set("g", "a", "abc")
+    assert cache.get("f", "a") == [1, 2, 3]
+    assert cache.get("g", "a") == "abc"
+    assert sorted(cache.info()) == ["f", "g"]
+    assert cache.info()["f"][0] == 1
+    with pytest.raises(KeyError):
+        cache.get("f", "a", ttl=-1)
+    assert "f" not in cache.info()
+    cache.clear("g")
+    assert cache.info() == {}
+
+
+def test_sqlite_eviction(tmpdir):
+    import pickle
+    import time
+    from pydna.cache import SQLiteCache
+    size = len(pickle.dumps("x"*1000, protocol=pickle.HIGHEST_PROTOCOL))
+    cache = SQLiteCache(str(tmpdir.join("cache.sqlite")), max_bytes=3*size)
+    for key in "abc":
+        cache.set("f", key, "x"*1000)
+        time.sleep(0.01)
+    assert cache.get("f", "a") == "x"*1000
+    time.sleep(0.01)
+    cache.set("f", "d", "x"*1000)
+    assert cache.info()["f"] == (3, 3*size)
+    with pytest.raises(KeyError):
+        cache.get("f", "b")
+    assert cache.get("f", "a") == "x"*1000
+
+
+def test_sqlite_processes(tmpdir):
+    import multiprocessing
+    from pydna.cache import SQLiteCache
+    cache = SQLiteCache(str(tmpdir.join("cache.sqlite")))
+    cache.set("f", "parent", 0)
+    pool = multiprocessing.Pool(4)
+    pool.starmap(cache.set, [("f", str(i), i) for i in range(20)])
+    pool.close()
+    pool.join()
+    assert cache.info()["f"][0] == 21
+    assert cache.get("f", "19") == 19
+
+
+def test_memorize_sqlite(monkeypatch, tmpdir):
+    import pydna
+    from pydna.utils import memorize
+
+    calls = []
+
+    @memorize("test_memorize_sqlite")
+    def f(x):
+        calls.append(x)
+        return x*2
+
+    monkeypatch.setenv("pydna_data_dir", str(tmpdir))
+    monkeypatch.setenv("pydna_cache_backend", "sqlite")
+    monkeypatch.setenv("pydna_cached_funcs", "test_memorize_sqlite")
+
+    assert f(1) == 2
+    assert f(1) == 2
+    assert f(2) == 4
+    assert calls == [1, 2]
+    info = pydna.cache_info()["test_memorize_sqlite"]
+    assert (info.hits, info.misses, info.entries) == (1, 2, 2)
+    assert (info.memory_hits, info.memory_entries) == (1, 2)
+
+    pydna.cache_clear(f)
+    assert "test_memorize_sqlite" not in pydna.cache_info()
+    assert f(1) == 2
+    assert calls == [1, 2, 1]
+
+    monkeypatch.setenv("pydna_cached_funcs", "test_memorize_sqlite:-1")
+    assert f(1) == 2
+    assert calls == [1, 2, 1, 1]
+
+
+def test_memory_cache(monkeypatch):
+    from pydna.cache import MemoryCache
+    monkeypatch.setenv("pydna_cache_memory_entries", "3")
+    monkeypatch.setenv("pydna_cache_memory_size", "1MB")
+    cache = MemoryCache()
+    value = [1, 2, 3]
+    cache.set("f", "a", value)
+    copy = cache.get("f", "a")
+    assert copy == value and copy is not value
+    copy.append(4)
+    assert cache.get("f", "a") == [1, 2, 3]
+    for key in "bcd":
+        cache.set("f", key, key)
+    with pytest.raises(KeyError):
+        cache.get("f", "a")
+    cache.get("f", "b")
+    cache.set("g", "e", "e")
+    with pytest.raises(KeyError):
+        cache.get("f", "c")
+    assert cache.info() == {"f": (2, cache.info()["f"][1]), "g": (1, cache.info()["g"][1])}
+    with pytest.raises(KeyError):
+        cache.get("g", "e", ttl=-1)
+    cache.clear("f")
+    assert cache.info() == {}
+    monkeypatch.setenv("pydna_cache_memory_size", "10")
+    cache.set("f", "big", "x"*100)
+    assert cache.info() == {}
+
+
+def test_memorize_memory(monkeypatch, tmpdir):
+    from pydna.utils import memorize
+    from pydna.cache import backend
+
+    @memorize("test_memorize_memory")
+    def f(x):
+        return [x]
+
+    monkeypatch.setenv("pydna_data_dir", str(tmpdir))
+    monkeypatch.setenv("pydna_cached_funcs", "test_memorize_memory")
+    result = f(1)
+    result.append(2)
+    backend().clear()
+    assert f(1) == [1]
+
+
+def test_key():
+    import pickle, hashlib, base64
+    from pydna.cache import key
+    from pydna.dseq import Dseq
+    from pydna.dseqrecord import Dseqrecord
+    from pydna.primer import Primer
+    from pydna.seqfeature import SeqFeature
+    from Bio.SeqFeature import FeatureLocation
+
+    args, kwargs = (1,), {"kw": 1}
+    old = base64.urlsafe_b64encode(hashlib.sha1(pickle.dumps((args, kwargs))).digest()).decode("ascii")
+    assert key(args, kwargs) == old
+
+    a = Dseqrecord("GATCaattcc")
+    b = Dseqrecord("GATCaattcc")
+    b.annotations["date"] = "01-JAN-2000"
+    assert key((a,), {}) == key((b,), {})
+    assert key(([a], 13), {}) == key(([b], 13), {})
+    assert key(([a], 13), {}) != key(([b], 14), {})
+    assert key((), {"template": a, "limit": 13}) == key((), {"limit": 13, "template": b})
+    assert key((a,), {}) != key((Dseqrecord("gatcaattcc"),), {})
+    assert key((a,), {}) != key((a.reverse_complement(),), {})
+    assert key((a,), {}) != key((a.looped(),), {})
+    b.name = "other"
+    assert key((a,), {}) != key((b,), {})
+    c = Dseqrecord("GATCaattcc")
+    c.features.append(SeqFeature(FeatureLocation(0, 4), type="misc"))
+    assert key((a,), {}) != key((c,), {})
+
+    assert Dseq("GATC").__pydna_cache_key__() != Dseq("GATC", "GATCC").__pydna_cache_key__()
+    assert key((a,), {"n_jobs": 4}) == key((a,), {})
+    p = Primer("GATCaattcc")
+    assert key((p,), {}) != key((Primer("GATCaattcc", footprint=5),), {})
+    assert key((p,), {}) == key((Primer("GATCaattcc"),), {})
+
+
+def test_cache_name():
+    from pydna.cache import _cache_name
+    from pydna.assembly import Assembly
+    from pydna.genbank import Genbank
+    assert _cache_name(None) is None
+    assert _cache_name("pydna.amplify.Anneal") == "pydna.amplify.Anneal"
+    assert _cache_name(Assembly) == "pydna.assembly.Assembly"
+    assert _cache_name(Genbank("me@example.org").nucleotide) == "pydna.genbank.Genbank.nucleotide"
+    with pytest.raises(ValueError):
+        _cache_name(len)
+
+
+if __name__ == '__main__':
+    pytest.cmdline.main([__file__, "-v", "-s"])
@@ -69,8 +69,73 @@ def test_ ():
     '''
     
 
-    
-    
-    
+def test_numpy_backend():
+    pytest.importorskip("numpy")
+    import random
+    from pydna.common_sub_strings import Rstr_max
+
+    random.seed(42)
+
+    for alphabet in ("acgt", "ab", "a"):
+        for i in range(200):
+            strings = ["".join(random.choice(alphabet) for x in range(random.randint(2, 40)))
+                       for n in range(random.randint(1, 4))]
+            results = []
+            for backend in ("python", "numpy"):
+                rstr = Rstr_max(backend=backend)
+                for s in strings:
+                    rstr.add_str(s)
+                r = rstr.go()
+                results.append((list(rstr.res), list(rstr.lcp), r))
+            assert results[0] == results[1]
+
+    with pytest.raises(ValueError):
+        Rstr_max(backend="fortran")
+
+
+def test_common_sub_strings_many():
+    pytest.importorskip("numpy")
+    import random
+    from concurrent.futures import ThreadPoolExecutor
+    from pydna.common_sub_strings import common_sub_strings, common_sub_strings_many
+
+    random.seed(10)
+    base = "".join(random.choice("acgt") for i in range(600))
+    strings = [base[random.randint(0, 300):][:random.randint(50, 300)] +
+               "".join(random.choice("acgt") for i in range(50)) for j in range(8)]
+    expected = {}
+    for i in range(len(strings)):
+        for j in range(i+1, len(strings)):
+            m = common_sub_strings(strings[i], strings[j], 20)
+            if m:
+                expected[(i, j)] = m
+    assert common_sub_strings_many(strings, 20) == expected
+    with ThreadPoolExecutor(2) as executor:
+        assert common_sub_strings_many(strings, 20, executor=executor) == expected
+    assert common_sub_strings_many(["aaaa", "cccc"], 3) == {}
+
+
+def test_terminal_overlap():
+    import random
+    from pydna.common_sub_strings import common_sub_strings, terminal_overlap
+
+    def filtered(x, y, limit):
+        return [m for m in common_sub_strings(x, y, limit) if (m[0]==0 and m[1]+m[2]==len(y))
+                                                            or (m[1]==0 and m[0]+m[2]==len(x))]
+    random.seed(42)
+
+    def rnd(n, alphabet):
+        return "".join(random.choice(alphabet) for x in range(n))
+
+    for alphabet in ("acgt", "ac", "a", "aaaac"):
+        for i in range(200):
+            core = rnd(random.randint(1, 30), alphabet)
+            x = rnd(random.randint(0, 20), alphabet) + core
+            y = core + rnd(random.randint(0, 20), alphabet)
+            limit = random.randint(1, 10)
+            assert terminal_overlap(x, y, limit) == filtered(x, y, limit)
+            assert terminal_overlap(y, x, limit) == filtered(y, x, limit)
+            assert terminal_overlap(x, x, limit) == filtered(x, x, limit)
+
 if __name__ == '__main__':
     pytest.main([__file__, "-v", "-s","--cov=pydna","--cov-report=html"])
\ No newline at end of file
@@ -249,5 +249,78 @@ def test_circular_assembly_fragments2():
     assert str(result.seq) == "ccaaggacacaatcgagctccgatccgtactgtcgagaaacttgtatccctctaactagtatggatagccgtgtcttcactgtgctgcggctacccatcgtagtgaaacatacacgttgctcgggttcaccccggtccgttctgagtcga"
 
 
+def test_primer_design_prefix_tm(monkeypatch):
+    import random
+    from pydna import design
+    from pydna.dseqrecord import Dseqrecord
+    from pydna.tm import tmbresluc, tmstaluc98, basictm
+
+    random.seed(22)
+    templates = [Dseqrecord("".join(random.choice("ACGTacgt") for i in range(random.randint(80, 200)))) for j in range(10)]
+    cases = [(t, f, target) for t in templates for f in (tmbresluc, tmstaluc98, basictm) for target in (50.0, 62.0)]
+
+    fast = [design.primer_design(t, target_tm=target, formula=f) for t, f, target in cases]
+    monkeypatch.setattr(design, "_np", None)
+    slow = [design.primer_design(t, target_tm=target, formula=f) for t, f, target in cases]
+    assert [(str(a.forward_primer.seq), str(a.reverse_primer.seq)) for a in fast] == \
+           [(str(a.forward_primer.seq), str(a.reverse_primer.seq)) for a in slow]
+
+    with pytest.raises(ValueError):
+        design.primer_design(Dseqrecord("atatatatatatatatatatatatatat"), target_tm=70.0)
+    with pytest.raises(ValueError):
+        design.primer_design(Dseqrecord("atatatatatat"), target_tm=70.0)
+
+    monkeypatch.undo()
+    with pytest.raises(ValueError):
+        design.primer_design(Dseqrecord("atatatatatatatatatatatatatat"), target_tm=70.0)
+
+
+def test_design_many():
+    import random
+    from concurrent.futures import ThreadPoolExecutor
+    from pydna.design import design_many
+    from pydna.dseqrecord import Dseqrecord
+    from pydna.amplify import Anneal
+    from pydna.utils import rc
+
+    random.seed(23)
+    genome = "".join(random.choice("ACGT") for i in range(20000))
+    starts = [random.randrange(len(genome)-600) for i in range(12)]
+    templates = [Dseqrecord(genome[s:s+random.randint(100, 600)], name="orf{}".format(i)) for i, s in enumerate(starts)]
+    repeat = "ATGCGTACGTTAGCATCGA"
+    templates.append(Dseqrecord(repeat + genome[:300] + repeat + genome[400:500], name="repeat"))
+    templates.append(Dseqrecord("ACGT", name="short"))
+
+    constraints = {"target_tm": 58.0, "background": Dseqrecord(genome)}
+    results = list(design_many(templates, constraints))
+    assert [d["name"] for a, d in results] == [t.name for t in templates]
+
+    for (amplicon, diagnostics), template in zip(results[:-1], templates):
+        fp, rp = str(amplicon.forward_primer.seq), str(amplicon.reverse_primer.seq)
+        assert str(amplicon.seq) == str(template.seq)
+        assert diagnostics["products"] == len(Anneal((fp, rp), template).products) == 1
+        assert diagnostics["passed"] and not diagnostics["failed"]
+        assert 14 <= len(fp) <= 40 and 14 <= len(rp) <= 40
+        assert fp[-1] in "GCgc" or fp[-2] in "GCgc"
+        assert diagnostics["self_complementarity"][0] <= 4
+
+    amplicon, diagnostics = results[-2]
+    assert len(amplicon.forward_primer) > len(repeat)
+    assert diagnostics["background_sites"][0] == 0
+
+    assert results[-1][0] is None and "error" in results[-1][1]
+
+    with ThreadPoolExecutor(2) as pool:
+        parallel = list(design_many(templates, constraints, executor=pool))
+    assert [(str(a.forward_primer.seq), str(a.reverse_primer.seq)) for a, d in parallel[:-1]] == \
+           [(str(a.forward_primer.seq), str(a.reverse_primer.seq)) for a, d in results[:-1]]
+
+    # the constraints are checked when design_many is called
+    with pytest.raises(ValueError):
+        design_many(templates, {"gc": 1})
+    with pytest.raises(ValueError):
+        design_many(templates, {"min_length": 10})
+
+
 if __name__ == '__main__':
     pytest.cmdline.main([__file__, "-v", "-s"])                        
\ No newline at end of file
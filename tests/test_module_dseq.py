@@ -632,5 +632,73 @@ def test_misc():
 
     assert z.shifted(15) == x
 
+def test_frombuffer():
+    import copy
+    import pickle
+    import random
+    from pydna.dseq import Dseq
+    from pydna.utils import rc
+    from pydna.dseqrecord import Dseqrecord
+
+    random.seed(13)
+    for trial in range(300):
+        s = "".join(random.choice("GATCgatcN") for i in range(random.randint(1, 30)))
+        a = Dseq(s)
+        b = Dseq.frombuffer(s.encode())
+        assert b == a and len(b) == len(a) and str(b) == str(a)
+        for k in range(10):
+            sl = slice(random.randint(-35, 35), random.randint(-35, 35))
+            assert b[sl] == a[sl]
+            assert b[sl][1:-1] == a[sl][1:-1]
+            assert b[sl].rc() == a[sl].rc()
+        if len(s) > 5:
+            c = Dseq(s[2:], rc(s[:-3]), ovhg=2)
+            d = Dseq._fromview(memoryview(s.encode()), (2, len(s)), (0, len(s)-3), False)
+            assert d == c and len(d) == len(c)
+            for k in range(10):
+                sl = slice(random.randint(-35, 35), random.randint(-35, 35))
+                assert d[sl] == c[sl]
+                assert d[sl].rc() == c[sl].rc()
+        a, b = Dseq(s, circular=True), Dseq.frombuffer(s, circular=True)
+        assert b == a
+        for k in range(10):
+            sl = slice(random.randint(0, len(s)), random.randint(0, len(s)))
+            assert b[sl] == a[sl]
+        assert pickle.loads(pickle.dumps(b)) == copy.deepcopy(b) == copy.copy(b) == a
+
+    buffer = bytearray(b"ggatccAAAgaattc")
+    b = Dseq.frombuffer(buffer)[6:9]
+    assert b._buffer.obj is buffer
+    assert b.watson == "AAA"
+    assert pickle.loads(pickle.dumps(b))._buffer.tobytes() == b"AAA"
+    r = Dseqrecord(Dseq.frombuffer(buffer))[6:9]
+    assert r.seq._buffer.obj is buffer
+    assert r.seq.watson == "AAA"
+
+def test_lazy_crick():
+    import copy
+    import pickle
+    from pydna.dseq import Dseq
+
+    a = Dseq("ggatccAAAg")
+    assert a._crick is None
+    assert a[2:5]._crick is None
+    assert a[2:5] == Dseq("atc", "gat", 0)
+    assert a.crick == "cTTTggatcc"
+    assert a._crick == "cTTTggatcc"
+
+    b = Dseq("ggatccAAAg", circular=True)
+    assert b.rc() is not b.rc()
+    assert b.rc() == Dseq("cTTTggatcc", circular=True)
+    assert b.rc().rc() == b
+    assert copy.copy(b) == b
+    assert pickle.loads(pickle.dumps(b)) == b
+    c = b[:]
+    assert c.linear and c.rc().linear
+
+    assert not hasattr(a, "__dict__") or "_watson" not in a.__dict__
+    with pytest.raises(AttributeError):
+        a.watson = "aaa"
+
 if __name__ == '__main__':
     pytest.main([__file__, "-vv", "-s", "--cov=pydna","--cov-report=html"])
\ No newline at end of file
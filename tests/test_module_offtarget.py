@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import pytest
+
+pytest.importorskip("numpy")
+
+
+def _brute(records, primer, seed, mismatches):
+    from pydna.utils import rc
+    seed = primer[-seed:].upper()
+    sites = []
+    for r in records:
+        t = str(r.seq).upper()
+        tt = t + t[:len(seed)-1] if r.circular else t
+        for pos in range(len(t) if r.circular else len(t)-len(seed)+1):
+            window = tt[pos:pos+len(seed)]
+            for strand, s in ((1, seed), (-1, rc(seed))):
+                d = sum(a != b for a, b in zip(window, s))
+                if d <= mismatches:
+                    sites.append((r.name, pos, strand, d))
+    return sorted(sites, key=lambda s: (s[0], s[1], s[2]))
+
+
+def test_sites():
+    import random
+    from pydna.offtarget import OfftargetIndex
+    from pydna.dseqrecord import Dseqrecord
+    from pydna.utils import rc
+
+    random.seed(3)
+    records = [Dseqrecord("".join(random.choice("ACGT") for i in range(n)), name="c{}".format(j), circular=j == 1)
+               for j, n in enumerate((1500, 800, 40))]
+    primers = ["".join(random.choice("ACGT") for i in range(20)) for j in range(20)]
+    primers += [str(records[0].seq)[100:120],
+                str(records[1].seq)[-4:] + str(records[1].seq)[:12],
+                rc(str(records[2].seq)[10:30]).lower()]
+
+    index = OfftargetIndex(records, seed=8)
+    assert len(index) == 2340
+    for mismatches in (0, 1, 2):
+        sites = index.sites(primers, mismatches)
+        counts = index.counts(primers, mismatches)
+        for primer, found, count in zip(primers, sites, counts):
+            expected = _brute(records, primer, 8, mismatches)
+            assert [tuple(s) for s in found] == expected
+            assert count.tolist() == [sum(1 for s in expected if s[3] == m) for m in range(mismatches+1)]
+
+    assert index.sites(["acgt"]) == [[]]
+    assert index.sites([]) == []
+    with pytest.raises(ValueError):
+        OfftargetIndex(records, seed=33)
+
+
+def test_screen_and_rank(tmpdir):
+    import os
+    import pickle
+    import numpy as np
+    from pydna.offtarget import OfftargetIndex
+    from pydna.dseqrecord import Dseqrecord
+
+    genome = Dseqrecord("ttgacctgatcgatcaagggtattttaatcgatcatgacggtcaatagg", name="chrI")
+    primers = ["aaaactgatcgatcaa", "gggggggggggg", "aaaacgatcaagggta"]
+    index = OfftargetIndex(genome, seed=10)
+    assert index.counts(primers, 1).tolist() == [[1, 2], [0, 0], [1, 0]]
+    assert index.screen(primers) == [False, True, True]
+    assert index.screen(primers, mismatches=0) == [True, True, True]
+    assert index.screen(primers, max_sites=0) == [False, True, False]
+    assert index.rank(primers) == ["gggggggggggg", "aaaacgatcaagggta", "aaaactgatcgatcaa"]
+
+    stored = OfftargetIndex(genome, seed=10, directory=str(tmpdir))
+    assert sorted(os.listdir(str(tmpdir))) == sorted("{}.{}.npy".format(stored.key, s) for s in ("codes", "positions"))
+    again = OfftargetIndex(genome, seed=10, directory=str(tmpdir))
+    assert isinstance(again.codes, np.memmap)
+    assert again.sites(primers, 1) == index.sites(primers, 1)
+
+    copy = pickle.loads(pickle.dumps(again))
+    assert isinstance(copy.positions, np.memmap)
+    assert copy.sites(primers, 1) == index.sites(primers, 1)
+    assert pickle.loads(pickle.dumps(index)).sites(primers, 1) == index.sites(primers, 1)
+
+
+def test_design_many_background():
+    import random
+    from pydna.offtarget import OfftargetIndex
+    from pydna.design import design_many
+    from pydna.dseqrecord import Dseqrecord
+
+    random.seed(5)
+    template = Dseqrecord("".join(random.choice("ACGT") for i in range(300)), name="orf")
+    genome = Dseqrecord("".join(random.choice("ACGT") for i in range(5000)) + str(template.seq[:60]), name="chr")
+    index = OfftargetIndex(genome)
+
+    amplicon, diagnostics = next(design_many([template], {"background": index, "background_mismatches": 0}))
+    assert diagnostics["background_sites"][0] <= 1
+    assert "background" not in diagnostics["failed"]
+    amplicon, diagnostics = next(design_many([template], {"background": index, "max_background_sites": 0}))
+    assert diagnostics["background_sites"][0] >= 1
+    assert "background" in diagnostics["failed"]
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, "-v", "-s"])
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+
+def test_roundtrip():
+
+    import random
+    from pydna.dseq import Dseq
+    from pydna.packed import dumps, loads, _encode, _decode
+
+    random.seed(19)
+
+    for alphabet in ("ACGT", "acgtACGT", "ACGTRYSWKMBDHVN", "ACGTUX"):
+        for length in (0, 1, 3, 4, 5, 63):
+            s = "".join(random.choice(alphabet) for i in range(length))
+            encoding, packed, runs = _encode(s)
+            assert _decode(encoding, packed, runs, 0, len(s)) == s
+            assert _decode(encoding, packed, runs, 1, len(s)-1) == s[1:-1]
+
+    for watson, crick, ovhg in (("GATCaaa", "tttGA", -2), ("aaa", "ttttt", 1), ("A", "", 0)):
+        for circular in (False, True):
+            if circular and ovhg:
+                continue
+            dseq = Dseq(watson, crick, ovhg=ovhg, circular=circular)
+            result = loads(dumps(dseq))
+            assert str(result.watson) == str(dseq.watson)
+            assert str(result.crick) == str(dseq.crick)
+            assert result.ovhg == dseq.ovhg
+            assert result.circular == dseq.circular
+
+def test_records():
+
+    import copy
+    import pickle
+    from pydna.readers import read
+    from pydna.amplify import pcr
+    from pydna.packed import dumps, loads
+
+    record = read("pAG25.gb")
+    result = loads(dumps(record))
+    assert str(result.seq) == str(record.seq)
+    assert result.circular
+    assert [str(f.location) for f in result.features] == [str(f.location) for f in record.features]
+    assert [f.qualifiers for f in result.features] == [f.qualifiers for f in record.features]
+    assert result.annotations == record.annotations
+    assert result.name == record.name
+
+    assert len(pickle.dumps(record)) < len(str(record.seq))
+    for other in (pickle.loads(pickle.dumps(record)), copy.deepcopy(record), copy.copy(record)):
+        assert str(other.seq) == str(record.seq)
+        assert other.features[0].qualifiers == record.features[0].qualifiers
+
+    template = read("pUC19.gb")
+    amplicon = pcr("GTAAAACGACGGCCAGT", "GCGGATAACAATTTCACACAGG", template)
+    result = loads(dumps(amplicon))
+    assert type(result) is type(amplicon)
+    assert str(result.seq) == str(amplicon.seq)
+    assert str(result.template.seq) == str(template.seq)
+    assert str(result.forward_primer.seq) == str(amplicon.forward_primer.seq)
+
+def test_packedfile(tmpdir):
+
+    from pydna.dseqrecord import Dseqrecord
+    from pydna.packed import dump, load, PackedFile
+
+    records = [Dseqrecord("ACGT"*i, circular=bool(i % 2)) for i in range(1, 6)]
+    path = str(tmpdir.join("records.pdn"))
+    with open(path, "wb") as f:
+        dump(records, f)
+
+    with open(path, "rb") as f:
+        assert [str(r.seq) for r in load(f)] == [str(r.seq) for r in records]
+
+    with PackedFile(path) as packed:
+        assert len(packed) == 5
+        assert str(packed[3].seq) == "ACGT"*4
+        assert packed[0].circular and not packed[1].circular
+        assert [str(r.seq) for r in packed[-2:]] == ["ACGT"*4, "ACGT"*5]
+        assert len(list(packed)) == 5
+
+if __name__ == '__main__':
+    pytest.cmdline.main([__file__, "-v", "-s"])
@@ -197,5 +197,79 @@ def test_misc_parse():
     assert "".join(a.format("gb").splitlines()[1:]) == "".join(x.format("gb").splitlines()[1:])
     assert "".join(b.format("gb").strip().splitlines()[4:]) == "".join(y.format("gb").splitlines()[4:])
 
+def test_iter_parse():
+    import io
+    import types
+    from pydna.parsers import parse, iter_parse
+    from pydna.genbankfile import GenbankFile
+    from pydna.seqfeature import SeqFeature
+
+    records = iter_parse("pth1.txt")
+    assert isinstance(records, types.GeneratorType)
+    x, y = records
+    assert isinstance(x, GenbankFile)
+    assert all(isinstance(f, SeqFeature) for f in x.features)
+    assert [r.format("gb") for r in (x, y)] == [r.format("gb") for r in parse("pth1.txt")]
+
+    with open("pUC19.gb", "r", encoding="utf-8") as f:
+        text = f.read()
+    mixed = ">a\nAAAA\nCCCC\nsome text\n\n" + text + "\n>empty\n>b circular\nGGG\n" + text
+
+    with io.StringIO(mixed) as handle:
+        records = list(iter_parse(handle))
+    assert [str(r.seq) for r in records] == [str(r.seq) for r in parse(mixed)]
+    assert [r.name for r in records] == ["a", "SYNPUC19CV", "b", "SYNPUC19CV"]
+    assert [r.circular for r in records] == [False, True, True, True]
+    assert str(records[0].seq) == "AAAACCCCsometext"
+
+    from Bio.SeqRecord import SeqRecord
+    from pydna.dseqrecord import Dseqrecord
+    single = list(iter_parse(mixed, ds=False))
+    assert all(isinstance(r, SeqRecord) and not isinstance(r, Dseqrecord) for r in single)
+    assert [str(r.seq) for r in single] == [str(r.seq) for r in records]
+
+def test_parse_many(monkeypatch, tmpdir):
+    import os
+    import shutil
+    import pydna
+    from concurrent.futures import ThreadPoolExecutor
+    from pydna.parsers import parse, parse_many
+    from pydna.genbankfile import GenbankFile
+
+    monkeypatch.setenv("pydna_data_dir", str(tmpdir))
+    monkeypatch.setenv("pydna_cached_funcs", "pydna.parsers.parse_many")
+
+    paths = []
+    for name in ("pUC19.gb", "pth1.txt", "RefDataBjorn.fas"):
+        paths.append(str(tmpdir.join(name)))
+        shutil.copy(name, paths[-1])
+
+    expected = [r.format("gb") for r in parse(paths)]
+
+    first = parse_many(paths)
+    assert [r.format("gb") for r in first] == expected
+    info = pydna.cache_info()["pydna.parsers.parse_many"]
+    assert (info.hits, info.misses, info.entries) == (0, 3, 3)
+
+    monkeypatch.chdir(str(tmpdir))
+    second = parse_many(["pUC19.gb"] + paths[1:])
+    assert [r.format("gb") for r in second] == expected
+    assert isinstance(second[0], GenbankFile) and second[0].path == "pUC19.gb"
+    info = pydna.cache_info()["pydna.parsers.parse_many"]
+    assert (info.hits, info.misses) == (3, 3)
+
+    with open(paths[0], "a", encoding="utf-8") as f:
+        f.write("\n")
+    with ThreadPoolExecutor(2) as pool:
+        third = parse_many(paths, executor=pool)
+    assert [r.format("gb") for r in third] == expected
+    info = pydna.cache_info()["pydna.parsers.parse_many"]
+    assert (info.hits, info.misses) == (5, 4)
+
+    monkeypatch.setenv("pydna_cached_funcs", "")
+    assert [r.format("gb") for r in parse_many(paths, n_jobs=2)] == expected
+    assert [str(r.seq) for r in parse_many(paths[:1], ds=False)] == [str(first[0].seq)]
+    pydna.cache_clear("pydna.parsers.parse_many")
+
 if __name__ == '__main__':
     pytest.main([__file__, "-v", "-s", "--cov=pydna","--cov-report=html"])
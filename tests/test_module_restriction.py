@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+
+def test_search():
+
+    import random
+    from Bio.Seq import Seq
+    from Bio.Restriction import CommOnly, FormattedSeq
+    from pydna.restriction import search, scan_cache_clear
+
+    random.seed(15)
+
+    for length in (20, 250, 1200):
+        for alphabet in ("ACGT", "acgtN", "ACGTRYN"):
+            s = "".join(random.choice(alphabet) for i in range(length))
+            for linear in (True, False):
+                scan_cache_clear()
+                result = search(s, CommOnly, linear=linear)
+                fs = FormattedSeq(Seq(s), linear=linear)
+                for enzyme in CommOnly:
+                    assert result[enzyme] == enzyme.search(fs), (enzyme, s, linear)
+
+def test_scan_cache():
+
+    from pydna.restriction import scan, search, scan_cache_clear, _scans
+    from Bio.Restriction import BamHI, EcoRI, BsaI
+
+    scan_cache_clear()
+    assert scan("GGATCCaaGAATTC", [BamHI]) == {BamHI: ([1],)}
+    assert len(_scans) == 1
+    assert search("ggatccaagaattc", [BamHI, EcoRI, BsaI]) == {BamHI: [2], EcoRI: [10], BsaI: []}
+    assert len(_scans) == 1
+    assert search("ggatccaagaattc", [BamHI], linear=False) == {BamHI: [2]}
+    assert len(_scans) == 2
+    scan_cache_clear()
+    assert len(_scans) == 0
+
+def test_circular_origin():
+
+    from pydna.restriction import search
+    from pydna.dseq import Dseq
+    from Bio.Restriction import EcoRI
+
+    assert search("ATTCaaaaGA", [EcoRI]) == {EcoRI: []}
+    assert search("ATTCaaaaGA", [EcoRI], linear=False) == {EcoRI: [10]}
+    assert [len(f) for f in Dseq("ATTCaaaaGA", circular=True).cut(EcoRI)] == [14]
+
+def test_cut_batch():
+
+    import random
+    import time
+    from Bio.Seq import Seq
+    from Bio.Restriction import CommOnly
+    from pydna.dseq import Dseq
+
+    def reference(seq, enzymes):
+        # the fragments cut one at a time with the Biopython search, for linear seq
+        frags = [seq]
+        for enz in enzymes:
+            newfrags = []
+            for frag in frags:
+                ws = [x-1 for x in enz.search(Seq(frag.watson)+"N")]
+                cs = [x-1 for x in enz.search(Seq(frag.crick)+"N")]
+                pairs = [(sw, sc) for sw in ws for sc in cs[::-1]
+                         if sw + max(0, frag.ovhg) - max(0, enz.ovhg) ==
+                         len(frag.crick) - sc - min(0, frag.ovhg) + min(0, enz.ovhg)]
+                pairs.append((seq.length, 0))
+                w2, c1 = pairs[0]
+                newfrags.append(Dseq(frag.watson[:w2], frag.crick[c1:], ovhg=frag.ovhg, pos=frag.pos))
+                for (w1, c2), (w2, c1) in zip(pairs[:-1], pairs[1:]):
+                    newfrags.append(Dseq(frag.watson[w1:w2], frag.crick[c1:c2], ovhg=enz.ovhg, pos=frag.pos+w1-max(0, enz.ovhg)))
+            frags = newfrags
+        return [(f.watson, f.crick, f.ovhg, f.pos) for f in frags]
+
+    random.seed(25)
+    enzymes = sorted(CommOnly, key=str)
+    for length in (40, 300):
+        seq = Dseq("".join(random.choice("ACGT") for i in range(length)))
+        batch = random.sample(enzymes, 60)
+        assert [(f.watson, f.crick, f.ovhg, f.pos) for f in seq.cut(batch)] == reference(seq, batch)
+
+    # each strand is scanned once for the whole batch, the fragments are not
+    # scanned again
+    seq = Dseq("".join(random.choice("ACGT") for i in range(3000)), circular=True)
+    start = time.time()
+    frags = seq.cut(CommOnly)
+    assert time.time() - start < 10
+    assert sum(len(f.watson) for f in frags) == 3000
+
+def test_restriction_map():
+
+    import pickle
+    import random
+    import pydna
+    from concurrent.futures import ThreadPoolExecutor
+    from Bio.Restriction import CommOnly, BamHI, EcoRI
+    from pydna.dseqrecord import Dseqrecord
+    from pydna.restriction import RestrictionMap, restriction_map
+
+    random.seed(16)
+
+    records = [Dseqrecord("".join(random.choice("ACGT") for i in range(random.randint(10, 3000))),
+                          circular=bool(i % 2), name="seq{}".format(i)) for i in range(12)]
+
+    rmap = pydna.restriction_map(records, CommOnly)
+
+    assert rmap.names == [r.name for r in records]
+    assert rmap.enzymes == sorted(str(e) for e in CommOnly)
+    assert len(rmap.sequence) == len(rmap.enzyme) == len(rmap.position) == len(rmap)
+
+    counts = rmap.counts()
+    for i, record in enumerate(records):
+        result = CommOnly.search(record.seq, linear=record.linear)
+        for j, name in enumerate(rmap.enzymes):
+            enzyme = CommOnly.get(name)
+            assert rmap.positions(i, j) == rmap.positions(record.name, enzyme) == sorted(result[enzyme])
+            assert counts[i, j] == len(result[enzyme])
+
+    with ThreadPoolExecutor(2) as pool:
+        assert restriction_map(records, CommOnly, executor=pool) == rmap
+    assert restriction_map(records, CommOnly, n_jobs=2) == rmap
+
+    assert RestrictionMap.loads(rmap.dumps()) == rmap
+    assert pickle.loads(pickle.dumps(rmap)) == rmap
+    assert rmap.diff(rmap) == []
+
+    table = rmap.to_dict()
+    assert set(table) == {"sequence", "seguid", "enzyme", "position"}
+    assert len(table["position"]) == len(rmap)
+
+    old = restriction_map([Dseqrecord("GGATCCaaaGAATTC", name="a")], [BamHI, EcoRI])
+    new = restriction_map([Dseqrecord("GGATCCaaaGAATTT", name="a"), Dseqrecord("GGATCC", name="b")], [BamHI, EcoRI])
+    assert old.diff(new) == [("a", "EcoRI", [11], []),
+                             ("b", "BamHI", None, [2]),
+                             ("b", "EcoRI", None, [])]
+
+if __name__ == '__main__':
+    pytest.main([__file__, "-vv", "-s", "--cov=pydna","--cov-report=html"])
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+
+def test_regions(tmpdir):
+
+    import random
+    from Bio.SeqFeature import FeatureLocation, CompoundLocation
+    from pydna.dseqrecord import Dseqrecord
+    from pydna.seqfeature import SeqFeature
+    from pydna.sequencestore import SequenceStore
+
+    random.seed(20)
+
+    length = 60000
+    record = Dseqrecord("".join(random.choice("ACGTacgt") for i in range(length)), id="NC_000000.1")
+    record.features.append(SeqFeature(FeatureLocation(0, length, 1), type="source"))
+    for i in range(300):
+        start = random.randrange(length-50)
+        end = min(length, start+random.choice((10, 500, 20000, 50000)))
+        location = FeatureLocation(start, end, random.choice((1, -1)))
+        if i % 10 == 0 and end - start > 20:
+            location = CompoundLocation([FeatureLocation(start, start+5, 1), FeatureLocation(end-5, end, 1)])
+        record.features.append(SeqFeature(location, type="misc_feature", qualifiers={"label": ["f{}".format(i)]}))
+
+    store = SequenceStore(str(tmpdir))
+    stored = store.add(record)
+    assert len(stored) == length
+    assert "NC_000000.1" in store
+    assert list(store) == ["NC_000000.1"]
+
+    for i in range(40):
+        start = random.randrange(length)
+        stop = min(length, start + random.choice((0, 1, 100, 5000, 40000)))
+        region = stored[start:stop]
+        assert str(region.seq) == str(record.seq)[start:stop]
+        assert region.id == "NC_000000.1:{}-{}".format(start+1, stop)
+        expected = [f for f in record.features
+                    if stop > start and any(p.start < stop and p.end > start for p in f.location.parts)]
+        assert [f.qualifiers for f in region.features] == [f.qualifiers for f in expected]
+        for f, e in zip(region.features, expected):
+            for p, q in zip(f.location.parts, [q for q in e.location.parts if q.start < stop and q.end > start]):
+                assert int(p.start) == max(q.start, start) - start
+                assert int(p.end) == min(q.end, stop) - start
+                assert p.strand == q.strand
+
+    assert str(stored[-10:].seq) == str(record.seq)[-10:]
+    assert stored.record().features[5].qualifiers == record.features[5].qualifiers
+    store.close()
+
+    store = SequenceStore(str(tmpdir))
+    assert str(store["NC_000000.1"][10:20].seq) == str(record.seq)[10:20]
+    del store["NC_000000.1"]
+    assert len(store) == 0
+    with pytest.raises(KeyError):
+        store["NC_000000.1"]
+
+def test_circular(tmpdir):
+
+    from pydna.readers import read
+    from pydna.sequencestore import SequenceStore
+
+    record = read("pAG25.gb")
+    with SequenceStore(str(tmpdir)) as store:
+        stored = store.add(record, "pAG25")
+        assert stored.circular
+        region = stored[len(record)-100:100]
+        assert str(region.seq) == str(record.seq)[-100:] + str(record.seq)[:100]
+        inside = stored[100:1000]
+        assert [f.qualifiers for f in inside.features if "<" not in str(f.location) and ">" not in str(f.location)] == \
+               [f.qualifiers for f in record[100:1000].features]
+
+if __name__ == '__main__':
+    pytest.cmdline.main([__file__, "-v", "-s"])
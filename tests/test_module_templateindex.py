@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import pytest
+
+pytest.importorskip("numpy")
+
+
+def test_templateindex(tmpdir):
+    import os
+    import pickle
+    import numpy as np
+    from pydna.templateindex import TemplateIndex
+    from pydna.dseqrecord import Dseqrecord
+    from pydna.amplify import Anneal, pcr, annealing_sites
+    from pydna.primer import Primer
+
+    t = Dseqrecord("tacactcaccgtctatcattatctactatcgactgtatcatctgatagcac", circular=True)
+    primers = [Primer("tacactcaccgtctatcattatc"),
+               Primer("gtgctatcagatgatacagtcg"),
+               Primer("atcattatctactatcgactg"),
+               Primer("tcgatagtagataatgatagac")]
+
+    index = TemplateIndex(t)
+    assert index.sites(primers) == annealing_sites(primers, t)
+    assert [p.position for p in Anneal(primers, index).forward_primers] == [p.position for p in Anneal(primers, t).forward_primers]
+    assert pcr(primers[:2], index) == pcr(primers[:2], t)
+
+    with pytest.raises(ValueError):
+        Anneal(primers, index, limit=14)
+    with pytest.raises(ValueError):
+        TemplateIndex(t, limit=33)
+
+    stored = TemplateIndex(t, directory=str(tmpdir))
+    assert sorted(os.listdir(str(tmpdir))) == sorted("{}.{}.npy".format(stored.key, s) for s in ("watson", "crick"))
+    assert isinstance(stored.watson_index[0], np.memmap)
+    assert stored.sites(primers) == index.sites(primers)
+
+    again = TemplateIndex(t, directory=str(tmpdir))
+    assert isinstance(again.crick_index[1], np.memmap)
+    assert again.sites(primers) == index.sites(primers)
+
+    data = pickle.dumps(stored)
+    assert len(data) < len(pickle.dumps(index))
+    assert pickle.loads(data).sites(primers) == index.sites(primers)
+
+    assert TemplateIndex(t.reverse_complement()).key != index.key
+    assert TemplateIndex(t.shifted(3)).key != index.key
+    assert TemplateIndex(t[:]).key != index.key
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, "-vv", "-s"])
@@ -23,5 +23,50 @@ def test_tms():
     with pytest.raises(NotImplementedError):
         tm.Q5()
     
+def test_tm_many():
+    import random
+    from pydna import tm
+
+    random.seed(21)
+    primers = ["".join(random.choice(random.choice(["ACGT", "acgt", "ACGTRYN"])) for i in range(random.randint(1, 45))) for j in range(500)]
+
+    assert tm.tm_many(primers).tolist() == [tm.tmbresluc(p) for p in primers]
+    result = tm.tm_many(primers, primerc=200, saltc=80, thermodynamics=True)
+    expected = [tm.tmbresluc(p, primerc=200, saltc=80, thermodynamics=True) for p in primers]
+    assert [r.tolist() for r in result] == [list(x) for x in zip(*expected)]
+
+    acgt = [p for p in primers if set(p.upper()) <= set("ACGT")]
+    assert tm.tm_many(acgt, tm.tmstaluc98, dnac=40, saltc=70).tolist() == [tm.tmstaluc98(p, dnac=40, saltc=70) for p in acgt]
+    assert tm.tm_many(acgt, tm.basictm).tolist() == [tm.basictm(p) for p in acgt]
+
+    # positional arguments are ignored like by the formulas
+    assert tm.tm_many(acgt, tm.tmbresluc, 100, 7).tolist() == [tm.tmbresluc(p, 100, 7) for p in acgt]
+    assert tm.tm_many(acgt, tm.tmstaluc98, 100, 7).tolist() == [tm.tmstaluc98(p, 100, 7) for p in acgt]
+
+    assert tm.tm_many([]).tolist() == []
+    assert tm.tm_many([], tm.tmstaluc98).tolist() == []
+
+    for primer in primers[:50]:
+        for formula in (tm.tmbresluc, tm.tmstaluc98):
+            expected = []
+            for n in range(1, len(primer)+1):
+                try:
+                    expected.append(formula(primer[:n].upper()))
+                except KeyError:
+                    expected.append("nan")
+            result = ["nan" if x != x else x for x in tm.tm_prefixes(primer, formula).tolist()]
+            assert result == expected
+
+    with pytest.raises(ValueError):
+        tm.tm_many(["ACGTN"], tm.tmstaluc98)
+    with pytest.raises(ValueError):
+        tm.tm_many(["ACGT-"])
+
+def test_tm_prefixes_needs_numpy(monkeypatch):
+    from pydna import tm
+    monkeypatch.setattr(tm, "_np", None)
+    with pytest.raises(ImportError):
+        tm.tm_prefixes("ACGTACGTACGT")
+
 if __name__ == '__main__':
     pytest.main([__file__, "-vv", "-s", "--cov=pydna","--cov-report=html"])
\ No newline at end of file
@@ -162,9 +162,45 @@ def test_cseguid():
     assert cseguid(x) == cseguid(x.upper()) == cseguid(x.lower()) == 'JgiKgBksd2v3q99NStKLepoQCm8'
     from Bio.SeqUtils.CheckSum  import seguid as base64_seguid
 
+def test_seguid_many():
+    import random
+    from pydna.utils import seguid, lseguid, cseguid, seguid_many, lseguid_many, cseguid_many
+    from pydna.dseqrecord import Dseqrecord
+    random.seed(12)
+    seqs = ["".join(random.choice("ACGTacgtN") for i in range(random.randint(1, 60))) for i in range(300)]
+    seqs += seqs[:10] + ["acgu", "UUUaaa"]
+    assert list(seguid_many(seqs, chunksize=7)) == [seguid(s) for s in seqs]
+    assert list(lseguid_many(seqs, n_jobs=3, chunksize=5)) == [lseguid(s) for s in seqs]
+    assert list(cseguid_many(iter(seqs), chunksize=16)) == [cseguid(s) for s in seqs]
+    assert list(seguid_many([])) == []
+
+    records = [Dseqrecord(s) for s in ("aaacccggt", "cggtaaacc", "ggtacc")]
+    unique = cseguid_many(records, as_dict=True, chunksize=1)
+    assert list(unique.keys()) == [cseguid("aaacccggt"), cseguid("ggtacc")]
+    assert list(unique.values()) == [records[0], records[2]]
+
 def test_smallest_rotation():
     from pydna.utils import SmallestRotation as sr
     assert sr("tttaaa") == "aaattt"
+    assert sr("") == ""
+    assert sr("a") == "a"
+    assert sr("aaaa") == "aaaa"
+    assert sr(b"tttaaa") == b"aaattt"
+
+    import random
+    random.seed(11)
+    for trial in range(3000):
+        alphabet = random.choice(["AB", "ABC", "ACGT", "AAB", "a.*]"])
+        if random.random() < 0.3:
+            unit = "".join(random.choice(alphabet) for i in range(random.randint(1, 5)))
+            s = unit*random.randint(1, 8) + "".join(random.choice(alphabet) for i in range(random.randint(0, 3)))
+        else:
+            s = "".join(random.choice(alphabet) for i in range(random.randint(1, 40)))
+        if random.random() < 0.1:
+            s = "T"*100 + s
+        expected = min(s[i:]+s[:i] for i in range(len(s)))
+        assert sr(s) == expected
+        assert sr(s.encode()) == expected.encode()
 
 
 def test_memorize(monkeypatch):
@@ -202,7 +238,9 @@ def test_memorize(monkeypatch):
     mockshelve_open.return_value = cache
 
     monkeypatch.setenv("pydna_cached_funcs", "mf")     
-    monkeypatch.setattr("pydna.utils._shelve.open", mockshelve_open)
+    monkeypatch.setenv("pydna_cache_backend", "shelve")
+    monkeypatch.setenv("pydna_cache_memory_entries", "0")
+    monkeypatch.setattr("pydna.cache._shelve.open", mockshelve_open)
     
     monkeypatch.setenv("pydna_cached_funcs", "mf")
     